@@ -0,0 +1,109 @@
+import sys
+import os
+
+# Add the lib directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'lib')))
+
+import re
+import random
+from time import perf_counter
+from typer import Typer, Option
+
+from ingest.classifier import DescriptionClassifier
+
+app = Typer()
+
+INTEREST_DESCRIPTIONS = [
+   'FREE BALANCE INTEREST ADJUSTMENT~NO DESCRIPTION',
+   'OFF-CYCLE INTEREST~MMDA1',
+   'MARGIN INTEREST ADJUSTMENT~NO DESCRIPTION',
+   'INTEREST INCOME - SECURITIES~{symbol}',
+   'BANK INT {month:02d}/01-{month:02d}/28 SCHWAB BANK',
+   'SCHWAB1 INT {month:02d}/01-{month:02d}/28',
+]
+DIVIDEND_DESCRIPTIONS = [
+   'QUALIFIED DIVIDEND~{symbol}',
+   'ORDINARY DIVIDEND~{symbol}',
+   'FOREIGN TAX WITHHELD~{symbol}',
+   'CASH DIVIDEND~{symbol}',
+   '{name}',
+]
+
+
+def synthetic_corpus(size: int, securities: int, seed: int) -> tuple:
+   """
+   Build size descriptions drawn from interest, dividend and plain security name templates
+   """
+   rng = random.Random(seed)
+   symbols = [''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(rng.randint(1, 5))) for _ in range(securities)]
+   index = {f'{symbol} CORP COMMON STOCK': symbol for symbol in symbols}
+   names = list(index)
+
+   corpus = []
+   for _ in range(size):
+      template = rng.choice(INTEREST_DESCRIPTIONS + DIVIDEND_DESCRIPTIONS)
+      corpus.append(template.format(symbol=rng.choice(symbols), name=rng.choice(names), month=rng.randint(1, 12)))
+   return corpus, index
+
+
+def legacy_classify(description: str, index: dict) -> tuple:
+   """
+   The per item logic load_dividend_or_interest used before the classifier.
+   The securities lookup was a database query, a dict lookup here is a lower bound.
+   """
+   interest_patterns = [
+      r'FREE BALANCE INTEREST ADJUSTMENT~NO DESCRIPTION',
+      r'OFF-CYCLE INTEREST~MMDA1',
+      r'MARGIN INTEREST ADJUSTMENT~NO DESCRIPTION',
+      r'INTEREST INCOME - SECURITIES~.*',
+      r'Free Balance Interest Adjustment',
+      r'Interest Income - Securities',
+      r'BANK INT.*',
+      r'SCHWAB1 INT.*',
+   ]
+   if any(re.match(pattern, description, re.IGNORECASE) for pattern in interest_patterns):
+      transaction = 'INTEREST'
+   else:
+      transaction = 'DIVIDEND'
+   if 'interest' in description.lower() or description.lower().startswith('bank int'):
+      transaction = 'INTEREST'
+   else:
+      transaction = 'DIVIDEND'
+
+   for keyword in ('dividend~', 'foreign tax withheld~'):
+      if keyword in description.lower():
+         parts = description.split('~')
+         if len(parts) > 1:
+            return transaction, parts[1].strip()
+   return transaction, index.get(description)
+
+
+def timed(name: str, corpus: list, classify):
+   start = perf_counter()
+   for description in corpus:
+      classify(description)
+   elapsed = perf_counter() - start
+   print(f'{name:<28} {elapsed:8.3f}s {elapsed / len(corpus) * 1e6:8.2f} us/item')
+
+
+@app.command()
+def main(size: int = Option(200000, help="Number of descriptions to classify"),
+         securities: int = Option(5000, help="Number of securities in the description index"),
+         seed: int = Option(42, help="Random seed for the synthetic corpus")):
+   """
+   Compare per item DIVIDEND_OR_INTEREST classification cost
+   """
+   corpus, index = synthetic_corpus(size, securities, seed)
+   print(f'{size:,} descriptions, {len(set(corpus)):,} distinct, {securities:,} securities')
+
+   timed('legacy per item regexes', corpus, lambda description: legacy_classify(description, index))
+
+   classifier = DescriptionClassifier(lambda: index)
+   timed('classifier, no memo', corpus, lambda description: (classifier.classify_type(description), classifier.lookup_symbol(description)))
+
+   classifier = DescriptionClassifier(lambda: index)
+   timed('classifier, memoized', corpus, classifier.classify)
+
+
+if __name__ == '__main__':
+   app()
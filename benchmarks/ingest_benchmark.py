@@ -0,0 +1,298 @@
+import sys
+import os
+
+# Add the lib and bin directories to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'lib')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bin')))
+
+import json
+import logging
+import platform
+import resource
+import tempfile
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+from typer import Typer, Option
+
+import pandas as pd
+from dotenv import dotenv_values
+from sqlalchemy import text
+
+from ingest.fetch import RateLimiter, DEFAULT_WORKERS
+from ingest.bulk import DEFAULT_CHUNK_SIZE
+from ingest.instrumentation import Timer, percentile
+from orm.backends import is_mysql, get_backend
+from orm.migrations import create_schema
+from orm.models import Broker, User, Account
+from orm.query_plans import report_queries
+from schwab_stub import SyntheticAccount, StubClient
+
+app = Typer()
+
+DEFAULT_DB_NAME = 'optionality_bench'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'ingest.json')
+BENCHMARK_BROKER = 'Benchmark'
+# Metrics compared with the baseline and whether a higher value is better
+COMPARED = {'items_per_s': True, 'p95_ms': False, 'peak_rss_mb': False}
+
+
+def load_theta_burn(db_name: str, cache_dir: str):
+   """
+   Import the CLI module against the scratch database. The module reads the database and
+   cache settings when it is imported, so they are set in the environment first.
+   """
+   os.environ['db_name'] = db_name
+   # With db_backend = sqlite the scratch database is a file in the temporary cache directory
+   os.environ['db_path'] = os.path.join(cache_dir, f'{db_name}.db')
+   os.environ['report_cache_dir'] = cache_dir
+   import theta_burn
+   theta_burn.logger = logging.getLogger('theta_burn')
+   return theta_burn
+
+
+def reset_database(session) -> int:
+   """
+   Drop every table and view of the scratch database and create the schema again
+   """
+   if is_mysql(session):
+      session.execute(text('SET FOREIGN_KEY_CHECKS = 0'))
+      objects = session.execute(text('select table_name, table_type from information_schema.tables '
+                                     'where table_schema = database()')).all()
+   else:
+      session.execute(text('PRAGMA foreign_keys = OFF'))
+      objects = session.execute(text("select name, upper(type) from sqlite_master "
+                                     "where type in ('table', 'view') and name not like 'sqlite_%'")).all()
+   for name, kind in objects:
+      session.execute(text(f"drop {'view' if kind == 'VIEW' else 'table'} if exists `{name}`"))
+   session.execute(text('SET FOREIGN_KEY_CHECKS = 1' if is_mysql(session) else 'PRAGMA foreign_keys = ON'))
+   session.commit()
+   return create_schema(session)
+
+
+def seed_accounts(session, accounts: list):
+   """
+   The broker, user and accounts rows the synthetic account numbers resolve to
+   """
+   broker = Broker(name=BENCHMARK_BROKER)
+   user = User(first_name='Benchmark', last_name='User', email='benchmark@example.com', phone='', address='',
+               city='', state='', zip='', country='')
+   session.add_all([broker, user])
+   session.flush()
+   session.add_all([Account(user_id=user.user_id, broker_id=broker.broker_id, account_number=account.account_number,
+                            name=f'Benchmark {account.index + 1}', type='MARGIN', balance=0) for account in accounts])
+   session.commit()
+
+
+class Stage:
+   """
+   Wall time, per call latency and memory of one benchmarked path
+   """
+   def __init__(self, name: str, trace_memory: bool = False):
+      self.name = name
+      self.trace_memory = trace_memory
+      self.latency = Timer(window=1_000_000)
+      self.items = 0
+      self.seconds = 0.0
+      self.peak_alloc = None
+
+   def timed(self, function):
+      """
+      function wrapped to record the latency of each call
+      """
+      def wrapper(*args, **kwargs):
+         start = perf_counter()
+         try:
+            return function(*args, **kwargs)
+         finally:
+            self.latency.record(perf_counter() - start)
+      return wrapper
+
+   def __enter__(self):
+      if self.trace_memory:
+         tracemalloc.start()
+      self.start = perf_counter()
+      return self
+
+   def __exit__(self, *exc):
+      self.seconds = perf_counter() - self.start
+      if self.trace_memory:
+         self.peak_alloc = tracemalloc.get_traced_memory()[1] / 2 ** 20
+         tracemalloc.stop()
+
+   def result(self) -> dict:
+      latency = self.latency.snapshot()
+      return {'items': self.items,
+              'seconds': self.seconds,
+              'items_per_s': self.items / self.seconds if self.seconds else 0.0,
+              'calls': latency['count'],
+              'p50_ms': latency['p50_ms'],
+              'p95_ms': latency['p95_ms'],
+              'p99_ms': percentile(sorted(self.latency.samples), 0.99) * 1000,
+              'max_ms': latency['max_ms'],
+              # ru_maxrss is in KiB on Linux, the process peak so far rather than this stage alone
+              'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+              'peak_alloc_mb': self.peak_alloc}
+
+
+def count_rows(session, table: str, account_ids: list) -> int:
+   return session.execute(text(f'select count(*) from {table} where account_id in ({",".join(map(str, account_ids))})')).scalar()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> pd.DataFrame:
+   """
+   Each compared metric next to its baseline, a change beyond tolerance in the worse direction is a regression
+   """
+   rows = []
+   for stage, result in results.items():
+      for metric, higher_is_better in COMPARED.items():
+         before = baseline.get('results', {}).get(stage, {}).get(metric)
+         after = result.get(metric)
+         if not before or after is None:
+            continue
+         change = (after - before) / before
+         worse = -change if higher_is_better else change
+         rows.append({'stage': stage, 'metric': metric, 'baseline': before, 'current': after,
+                      'change': f'{change:+.1%}', 'regression': worse > tolerance})
+   return pd.DataFrame(rows)
+
+
+@app.command()
+def main(activities: int = Option(10000, help="Activities per account, 10k to 1M"),
+         orders: int = Option(None, help="Orders per account, half the activities by default"),
+         positions: int = Option(200, help="Positions per account in each positions poll"),
+         polls: int = Option(10, help="Positions polls per account"),
+         accounts: int = Option(2, help="Synthetic accounts"),
+         start_date: str = Option('2023-01-01', help="First trade date of the synthetic activities"),
+         end_date: str = Option('2024-12-31', help="Last trade date of the synthetic activities"),
+         seed: int = Option(42, help="Random seed of the synthetic payloads"),
+         db_name: str = Option(DEFAULT_DB_NAME, help="Scratch MariaDB database on the .env host, dropped and recreated by each run. With db_backend = sqlite a file in a temporary directory"),
+         workers: int = Option(DEFAULT_WORKERS, help="Concurrent API requests, as for the ingest commands"),
+         chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Rows per multi-row insert statement"),
+         window_days: int = Option(30, help="Days requested per API call"),
+         latency_ms: float = Option(0, help="Simulated API latency per request"),
+         repeat: int = Option(3, help="Runs of each report"),
+         trace_memory: bool = Option(False, help="Also trace the peak Python allocation of each stage, slows every stage down"),
+         output: str = Option(None, help="Write the results to this JSON file"),
+         baseline: str = Option(DEFAULT_BASELINE, help="Baseline results to compare with"),
+         save_baseline: bool = Option(False, help="Store these results as the baseline instead of comparing"),
+         tolerance: float = Option(0.10, help="Relative change in the worse direction reported as a regression"),
+         verbose: bool = Option(False, help="Show the ingest commands' info logging")):
+   """
+   Run get-transactions, get-orders, get-positions and the reports of theta_burn against a scratch
+   database with a stubbed Schwab client serving synthetic payloads, and compare with a baseline.
+   Exits with status 1 when a stage regressed beyond tolerance.
+   """
+   if db_name == dotenv_values().get('db_name'):
+      print(f'{db_name} is the database in .env, pick a scratch database with --db-name')
+      raise SystemExit(2)
+   logging.basicConfig(level=logging.INFO if verbose else logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+   config = {'activities': activities, 'orders': orders or activities // 2, 'positions': positions, 'polls': polls,
+             'accounts': accounts, 'start_date': start_date, 'end_date': end_date, 'seed': seed, 'workers': workers,
+             'chunk_size': chunk_size, 'window_days': window_days, 'latency_ms': latency_ms}
+
+   cache_dir = tempfile.mkdtemp(prefix='theta_burn_bench_')
+   theta_burn = load_theta_burn(db_name, cache_dir)
+   session = theta_burn.db_instance.get_session()
+   # Known only once theta_burn loaded .env
+   config['backend'] = get_backend()
+   print(f'Created the schema in {db_name} with {reset_database(session)} statements')
+
+   start, end = datetime.strptime(start_date, '%Y-%m-%d'), datetime.strptime(end_date, '%Y-%m-%d')
+   synthetic = [SyntheticAccount(index, accounts, activities, config['orders'], positions, start, end, seed) for index in range(accounts)]
+   seed_accounts(session, synthetic)
+   account_numbers = [account.account_number for account in synthetic]
+   account_ids = list(theta_burn.get_account_ids().values())
+   # The stub answers instantly, only the simulated latency should pace the run
+   theta_burn.client = StubClient(synthetic, latency_ms / 1000)
+   theta_burn.rate_limiter = RateLimiter(10 ** 9)
+
+   ingest = dict(account=account_numbers, days=0, start_date=start_date, end_date=end_date, resume=False,
+                 window_days=window_days, workers=workers, debug=False)
+   stages = {}
+
+   def run(name: str, function, wrap: str = None):
+      stage = Stage(name, trace_memory)
+      original = getattr(theta_burn, wrap) if wrap else None
+      if wrap:
+         setattr(theta_burn, wrap, stage.timed(original))
+      try:
+         with stage:
+            function(stage)
+      finally:
+         if wrap:
+            setattr(theta_burn, wrap, original)
+      stages[name] = stage.result()
+      print(f"{name:<22} {stage.seconds:8.2f}s {stages[name]['items_per_s']:12,.0f} items/s")
+
+   def get_transactions(stage):
+      theta_burn.get_transactions(chunk_size=chunk_size, **ingest)
+      stage.items = count_rows(session, 'transactions', account_ids)
+
+   def get_orders(stage):
+      theta_burn.get_orders(status=None, max_results=5000, **ingest)
+      stage.items = count_rows(session, 'orders', account_ids)
+
+   def get_positions(stage):
+      for _ in range(polls):
+         theta_burn.get_positions(account=account_numbers, workers=workers, debug=False)
+      stage.items = count_rows(session, 'positions', account_ids)
+
+   def reports(stage):
+      for _ in range(repeat):
+         stage.timed(lambda: theta_burn.report_engine.run(refresh=True))()
+      stage.items = repeat
+
+   def sql_reports(stage):
+      for sql in report_queries().values():
+         stage.timed(lambda: session.execute(text(sql)).all())()
+         stage.items += 1
+
+   run('get-transactions', get_transactions, wrap='store_transactions')
+   # Overlapping windows are the daily case, every activity is already stored
+   run('get-transactions-rerun', get_transactions, wrap='store_transactions')
+   run('get-orders', get_orders, wrap='store_orders')
+   run('get-positions', get_positions, wrap='store_positions')
+   run('reports', reports)
+   run('sql-reports', sql_reports)
+
+   results = {'config': config,
+              'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'architecture': platform.machine(),
+                          'cpus': os.cpu_count(), 'memory_gb': round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 30, 1)},
+              'recorded': datetime.now().isoformat(timespec='seconds'),
+              'results': stages,
+              # Where the time went inside the ingest commands, for reading rather than comparing
+              'breakdown': theta_burn.metrics.snapshot()}
+   print()
+   print(pd.DataFrame(theta_burn.metrics.summary()).to_string(index=False, na_rep='', float_format='{:,.2f}'.format))
+   print()
+   print(pd.DataFrame.from_dict(stages, orient='index').to_string(float_format='{:,.2f}'.format, na_rep=''))
+   print(f'API calls: {theta_burn.client.calls}')
+
+   if output:
+      with open(output, 'w') as f:
+         json.dump(results, f, indent=2)
+   if save_baseline:
+      os.makedirs(os.path.dirname(os.path.abspath(baseline)), exist_ok=True)
+      with open(baseline, 'w') as f:
+         json.dump(results, f, indent=2)
+      print(f'Saved the baseline to {baseline}')
+      return
+   if not os.path.exists(baseline):
+      print(f'No baseline at {baseline}, store one with --save-baseline')
+      return
+
+   with open(baseline) as f:
+      stored = json.load(f)
+   if stored.get('config') != config:
+      print(f"Baseline was recorded with a different configuration, {stored.get('config')}")
+   comparison = compare(stages, stored, tolerance)
+   print()
+   print(comparison.to_string(index=False, float_format='{:,.2f}'.format))
+   if not comparison.empty and comparison['regression'].any():
+      print(f"{int(comparison['regression'].sum())} metrics regressed more than {tolerance:.0%}")
+      raise SystemExit(1)
+
+
+if __name__ == '__main__':
+   app()
@@ -0,0 +1,96 @@
+import sys
+import os
+
+# Add the lib directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'lib')))
+
+import math
+import random
+from datetime import date, timedelta
+from time import perf_counter
+from typer import Typer, Option
+
+import numpy as np
+
+from analytics.payoff import Legs, payoff_curves, price_grid, OPTION_MULTIPLIER
+from analytics.black_scholes import DAYS_PER_YEAR
+
+app = Typer()
+
+
+def synthetic_iron_condors(structures: int, seed: int) -> list:
+   """
+   SPX iron condors around 5000 expiring within the next 45 days
+   """
+   rng = random.Random(seed)
+   records = []
+   for trade_id in range(structures):
+      center = rng.randrange(4800, 5200, 5)
+      wing = rng.choice((25, 50, 100))
+      width = rng.choice((50, 100, 150))
+      expiration = date.today() + timedelta(days=rng.randint(0, 45))
+      for strike, put_call, quantity in ((center - width - wing, 'PUT', 1), (center - width, 'PUT', -1),
+                                         (center + width, 'CALL', -1), (center + width + wing, 'CALL', 1)):
+         records.append({'trade_id': trade_id, 'strike_price': strike, 'put_call': put_call,
+                         'quantity': quantity * rng.randint(1, 5), 'premium': rng.uniform(1, 30),
+                         'expiration_date': expiration})
+   return records
+
+
+def naive_price(spot, strike, t, vol, rate, is_call):
+   if t <= 0:
+      return max(spot - strike, 0) if is_call else max(strike - spot, 0)
+   cdf = lambda x: 0.5 * (1 + math.erf(x / math.sqrt(2)))
+   d1 = (math.log(spot / strike) + (rate + 0.5 * vol ** 2) * t) / (vol * math.sqrt(t))
+   d2 = d1 - vol * math.sqrt(t)
+   if is_call:
+      return spot * cdf(d1) - strike * math.exp(-rate * t) * cdf(d2)
+   return strike * math.exp(-rate * t) * cdf(-d2) - spot * cdf(-d1)
+
+
+def naive_curves(records: list, prices, days, vol: float, rate: float) -> dict:
+   """
+   Per leg, per date, per price Python loop
+   """
+   curves = {}
+   for record in records:
+      curve = curves.setdefault(record['trade_id'], [[0.0] * len(prices) for _ in days])
+      days_left = (record['expiration_date'] - date.today()).days
+      for d, day in enumerate(days):
+         t = max(days_left - day, 0) / DAYS_PER_YEAR
+         for p, spot in enumerate(prices):
+            value = naive_price(spot, record['strike_price'], t, vol, rate, record['put_call'] == 'CALL')
+            curve[d][p] += (value - record['premium']) * record['quantity'] * OPTION_MULTIPLIER
+   return curves
+
+
+@app.command()
+def main(structures: int = Option(300, help="Number of open structures"),
+         points: int = Option(400, help="Number of underlying prices"),
+         days: str = Option('0,7,30', help="Comma separated days from today to value the structures at"),
+         seed: int = Option(42, help="Random seed for the synthetic structures")):
+   """
+   Compare the vectorized payoff engine with a naive per leg Python loop
+   """
+   records = synthetic_iron_condors(structures, seed)
+   days = [int(day) for day in days.split(',')]
+
+   start = perf_counter()
+   legs = Legs.from_records(records, key=lambda r: r['trade_id'])
+   prices = price_grid(legs, points)
+   curves = payoff_curves(legs, prices, days, vol=0.15, rate=0.05)
+   vectorized = perf_counter() - start
+   print(f'{structures} structures, {len(legs)} legs, {points} prices, {len(days)} dates')
+   print(f'vectorized {vectorized * 1000:10.2f} ms')
+
+   start = perf_counter()
+   naive = naive_curves(records, prices.tolist(), days, 0.15, 0.05)
+   elapsed = perf_counter() - start
+   print(f'naive loop {elapsed * 1000:10.2f} ms ({elapsed / vectorized:,.0f}x slower)')
+
+   error = max(np.abs(curves[legs.keys.index(trade_id)] - np.array(curve)).max() for trade_id, curve in naive.items())
+   print(f'max abs difference ${error:.4f}')
+
+
+if __name__ == '__main__':
+   app()
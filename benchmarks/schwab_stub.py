@@ -0,0 +1,282 @@
+import json
+import math
+import random
+import zlib
+from datetime import datetime, timedelta, timezone
+from time import sleep
+
+import requests
+
+# Where synthetic ids start, far above anything the API hands out for a real account
+ACTIVITY_ID_BASE = 90_000_000_000
+ORDER_ID_BASE = 80_000_000_000
+POSITION_ID_BASE = 70_000_000_000
+ACCOUNT_NUMBER_BASE = 99_000_000
+
+# Activities sharing a positionId per account, roughly open, adjust and close
+TRANSACTIONS_PER_POSITION = 3
+# Every tenth activity is a dividend or interest payment, the rest are trades
+DIVIDEND_OR_INTEREST_EVERY = 10
+# Trade asset mix, each trade also carries CURRENCY fee items
+TRADE_ASSET_TYPES = ('OPTION', 'EQUITY', 'FUTURE', 'FIXED_INCOME')
+TRADE_ASSET_WEIGHTS = (60, 27, 9, 4)
+
+UNDERLYINGS = ('SPX', 'SPXW', 'QQQ', 'IWM', 'AAPL', 'MSFT', 'NVDA', 'TSLA', 'AMZN', 'META')
+EQUITIES = tuple(f'SYN{i:03d}' for i in range(200))
+FUTURES = ('/ESZ4', '/NQZ4', '/RTYZ4', '/CLZ4', '/GCZ4')
+DIVIDEND_DESCRIPTIONS = ('QUALIFIED DIVIDEND~{symbol}', 'ORDINARY DIVIDEND~{symbol}', 'FOREIGN TAX WITHHELD~{symbol}',
+                         '{symbol} CORP COMMON STOCK')
+INTEREST_DESCRIPTIONS = ('FREE BALANCE INTEREST ADJUSTMENT~NO DESCRIPTION', 'MARGIN INTEREST ADJUSTMENT~NO DESCRIPTION',
+                         'BANK INT {month:02d}/01-{month:02d}/28 SCHWAB BANK', 'OFF-CYCLE INTEREST~MMDA1')
+FEE_TYPES = ('COMMISSION', 'OPT_REG_FEE', 'SEC_FEE', 'TAF_FEE', 'INDEX_OPTION_FEE')
+ORDER_STATUSES = ('FILLED', 'FILLED', 'FILLED', 'CANCELED', 'EXPIRED', 'REJECTED')
+
+
+def timestamp(dt: datetime, fraction: bool = False) -> str:
+   return dt.strftime('%Y-%m-%dT%H:%M:%S.000+0000' if fraction else '%Y-%m-%dT%H:%M:%S+0000')
+
+
+def cusip(symbol: str) -> str:
+   return f'{zlib.crc32(symbol.encode()) % 10 ** 9:09d}'
+
+
+def option_symbol(underlying: str, expiration: datetime, put_call: str, strike: int) -> str:
+   """
+   OSI symbol as the API sends it, e.g. SPXW  240315P05000000
+   """
+   return f'{underlying:<6}{expiration:%y%m%d}{put_call[0]}{strike * 1000:08d}'
+
+
+def equity_instrument(symbol: str) -> dict:
+   return {'assetType': 'EQUITY', 'symbol': symbol, 'cusip': cusip(symbol), 'description': f'{symbol} CORP COMMON STOCK',
+           'exchange': 'NYSE'}
+
+
+class SyntheticAccount:
+   """
+   Deterministic Schwab JSON for one account. Activity, order and position i are generated on request
+   from a generator seeded with seed and i, so any window of a million activities comes back the same
+   without holding them in memory. Activities and orders are spread evenly from start to end.
+   """
+   def __init__(self, index: int, accounts: int, activities: int, orders: int, positions: int,
+                start: datetime, end: datetime, seed: int = 42):
+      self.index = index
+      self.accounts = accounts
+      self.activities = activities
+      self.orders = orders
+      self.positions = positions
+      self.start = start
+      self.end = end
+      self.seed = seed
+      self.account_number = ACCOUNT_NUMBER_BASE + index
+      self.account_hash = f'synthetic{index:04d}'
+
+   def _rng(self, kind: str, i: int) -> random.Random:
+      return random.Random(f'{self.seed}:{kind}:{self.index}:{i}')
+
+   def _time(self, i: int, count: int) -> datetime:
+      return self.start + (self.end - self.start) * (i / max(count, 1))
+
+   def _range(self, start: datetime, end: datetime, count: int) -> range:
+      """
+      Indexes of the items whose time falls in start..end
+      """
+      span = (self.end - self.start).total_seconds()
+      first = math.ceil((start - self.start).total_seconds() / span * count)
+      last = math.floor((end - self.start).total_seconds() / span * count)
+      return range(max(first, 0), min(last + 1, count))
+
+   def transactions(self, start: datetime, end: datetime, types: str = None) -> list:
+      wanted = set(types.split(',')) if types else None
+      activities = []
+      for i in self._range(start, end, self.activities):
+         kind = 'DIVIDEND_OR_INTEREST' if i % DIVIDEND_OR_INTEREST_EVERY == DIVIDEND_OR_INTEREST_EVERY - 1 else 'TRADE'
+         if wanted is None or kind in wanted:
+            activities.append(self.activity(i, kind))
+      return activities
+
+   def activity(self, i: int, kind: str) -> dict:
+      rng = self._rng('activity', i)
+      trade_date = self._time(i, self.activities)
+      activity = {'activityId': ACTIVITY_ID_BASE + i * self.accounts + self.index,
+                  'time': timestamp(trade_date),
+                  'accountNumber': str(self.account_number),
+                  'type': kind,
+                  'status': 'VALID',
+                  'subAccount': 'MARGIN',
+                  'tradeDate': timestamp(trade_date),
+                  'settlementDate': timestamp(trade_date + timedelta(days=1))}
+      if kind == 'DIVIDEND_OR_INTEREST':
+         template = rng.choice(DIVIDEND_DESCRIPTIONS + INTEREST_DESCRIPTIONS)
+         amount = round(rng.uniform(0.01, 250), 2)
+         activity.update(description=template.format(symbol=rng.choice(EQUITIES), month=trade_date.month), netAmount=amount,
+                         transferItems=[{'instrument': {'assetType': 'CURRENCY', 'symbol': 'CURRENCY_USD', 'description': 'USD currency'},
+                                         'amount': amount, 'cost': 0}])
+         return activity
+
+      asset_type = rng.choices(TRADE_ASSET_TYPES, TRADE_ASSET_WEIGHTS)[0]
+      items = [self._trade_item(rng, asset_type, trade_date) for _ in range(rng.randint(1, 4) if asset_type == 'OPTION' else 1)]
+      fees = [{'instrument': {'assetType': 'CURRENCY', 'symbol': 'CURRENCY_USD', 'description': 'USD currency'},
+               'amount': -round(rng.uniform(0.01, 2.6), 2), 'cost': 0, 'feeType': fee_type}
+              for fee_type in rng.sample(FEE_TYPES, rng.randint(1, 3))]
+      position = i // (TRANSACTIONS_PER_POSITION * self.accounts)
+      activity.update(description=items[0]['instrument'].get('description', ''),
+                      netAmount=round(-sum(item['cost'] for item in items) + sum(fee['amount'] for fee in fees), 2),
+                      orderId=ORDER_ID_BASE + (i % max(self.orders, 1)) * self.accounts + self.index,
+                      positionId=POSITION_ID_BASE + position * self.accounts + self.index,
+                      transferItems=items + fees)
+      return activity
+
+   def _trade_item(self, rng: random.Random, asset_type: str, trade_date: datetime) -> dict:
+      amount = rng.choice((-1, 1)) * rng.randint(1, 10)
+      if asset_type == 'OPTION':
+         underlying = rng.choice(UNDERLYINGS)
+         expiration = (trade_date + timedelta(days=rng.randint(0, 60))).replace(hour=21, minute=0, second=0, microsecond=0)
+         put_call = rng.choice(('PUT', 'CALL'))
+         strike = rng.randrange(100, 6000, 5)
+         price = round(rng.uniform(0.05, 40), 2)
+         instrument = {'assetType': 'OPTION', 'symbol': option_symbol(underlying, expiration, put_call, strike),
+                       'description': f'{underlying} {expiration:%m/%d/%Y} {strike}.0 {put_call.title()}',
+                       'putCall': put_call, 'strikePrice': strike, 'underlyingSymbol': underlying,
+                       'expirationDate': timestamp(expiration), 'optionPremiumMultiplier': 100}
+         return {'instrument': instrument, 'amount': amount, 'price': price, 'cost': round(-amount * price * 100, 2),
+                 'positionEffect': rng.choice(('OPENING', 'CLOSING'))}
+      if asset_type == 'EQUITY':
+         symbol = rng.choice(EQUITIES)
+         price = round(rng.uniform(5, 900), 2)
+         return {'instrument': equity_instrument(symbol), 'amount': amount * 10, 'price': price,
+                 'cost': round(-amount * 10 * price, 2), 'positionEffect': 'OPENING'}
+      if asset_type == 'FUTURE':
+         symbol = rng.choice(FUTURES)
+         price = round(rng.uniform(50, 20000), 2)
+         return {'instrument': {'assetType': 'FUTURE', 'symbol': symbol, 'description': f'{symbol} future',
+                                'expirationDate': timestamp(trade_date.replace(day=1) + timedelta(days=80))},
+                 'amount': amount, 'price': price, 'cost': round(-amount * price * 50, 2)}
+      price = round(rng.uniform(95, 101), 3)
+      maturity = trade_date + timedelta(days=rng.choice((28, 91, 182, 364)))
+      symbol = f'912797{rng.randint(100, 999)}'
+      return {'instrument': {'assetType': 'FIXED_INCOME', 'symbol': symbol, 'description': f'US TREASURY BILL {maturity:%m/%d/%y}',
+                             'maturityDate': timestamp(maturity), 'multiplier': 0.01},
+              'amount': abs(amount) * 1000, 'price': price, 'cost': round(-abs(amount) * 1000 * price * 0.01, 2)}
+
+   def account_orders(self, start: datetime, end: datetime, max_results: int = None, status: str = None) -> list:
+      orders = [self.order(j) for j in self._range(start, end, self.orders)]
+      if status is not None:
+         orders = [order for order in orders if order['status'] == status]
+      return orders[:max_results] if max_results else orders
+
+   def order(self, j: int) -> dict:
+      rng = self._rng('order', j)
+      entered = self._time(j, self.orders)
+      status = rng.choice(ORDER_STATUSES)
+      underlying = rng.choice(UNDERLYINGS)
+      expiration = entered + timedelta(days=rng.randint(0, 60))
+      quantity = rng.randint(1, 10)
+      legs = []
+      for leg in range(rng.choice((1, 2, 2, 4))):
+         put_call = 'PUT' if leg < 2 else 'CALL'
+         strike = rng.randrange(100, 6000, 5)
+         legs.append({'orderLegType': 'OPTION', 'legId': leg + 1, 'instruction': rng.choice(('BUY_TO_OPEN', 'SELL_TO_OPEN', 'BUY_TO_CLOSE', 'SELL_TO_CLOSE')),
+                      'positionEffect': 'OPENING', 'quantity': quantity,
+                      'instrument': {'assetType': 'OPTION', 'symbol': option_symbol(underlying, expiration, put_call, strike),
+                                     'cusip': '0' + cusip(f'{underlying}{strike}{put_call}'), 'putCall': put_call,
+                                     'underlyingSymbol': underlying, 'description': f'{underlying} {expiration:%m/%d/%Y} {strike}.0 {put_call.title()}',
+                                     'optionDeliverables': [{'symbol': underlying, 'deliverableUnits': 100}]}})
+      order = {'orderId': ORDER_ID_BASE + j * self.accounts + self.index, 'accountNumber': self.account_number,
+               'enteredTime': timestamp(entered), 'orderType': rng.choice(('LIMIT', 'NET_CREDIT', 'NET_DEBIT', 'MARKET')),
+               'quantity': quantity, 'filledQuantity': quantity if status == 'FILLED' else 0,
+               'remainingQuantity': 0 if status == 'FILLED' else quantity, 'requestedDestination': 'AUTO',
+               'orderStrategyType': 'SINGLE', 'status': status, 'price': round(rng.uniform(0.05, 30), 2),
+               'orderDuration': 'DAY', 'orderLegCollection': legs}
+      if status == 'FILLED':
+         order['closeTime'] = timestamp(entered + timedelta(seconds=rng.randint(1, 3600)))
+      elif status == 'CANCELED':
+         order['cancelTime'] = timestamp(entered + timedelta(seconds=rng.randint(1, 3600)))
+      return order
+
+   def account_details(self, polled: datetime) -> dict:
+      rng = self._rng('positions', int(polled.timestamp()) // 60)
+      positions = []
+      for k in range(self.positions):
+         quantity = rng.randint(1, 20)
+         short = rng.random() < 0.5
+         if k % 4 == 3:
+            instrument = dict(equity_instrument(EQUITIES[k % len(EQUITIES)]), netChange=round(rng.uniform(-5, 5), 2))
+         else:
+            underlying = UNDERLYINGS[k % len(UNDERLYINGS)]
+            expiration = polled + timedelta(days=rng.randint(0, 60))
+            put_call = rng.choice(('PUT', 'CALL'))
+            strike = rng.randrange(100, 6000, 5)
+            instrument = {'assetType': 'OPTION', 'cusip': '0' + cusip(f'{underlying}{strike}{put_call}'),
+                          'symbol': option_symbol(underlying, expiration, put_call, strike), 'putCall': put_call,
+                          'underlyingSymbol': underlying, 'description': f'{underlying} {expiration:%m/%d/%Y} {strike}.0 {put_call.title()}',
+                          'maturityDate': timestamp(expiration, fraction=True), 'netChange': round(rng.uniform(-5, 5), 2)}
+         market_value = round(rng.uniform(10, 50000), 2) * (-1 if short else 1)
+         positions.append({'shortQuantity': quantity if short else 0, 'longQuantity': 0 if short else quantity,
+                           'averagePrice': round(rng.uniform(0.05, 900), 4), 'maintenanceRequirement': round(rng.uniform(0, 20000), 2),
+                           'currentDayProfitLoss': round(rng.uniform(-2000, 2000), 2), 'marketValue': market_value,
+                           'currentDayProfitLossPercentage': round(rng.uniform(-50, 50), 2), 'instrument': instrument})
+      return {'securitiesAccount': {'type': 'MARGIN', 'accountNumber': str(self.account_number), 'positions': positions}}
+
+
+class StubResponse:
+   """
+   Enough of requests.Response for call_api, the body is serialized so parsing costs what it does live
+   """
+   def __init__(self, payload, status_code: int = 200):
+      self.status_code = status_code
+      self.content = json.dumps(payload).encode()
+
+   def json(self):
+      return json.loads(self.content)
+
+   def raise_for_status(self):
+      if self.status_code >= 400:
+         raise requests.exceptions.HTTPError(f'{self.status_code} Error', response=self)
+
+
+class StubClient:
+   """
+   Stands in for schwabdev.Client with the synthetic accounts, each call sleeps latency seconds
+   to model the network. Transactions are capped per response like the live endpoint.
+   """
+   def __init__(self, accounts: list, latency: float = 0.0, transactions_cap: int = 3000):
+      self.accounts = {account.account_hash: account for account in accounts}
+      self.latency = latency
+      self.transactions_cap = transactions_cap
+      self.calls = {}
+
+   def _respond(self, name: str, payload, status_code: int = 200) -> StubResponse:
+      self.calls[name] = self.calls.get(name, 0) + 1
+      if self.latency:
+         sleep(self.latency)
+      return StubResponse(payload, status_code)
+
+   @staticmethod
+   def _utc(value) -> datetime:
+      if isinstance(value, str):
+         value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+      return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+   def account_linked(self):
+      return self._respond('account_linked', [{'accountNumber': str(account.account_number), 'hashValue': account_hash}
+                                              for account_hash, account in self.accounts.items()])
+
+   def transactions(self, accountHash, startDate, endDate, types, symbol=None):
+      activities = self.accounts[accountHash].transactions(self._utc(startDate), self._utc(endDate), types)
+      return self._respond('transactions', activities[:self.transactions_cap])
+
+   def account_orders(self, accountHash, fromEnteredTime, toEnteredTime, maxResults=None, status=None):
+      return self._respond('orders', self.accounts[accountHash].account_orders(self._utc(fromEnteredTime), self._utc(toEnteredTime),
+                                                                               maxResults, status))
+
+   def account_details(self, accountHash, fields=None):
+      return self._respond('positions', self.accounts[accountHash].account_details(datetime.now()))
+
+   def instruments(self, symbols, projection):
+      return self._respond('instruments', {'instruments': [equity_instrument(symbol) for symbol in symbols.split(',')
+                                                           if symbol in EQUITIES]})
+
+   def instrument_cusip(self, cusip_id):
+      matches = [equity_instrument(symbol) for symbol in EQUITIES if cusip(symbol) == cusip_id]
+      return self._respond('instrument_cusip', {'instruments': matches}, 200 if matches else 404)
@@ -8,68 +8,194 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'l
 import json
 import requests
 import pandas as pd
-import re
-from sqlalchemy import text, update, select, func
+import numpy as np
+from sqlalchemy import text, update, select, func, inspect
 
 import subprocess
 import logging
-from typer import Typer, Option
+import cProfile
+from typer import Typer, Option, Context
 from typing import List, Annotated
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from zoneinfo import ZoneInfo
-import pytz
+from time import perf_counter, sleep, time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import schwabdev
 import hvac
 from orm.database import Database
-from orm.models import Transaction, TransactionItem, Account, Order, OrderItem, Position, Security
+from orm.backends import duckdb_source
+from orm.migrations import apply_migrations, pending_migrations, create_schema
+from orm.query_plans import report_queries, audit, DEFAULT_MIN_ROWS
+from orm.models import Transaction, TransactionItem, Account, Order, OrderItem, Position, PositionSnapshot, Security, Quote
+from ingest.bulk import ColumnBatch, insert_batch, DEFAULT_CHUNK_SIZE
+from ingest.security_cache import SecurityCache
+from ingest.fetch import RateLimiter, fetch_concurrently, DEFAULT_WORKERS, DEFAULT_REQUESTS_PER_MINUTE
+from ingest.facts import refresh_transaction_facts, refresh_order_facts, rebuild_transaction_facts
+from ingest.classifier import DescriptionClassifier
+from ingest.files import parse_transaction_file, transaction_file_jobs, next_batch, DEFAULT_BATCH_SIZE
+from ingest.generations import bump_generation, POSITIONS
+from ingest.trading_days import refresh_trading_days, rebuild_trading_days, trader_status
+from ingest.trades import assign_trades
+from ingest.token_sync import TokenSync, DEFAULT_VAULT_MOUNT, DEFAULT_REFRESH_MARGIN
+from ingest.synthetic import seed_synthetic, purge_synthetic
+from ingest.streaming import (QuoteCoalescer, TickPipeline, MarkCache, ReplayStream, TickRecorder, subscription_symbols, subscribe,
+                              flush_quotes, quote_mark, next_bucket, DEFAULT_FLUSH_SECONDS, DEFAULT_QUEUE_SIZE, DEFAULT_MARK_CACHE_PATH)
+from ingest.instrumentation import IngestMetrics, profile_report, DEFAULT_PROFILE_TOP
+from ingest.snapshots import point_latest, compact_snapshots, snapshot_changed, DEFAULT_KEEP_DAYS
+from ingest.backfill import split_windows, fetch_adaptive, CheckpointTracker, get_checkpoint, save_checkpoint, DEFAULT_WINDOW, TRANSACTIONS_RESULT_CAP
+from analytics.greeks import implied_vol, greeks, time_to_expiry, option_contracts, GREEKS
+from analytics.payoff import OPTION_MULTIPLIER
+from analytics.market_calendar import upsert_calendar, DEFAULT_START_YEAR, DEFAULT_END_YEAR
+from analytics.reports import ReportEngine, REPORTS, DEFAULT_CACHE_DIR
 
 app = Typer()
 
+# Symbols per quotes request
+QUOTE_BATCH_SIZE = 100
+
 # Initialize the Database
 db_instance = Database()
 
+# Stage timings, API calls and database statements of this run, summarized when the command finishes
+metrics = IngestMetrics()
+metrics.instrument_engine(db_instance.get_engine())
+
+# Every API call goes through one limiter so concurrent fetches stay within Schwab's request budget
+rate_limiter = RateLimiter(int(os.getenv('schwab_requests_per_minute', DEFAULT_REQUESTS_PER_MINUTE)))
+
+# Security metadata cache, the API is only called for securities missing from memory and the securities table
+security_cache = SecurityCache(db_instance.get_session,
+                               lambda symbols: fetch_instruments(symbols),
+                               lambda cusip: fetch_instrument_cusip(cusip),
+                               ttl=timedelta(hours=float(os.getenv('security_cache_ttl_hours', 168))))
+
+# Dividend/interest description classifier, the securities description index is loaded once on first use
+classifier = DescriptionClassifier(lambda: db_instance.get_session().query(Security.description, Security.symbol).all())
+
+# Reports are computed from one cached read of transaction_facts
+report_engine = ReportEngine(db_instance.get_session, os.getenv('report_cache_dir', DEFAULT_CACHE_DIR), duckdb_source())
+
+# Vault sync of the Schwab tokens, set by get_client_and_sync_tokens when VAULT_URL is configured
+token_sync = None
+
+
+@app.callback()
+def run_options(ctx: Context,
+                metrics_json: str = Option(None, help="Write the run's stage, API and database metrics to this JSON file"),
+                metrics_prom: str = Option(None, help="Write the run's metrics to this Prometheus node exporter textfile"),
+                profile: bool = Option(False, help="Run the command under cProfile and print its hottest functions, the fetch threads are not profiled"),
+                profile_top: int = Option(DEFAULT_PROFILE_TOP, help="Functions listed by --profile"),
+                profile_sort: str = Option('cumulative', help="pstats sort key of the --profile listing, e.g. cumulative or tottime")):
+   """
+   Options placed before the command apply to any command, e.g. theta_burn.py --profile get-transactions --account 123
+   """
+   metrics.command = ctx.invoked_subcommand
+   profiler = None
+   if profile:
+      profiler = cProfile.Profile()
+      profiler.enable()
+
+   def report():
+      if profiler is not None:
+         profiler.disable()
+      summary = metrics.summary()
+      if summary:
+         logger.info(f'Run metrics for {metrics.command}\n' + pd.DataFrame(summary).to_string(index=False, na_rep='', float_format='{:,.2f}'.format))
+      db = metrics.snapshot()['db']
+      if db['commits']:
+         logger.info(f"Database: {db['statements']['count']} statements, {db['rows']} rows in {db['commits']} commits, "
+                     f"{db['rows_per_commit']:,.0f} rows per commit on average and at most {db['max_rows_per_commit']:,}")
+      if metrics_json:
+         metrics.write_json(metrics_json)
+      if metrics_prom:
+         metrics.write_prometheus(metrics_prom)
+      if profiler is not None:
+         print(profile_report(profiler, profile_top, profile_sort))
+
+   ctx.call_on_close(report)
 
 @app.command()
 def process_transaction_files( import_dir: str = './data/import',
                         log_dir: str = '.',
-                        log_file: str = 'import_transactions.log'):
+                        log_file: str = 'import_transactions.log',
+                        workers: int = Option(DEFAULT_WORKERS, help="Number of processes parsing files"),
+                        batch_size: int = Option(DEFAULT_BATCH_SIZE, help="Number of activities loaded per commit"),
+                        chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Number of rows per multi-row insert statement")):
    """
-   Import transactions from a directory
+   Import transactions from a directory.
+   Files are parsed a batch at a time in a process pool, each worker continuing from the byte offset
+   its previous batch ended at, while this process loads the parsed batches. A file is moved to
+   processed/ once all its batches have committed.
    """
    if log_dir != '.':
        set_log_file(logger, os.path.join(log_dir, log_file))
 
    logger.info(f'Importing transactions from {import_dir}')
 
-   i = 0
-   for filename in os.listdir(import_dir):
-
+   paths = []
+   for filename in sorted(os.listdir(import_dir)):
       # Skip files that are not JSON files
       if not filename.endswith('.json'):
          logger.info(f'Skipping file {filename}')
          continue
+      paths.append(os.path.join(import_dir, filename))
+
+   # Files only need the account id so resolve them once from the database, no API call
+   accounts = get_account_ids()
+   processed_dir = os.path.join(import_dir, 'processed')
+   os.makedirs(processed_dir, exist_ok=True)
+
+   processed = 0
+   # Account id of each file, resolved from its first batch. None once a file is skipped.
+   file_accounts = {}
+
+   def write(job: dict, parsed: dict):
+      nonlocal processed
+      filename = os.path.basename(job['path'])
+      if 'error' in parsed:
+         logger.error(f'Error parsing {filename}: {parsed["error"]}. Skipping the rest of the file')
+         return
+      if job['offset'] == 0:
+         if not parsed['batch']:
+            logger.error(f'No transactions found in {filename}. Skipping')
+            return
+
+         account_number = parsed['batch'][0].get('accountNumber')
+         if account_number is None:
+            logger.error(f'Account number not found in the transaction file. Skipping')
+            account_id = None
+         else:
+            account_id = accounts.get(int(account_number))
+            if account_id is None:
+               logger.error(f'Account ID for account number {account_number} not found in the database. Skipping')
+         file_accounts[job['path']] = account_id
 
-      with open(os.path.join(import_dir, filename), 'r') as f:
-         transactions = json.load(f)
+      account_id = file_accounts[job['path']]
+      if account_id is None:
+         return
 
-      accounts = get_accounts()
-      account_number = transactions[0].get('accountNumber')
-      if account_number is None:
-         logger.error(f'Account number not found in the transaction file. Skipping')
-         continue
+      if parsed['batch']:
+         result = store_transactions(account_id, parsed['batch'], chunk_size)
+         logger.info(f'{filename}: loaded {result["new_transactions"]} new transactions, skipped {result["skipped_transactions"]} transactions')
 
-      account_id = accounts[int(account_number)].get('account_id', None)
-      if account_id is None:
-         logger.error(f'Account ID {transactions[0]["accountId"]} not found in the database. Skipping')
-         continue
+      if parsed['offset'] is not None:
+         return
 
-      store_transactions(account_id, transactions)
+      # Move the file to the processed directory once its last batch has committed
+      os.rename(job['path'], os.path.join(processed_dir, filename))
+      processed += 1
+      metrics.count('files.processed')
 
-      # Move the file to the processed directory
-      os.rename(os.path.join(import_dir, filename), os.path.join(import_dir, 'processed', filename))
-      i = i + 1
-   logger.info(f'Processed {i+1} files')
+   fetch_concurrently(transaction_file_jobs(paths),
+                      partial(parse_transaction_file, batch_size=batch_size),
+                      write,
+                      workers,
+                      executor_class=ProcessPoolExecutor,
+                      # Stop parsing a file once it is skipped
+                      next_job=lambda job, parsed: next_batch(job, parsed) if file_accounts.get(job['path'], 0) is not None else None)
+   logger.info(f'Processed {processed} files')
 
    return
 
@@ -78,6 +204,10 @@ def get_transactions(account: Annotated[List[int], Option(..., "--account", help
                      days: int = Option(7, help="Number of days back from current date to get transactions for"),
                      start_date: str = Option(None, help="start date of date range to pull transactions for"),
                      end_date: str = Option(None, help="end date of date range to pull transactions for"),
+                     resume: bool = Option(False, help="start from the last checkpoint of each account and type, also when it is older than start date so missed runs are caught up"),
+                     window_days: int = Option(DEFAULT_WINDOW.days, help="Number of days requested per API call, windows that hit the result cap are split"),
+                     chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Number of rows per multi-row insert statement"),
+                     workers: int = Option(DEFAULT_WORKERS, help="Number of concurrent API requests"),
                      debug: bool = Option(None, help="print the transaction json")) -> list:
 
    """
@@ -93,77 +223,296 @@ def get_transactions(account: Annotated[List[int], Option(..., "--account", help
    else:
       end_date = eastern(datetime.strptime(end_date, '%Y-%m-%d'))
 
-   accounts = get_accounts()
-   for account_number in account:
-     
-      account_id = accounts[account_number].get('account_id', None)
-      account_hash = accounts[account_number].get('account_hash', None)
-      if account_id is None:
-         logger.error(f'Account ID {account_number} not found in the database. Skipping')
-         continue
-      if account_hash is None:
-         logger.error(f'Account hash for account number {account_number} not found in the database. Skipping')
-         continue
-
+   # One job per account, transaction type and date window
+   session = db_instance.get_session()
+   jobs = []
+   trackers = {}
+   for job in get_account_jobs(account):
       for transaction_type in ('TRADE', 'DIVIDEND_OR_INTEREST'):
-         logger.info(f'Getting {transaction_type} transactions for account {account_number}')
-         try:
-            resp = client.transactions(account_hash, start_date, end_date, transaction_type)
-            resp.raise_for_status()  # Raises an HTTPError if the response was an error
-            transactions = resp.json()
-         except requests.exceptions.HTTPError as e:
-            logger.error(f'HTTP error getting transactions: {e}')
-            continue
-         except ValueError as e:  # In case resp.json() fails to parse JSON
-            logger.error(f'Error parsing transactions response as JSON: {e}')
-            continue
-         if debug:
-            print(json.dumps(transactions, indent=2))
+         windows = split_windows(resume_from(session, job['account_id'], transaction_type, start_date, resume),
+                                 end_date, timedelta(days=window_days))
+         trackers[(job['account_id'], transaction_type)] = CheckpointTracker(windows)
+         jobs.extend(dict(job, transaction_type=transaction_type, start_date=window_start, end_date=window_end)
+                     for window_start, window_end in windows)
+
+   def fetch(job: dict):
+      logger.info(f'Getting {job["transaction_type"]} transactions for account {job["account_number"]} from {job["start_date"]:%Y-%m-%d} to {job["end_date"]:%Y-%m-%d}')
+      return fetch_adaptive(lambda window_start, window_end: call_api(lambda: client.transactions(job['account_hash'], window_start, window_end, job['transaction_type']), 'transactions'),
+                            job['start_date'], job['end_date'], TRANSACTIONS_RESULT_CAP, key=lambda t: t['activityId'])
+
+   def write(job: dict, transactions: list):
+      if debug:
+         print(json.dumps(transactions, indent=2))
 
-         result = store_transactions(account_id, transactions)
+      if transactions:
+         result = store_transactions(job['account_id'], transactions, chunk_size)
          logger.info(f'Loaded {result["new_transactions"]} new transactions, skipped {result["skipped_transactions"]} transactions')
+
+      high_water_mark = trackers[(job['account_id'], job['transaction_type'])].complete((job['start_date'], job['end_date']))
+      if high_water_mark is not None:
+         save_checkpoint(session, job['account_id'], job['transaction_type'], high_water_mark)
+         session.commit()
+
+   fetch_concurrently(jobs, fetch, write, workers)
    return
 
 @app.command()
 def get_positions(account: Annotated[List[int], Option(..., "--account", help="One or more account numbers")],
+                  workers: int = Option(DEFAULT_WORKERS, help="Number of concurrent API requests"),
                   debug: bool = Option(None, help="print the transaction json")) -> list:
 
-   accounts = get_accounts()
-
-   for account_number in account:
-      account_id = accounts[account_number].get('account_id', None)
-      account_hash = accounts[account_number].get('account_hash', None)
-      if account_id is None:
-         logger.error(f'Account ID {account_number} not found in the database. Skipping')
-         continue
-      if account_hash is None:
-         logger.error(f'Account hash for account number {account_number} not found in the database. Skipping')
-         continue
+   def fetch(job: dict):
+      return call_api(lambda: client.account_details(job['account_hash'], fields="positions"), 'positions')
 
-      try:
-         resp = client.account_details(account_hash, fields="positions")
-         resp.raise_for_status()  # Raises an HTTPError if the response was an error
-         positions_json = resp.json()
-      except requests.exceptions.HTTPError as e:
-         logger.error(f'HTTP error getting positions: {e}')
-         continue
-      except ValueError as e:  # In case resp.json() fails to parse JSON
-         logger.error(f'Error parsing positions response as JSON: {e}')
-         continue
+   def write(job: dict, positions_json: dict):
       if debug:
          print(json.dumps(positions_json, indent=2))
      
-      results = store_positions(account_id, positions_json)
+      results = store_positions(job['account_id'], positions_json)
       logger.info(f'Updated {results}')
-      
+
+   fetch_concurrently(get_account_jobs(account), fetch, write, workers)
    return
 
+@app.command()
+def compact_positions(keep_days: int = Option(DEFAULT_KEEP_DAYS, help="Keep every position snapshot for this many days, older ones are thinned to one per account and day")):
+   """
+   Apply the position snapshot retention policy
+   """
+   deleted = compact_snapshots(db_instance.get_session(), keep_days)
+   logger.info(f'Deleted {deleted} position snapshots older than {keep_days} days')
+
+@app.command("rebuild-transaction-facts")
+def rebuild_facts():
+   """
+   Rebuild the transaction_facts table from transactions, transaction_items and orders
+   """
+   start = perf_counter()
+   rows = rebuild_transaction_facts(db_instance.get_session())
+   invalidate_responses()
+   logger.info(f'Rebuilt transaction_facts with {rows} rows in {perf_counter() - start:.2f}s')
+
+@app.command("rebuild-trading-days")
+def rebuild_trading_day_stats():
+   """
+   Rebuild the trading_days and trading_day_stats counters from transaction_facts
+   """
+   start = perf_counter()
+   rows = rebuild_trading_days(db_instance.get_session())
+   invalidate_responses()
+   logger.info(f'Rebuilt trading day stats for {rows} account years in {perf_counter() - start:.2f}s')
+
+@app.command("trader-status")
+def show_trader_status(year: int = Option(None, help="Year to report, the current year by default"),
+                       all_accounts: bool = Option(False, help="Include non taxable accounts")):
+   """
+   Trading ratios against the IRS trader status target from the maintained counters
+   """
+   status = trader_status(db_instance.get_session(), year, account_types=None if all_accounts else ('TAXABLE',))
+   if not status:
+      logger.info('No trading days recorded')
+      return
+   print(pd.DataFrame(status).to_string(index=False))
+
+@app.command("assign-trades")
+def auto_assign_trades(strategy_id: int = Option(..., help="Strategy of the trades created"),
+                       account_id: Annotated[List[int], Option("--account-id", help="Accounts to assemble, all by default")] = None,
+                       chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Rows per multi-row INSERT")):
+   """
+   Assemble unassigned transactions into trades by position and order within each underlying and expiration cycle in one pass.
+   Trades created by hand keep their transactions.
+   """
+   start = perf_counter()
+   counts = assign_trades(db_instance.get_session(), strategy_id, account_id, chunk_size=chunk_size)
+   logger.info(f"Assigned {counts['transactions']} transactions, created {counts['created']} trades, "
+               f"updated {counts['updated']} and removed {counts['removed']} in {perf_counter() - start:.2f}s")
+
+@app.command()
+def report(name: Annotated[List[str], Option("--name", help=f"Reports to run, all by default. One of {', '.join(REPORTS)}")] = None,
+           year: Annotated[List[int], Option("--year", help="Years to report on")] = None,
+           refresh: bool = Option(False, help="Reload the facts from the database even if the cached frame is current")):
+   """
+   Run the registered reports from a single read of transaction_facts
+   """
+   start = perf_counter()
+   try:
+      results = report_engine.run(name, refresh=refresh, years=year)
+   except ValueError as e:
+      logger.error(e)
+      return
+   for report_name, frame in results.items():
+      print(f'\n{report_name}')
+      print(frame.to_string(index=False))
+   logger.info(f'Ran {len(results)} reports in {perf_counter() - start:.2f}s')
+
+@app.command()
+def compute_greeks(rate: float = Option(0.05, help="Risk free rate used for implied volatility and the Greeks"),
+                   account_id: Annotated[List[int], Option("--account-id", help="Only contracts held by these account ids")] = None,
+                   workers: int = Option(DEFAULT_WORKERS, help="Number of concurrent API requests"),
+                   chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Rows per bulk insert statement"),
+                   debug: bool = Option(None, help="print the quotes json")):
+   """
+   Solve implied volatility and the Greeks for every option in the latest positions and store them in quotes
+   """
+   session = db_instance.get_session()
+   contracts = option_contracts(session, account_id)
+   if not contracts:
+      logger.info('No option positions found')
+      return
+
+   quotes = fetch_quotes(sorted(set(contracts) | {c['underlying'] for c in contracts.values()}), workers)
+   if debug:
+      print(json.dumps(quotes, indent=2))
+
+   as_of = eastern(datetime.now()).replace(tzinfo=None)
+   symbols = []
+   spot, strike, expiration, is_call, option_price = [], [], [], [], []
+   for symbol, contract in contracts.items():
+      underlying_quote = quotes.get(contract['underlying'], {})
+      underlying_price = underlying_quote.get('mark') or underlying_quote.get('lastPrice')
+      quote = quotes.get(symbol, {})
+      mark = quote.get('mark') or contract['mark']
+      if not underlying_price or not mark:
+         logger.error(f'No price for {symbol} or its underlying {contract["underlying"]}. Skipping')
+         continue
+      symbols.append(symbol)
+      spot.append(underlying_price)
+      strike.append(contract['strike_price'])
+      expiration.append(contract['expiration_date'])
+      is_call.append(contract['put_call'] == 'CALL')
+      option_price.append(mark)
+
+   start = perf_counter()
+   t = time_to_expiry(expiration, as_of)
+   ivol = implied_vol(option_price, spot, strike, t, rate, is_call)
+   results = greeks(spot, strike, t, ivol, rate, is_call)
+   logger.info(f'Solved {len(symbols)} contracts in {(perf_counter() - start) * 1000:.1f}ms')
+
+   quote_batch = ColumnBatch(Quote.__table__)
+   exposure = {}
+   unsolved = 0
+   for i, symbol in enumerate(symbols):
+      if np.isnan(ivol[i]):
+         unsolved += 1
+         continue
+      quote = quotes.get(symbol, {})
+      quote_batch.append(dict({name: float(results[name][i]) for name in GREEKS},
+                              symbol = symbol,
+                              date = as_of.date(),
+                              bid = quote.get('bidPrice', 0),
+                              ask = quote.get('askPrice', 0),
+                              last = quote.get('lastPrice', 0),
+                              open_interest = quote.get('openInterest', 0),
+                              volume = quote.get('totalVolume', 0),
+                              ivol = float(ivol[i])))
+      # Position level exposure, Greeks are per share
+      for account, quantity in contracts[symbol]['quantities'].items():
+         totals = exposure.setdefault(account, dict.fromkeys(GREEKS, 0.0))
+         for name in GREEKS:
+            totals[name] += float(results[name][i]) * quantity * OPTION_MULTIPLIER
+
+   if unsolved:
+      logger.warning(f'No implied volatility for {unsolved} contracts priced outside their arbitrage bounds or expired')
+
+   insert_batch(session, quote_batch, chunk_size, update_columns=['bid', 'ask', 'last', 'open_interest', 'volume', 'ivol', *GREEKS])
+   session.commit()
+   logger.info(f'Stored Greeks for {len(quote_batch)} contracts')
+   for account, totals in exposure.items():
+      logger.info(f'Account id {account} ' + ', '.join(f'{name} {value:,.2f}' for name, value in totals.items()))
+
+@app.command("stream-quotes")
+def stream_quotes(flush_seconds: float = Option(DEFAULT_FLUSH_SECONDS, help="Length of the time buckets ticks are coalesced in before each flush to quotes"),
+                  queue_size: int = Option(DEFAULT_QUEUE_SIZE, help="Messages buffered between the stream and the coalescer, beyond it the stream thread coalesces them itself"),
+                  refresh_minutes: float = Option(5, help="Re-read the latest positions and update the subscriptions this often"),
+                  duration: float = Option(0, help="Stop after this many seconds, 0 runs until interrupted"),
+                  record: str = Option(None, help="Append the raw stream messages to this JSON lines file"),
+                  replay: str = Option(None, help="Replay a recorded JSON lines file instead of connecting to the streamer"),
+                  speed: float = Option(1.0, help="Replay speed multiplier, 0 replays as fast as possible"),
+                  chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Rows per multi-row INSERT")):
+   """
+   Stream level one quotes for the latest positions into quotes and the live mark cache
+   """
+   session = db_instance.get_session()
+   coalescer = QuoteCoalescer()
+   pipeline = TickPipeline(coalescer, queue_size)
+   marks = MarkCache(os.getenv('mark_cache_path', DEFAULT_MARK_CACHE_PATH))
+   stream = ReplayStream(replay, speed) if replay else client.stream
+   receiver = TickRecorder(record, pipeline.receive) if record else pipeline.receive
+
+   def flush(bucket_end: float) -> int:
+      quotes = coalescer.drain()
+      if not quotes:
+         return 0
+      as_of = eastern(datetime.fromtimestamp(bucket_end))
+      start = perf_counter()
+      rows = flush_quotes(session, quotes, as_of.date(), chunk_size)
+      session.commit()
+      marks.publish({symbol: quote_mark(quote) for symbol, quote in quotes.items() if quote_mark(quote) is not None}, as_of)
+      elapsed = perf_counter() - start
+      metrics.record('quotes.flush', elapsed)
+      metrics.count('quotes.flushed', rows)
+      if elapsed > flush_seconds:
+         logger.warning(f'Flush of {rows} quotes took {elapsed:.2f}s, longer than the {flush_seconds}s bucket')
+      return rows
+
+   pipeline.start()
+   stream.start(receiver)
+   subscribed = subscribe(stream, subscription_symbols(session), {})
+   logger.info(f"Subscribed to {', '.join(f'{len(symbols)} {service}' for service, symbols in subscribed.items())}")
+
+   started = time()
+   next_refresh = started + refresh_minutes * 60
+   flushed = 0
+   try:
+      while duration <= 0 or time() - started < duration:
+         bucket_end = next_bucket(time(), flush_seconds)
+         sleep(max(bucket_end - time(), 0))
+         flushed += flush(bucket_end)
+         if time() >= next_refresh:
+            session.expire_all()
+            subscribed = subscribe(stream, subscription_symbols(session), subscribed)
+            next_refresh = time() + refresh_minutes * 60
+            logger.info(f'Stream {pipeline.stats()}, {flushed} quote rows flushed')
+         if replay and not stream.active and pipeline.queue.empty():
+            break
+   except KeyboardInterrupt:
+      logger.info('Stopping the stream')
+   finally:
+      stream.stop()
+      pipeline.stop()
+      flushed += flush(time())
+      if record:
+         receiver.close()
+   logger.info(f'Stream {pipeline.stats()}, {flushed} quote rows flushed')
+
+def fetch_quotes(symbols: list, workers: int = DEFAULT_WORKERS) -> dict:
+   """
+   Get quotes for symbols in batches, keyed by symbol
+   """
+   quotes = {}
+
+   def fetch(batch: list):
+      return call_api(lambda: client.quotes(batch), 'quotes')
+
+   def write(batch: list, response: dict):
+      for symbol, quote in response.items():
+         if 'quote' in quote:
+            quotes[symbol] = quote['quote']
+
+   batches = [symbols[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(symbols), QUOTE_BATCH_SIZE)]
+   fetch_concurrently(batches, fetch, write, workers)
+   return quotes
+
 @app.command()
 def get_orders(account: Annotated[List[int], Option(..., "--account", help="One or more account numbers")],
                      days: int = Option(7, help="Number of days back from current date to get transactions for"),
                      start_date: str = Option(None, help="start date of date range to pull transactions for"),
                      end_date: str = Option(None, help="end date of date range to pull transactions for"),
                      status: str = Option(None, help="status of the order"),
+                     resume: bool = Option(False, help="start from the last checkpoint of each account, also when it is older than start date so missed runs are caught up"),
+                     window_days: int = Option(DEFAULT_WINDOW.days, help="Number of days requested per API call, windows that hit max results are split"),
+                     max_results: int = Option(5000, help="maxResults sent with each orders request"),
+                     workers: int = Option(DEFAULT_WORKERS, help="Number of concurrent API requests"),
                      debug: bool = Option(None, help="print the transaction json")) -> list:
 
    """
@@ -179,8 +528,66 @@ def get_orders(account: Annotated[List[int], Option(..., "--account", help="One
    else:
       end_date = eastern(datetime.strptime(end_date, '%Y-%m-%d'))
 
+   session = db_instance.get_session()
+   jobs = []
+   trackers = {}
+   for job in get_account_jobs(account):
+      windows = split_windows(resume_from(session, job['account_id'], 'ORDERS', start_date, resume),
+                              end_date, timedelta(days=window_days))
+      trackers[job['account_id']] = CheckpointTracker(windows)
+      jobs.extend(dict(job, start_date=window_start, end_date=window_end) for window_start, window_end in windows)
+
+   def fetch(job: dict):
+      return fetch_adaptive(lambda window_start, window_end: call_api(lambda: client.account_orders(job['account_hash'], maxResults=max_results, fromEnteredTime=window_start, toEnteredTime=window_end, status=status), 'orders'),
+                            job['start_date'], job['end_date'], max_results, key=lambda o: o['orderId'])
+
+   def write(job: dict, orders: list):
+      if debug:
+         print(json.dumps(orders, indent=2))
+
+      if orders:
+         result = store_orders(job['account_id'], orders)
+         logger.info(f'Loaded {result["new_orders"]} new orders, updated {result["updated_orders"]} orders, skipped {result["skipped_orders"]} orders')
+
+      # A status filtered run only saw part of the orders so it must not move the checkpoint
+      high_water_mark = trackers[job['account_id']].complete((job['start_date'], job['end_date']))
+      if high_water_mark is not None and status is None:
+         save_checkpoint(session, job['account_id'], 'ORDERS', high_water_mark)
+         session.commit()
+
+   fetch_concurrently(jobs, fetch, write, workers)
+
+def invalidate_responses():
+   """
+   Bump the global cache generation after a rebuild so the www response cache drops every account
+   """
+   session = db_instance.get_session()
+   bump_generation(session)
+   session.commit()
+
+def resume_from(session, account_id: int, type: str, start_date: datetime, resume: bool) -> datetime:
+   """
+   Get the start of the range to request, the checkpoint when resuming. A checkpoint older than
+   start_date means earlier runs were missed, the gap is fetched rather than skipped past.
+   """
+   if not resume:
+      return start_date
+   checkpoint = get_checkpoint(session, account_id, type)
+   if checkpoint is None:
+      return start_date
+   if checkpoint < start_date:
+      logger.warning(f'Checkpoint {checkpoint} of {type} for account id {account_id} is older than {start_date}, fetching the gap from the checkpoint')
+   else:
+      logger.info(f'Resuming {type} for account id {account_id} from checkpoint {checkpoint}')
+   return checkpoint
+
+def get_account_jobs(account_numbers: list) -> list:
+   """
+   Resolve account numbers to fetch jobs holding the account id and hash
+   """
    accounts = get_accounts()
-   for account_number in account:
+   jobs = []
+   for account_number in account_numbers:
       account_id = accounts[account_number].get('account_id', None)
       account_hash = accounts[account_number].get('account_hash', None)
       if account_id is None:
@@ -189,76 +596,188 @@ def get_orders(account: Annotated[List[int], Option(..., "--account", help="One
       if account_hash is None:
          logger.error(f'Account hash for account number {account_number} not found in the database. Skipping')
          continue
+      jobs.append({'account_number': account_number, 'account_id': account_id, 'account_hash': account_hash})
+   return jobs
 
-      try:
-         resp = client.account_orders(account_hash, maxResults=5000, fromEnteredTime=start_date, toEnteredTime=end_date, status=status)
-         resp.raise_for_status()  # Raises an HTTPError if the response was an error
-         orders = resp.json()
-      except requests.exceptions.HTTPError as e:
-         logger.error(f'HTTP error getting orders: {e}')
-         continue
-      except ValueError as e:  # In case resp.json() fails to parse JSON
-         logger.error(f'Error parsing orders response as JSON: {e}')
-         continue
-      if debug:
-         print(json.dumps(orders, indent=2))
-
-      result = store_orders(account_id, orders)
-      logger.info(f'Loaded {result["new_orders"]} new orders, updated {result["updated_orders"]} orders, skipped {result["skipped_orders"]} orders')
-
-def get_security(symbol: str=None, cuspid: str=None, projection: str="symbol-search", debug: bool=False) -> dict:
+def send_request(request, name: str):
    """
-   Get security details
+   Send an API request through the global rate limiter, its latency and status are recorded under name
    """
-   if symbol is not None:
-      resp = client.instruments(symbol, projection)
-   elif cuspid is not None:
-      resp = client.instrument_cusip(cuspid)
-   else:
-      logger.error(f'Either symbol or cuspid must be provided. [Line {traceback.extract_stack()[-1].lineno}]')
-      return None
+   with metrics.stage('api.rate_limit_wait'):
+      rate_limiter.acquire()
+   start = perf_counter()
+   resp = None
+   try:
+      resp = request()
+      return resp
+   finally:
+      metrics.record_http(name, perf_counter() - start, getattr(resp, 'status_code', None))
 
-   if resp.status_code == 404:
-      logger.error(f"Resource not found in call to get_security for {'symbol=' + symbol if symbol else 'cuspid=' + cuspid}. Skipping [Line {traceback.extract_stack()[-1].lineno}]")
-      return None
+def call_api(request, name: str):
+   """
+   Send an API request through the global rate limiter and return the parsed JSON.
+   Returns None if the request failed.
+   """
+   try:
+      resp = send_request(request, name)
+      resp.raise_for_status()  # Raises an HTTPError if the response was an error
+      with metrics.stage('api.parse_json'):
+         return resp.json()
+   except requests.exceptions.HTTPError as e:
+      logger.error(f'HTTP error getting {name}: {e}')
+   except ValueError as e:  # In case resp.json() fails to parse JSON
+      logger.error(f'Error parsing {name} response as JSON: {e}')
+   return None
 
-   if resp.json() is None or 'instruments' not in resp.json():
-      logger.error(f'No instruments found for {symbol or cuspid}. Skipping [Line {traceback.extract_stack()[-1].lineno}]')
-      return None
+def fetch_instruments(symbols: list) -> list:
+   """
+   Get instrument details for a batch of symbols using the API
+   """
+   try:
+      resp = send_request(lambda: client.instruments(','.join(symbols), 'symbol-search'), 'instruments')
+      if resp.status_code == 404:
+         logger.error(f'Resource not found in call to fetch_instruments for symbols={symbols}. Skipping')
+         return []
+      resp.raise_for_status()
+      with metrics.stage('api.parse_json'):
+         instruments = resp.json()
+   except requests.exceptions.HTTPError as e:
+      logger.error(f'HTTP error getting instruments: {e}')
+      return []
+   except ValueError as e:  # In case resp.json() fails to parse JSON
+      logger.error(f'Error parsing instruments response as JSON: {e}')
+      return []
+
+   if instruments is None or 'instruments' not in instruments:
+      logger.error(f'No instruments found for {symbols}. Skipping')
+      return []
+   return instruments['instruments']
+
+def fetch_instrument_cusip(cusip: str) -> list:
+   """
+   Get instrument details for a CUSIP using the API
+   """
+   try:
+      resp = send_request(lambda: client.instrument_cusip(cusip), 'instrument_cusip')
+      if resp.status_code == 404:
+         logger.error(f'Resource not found in call to fetch_instrument_cusip for cuspid={cusip}. Skipping')
+         return []
+      resp.raise_for_status()
+      with metrics.stage('api.parse_json'):
+         instruments = resp.json()
+   except requests.exceptions.HTTPError as e:
+      logger.error(f'HTTP error getting instrument: {e}')
+      return []
+   except ValueError as e:  # In case resp.json() fails to parse JSON
+      logger.error(f'Error parsing instrument response as JSON: {e}')
+      return []
+
+   if instruments is None or 'instruments' not in instruments:
+      logger.error(f'No instruments found for {cusip}. Skipping')
+      return []
+   return instruments['instruments']
    
-   # Store the security
-   return store_security(resp.json().get('instruments')[0])
+@app.command()
+def populate_calendar(start_year: int = Option(DEFAULT_START_YEAR, help="First year of the calendar"),
+                      end_year: int = Option(DEFAULT_END_YEAR, help="Last year of the calendar"),
+                      chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Rows per bulk insert statement")):
+   """
+   Build the calendar table with the NYSE holiday and early close rules, existing days are updated
+   """
+   start = perf_counter()
+   days = upsert_calendar(db_instance.get_session(), date(start_year, 1, 1), date(end_year, 12, 31), chunk_size)
+   invalidate_responses()
+   logger.info(f'Wrote {days} calendar days in {perf_counter() - start:.2f}s')
 
+@app.command("init-db")
+def init_db():
+   """
+   Create the tables, triggers and views in an empty database with the schema script of db_backend and record the migrations as applied
+   """
+   tables = inspect(db_instance.get_engine()).get_table_names()
+   if tables:
+      logger.error(f'The database already has {len(tables)} tables, run migrate to bring it up to date')
+      return
+   statements = create_schema(db_instance.get_session())
+   logger.info(f'Created the {db_instance.backend} schema with {statements} statements')
 
-def store_security(instrument: dict) -> dict:
+@app.command()
+def migrate(target: int = Option(None, help="Stop after this migration version"),
+            dry_run: bool = Option(False, help="List the pending migrations without applying them")):
+   """
+   Apply the pending versioned migrations in lib/sql/migrations
+   """
+   session = db_instance.get_session()
+   try:
+      pending = pending_migrations(session)
+   except ValueError as e:
+      logger.error(e)
+      return
+   if dry_run or not pending:
+      for version, name, path in pending:
+         logger.info(f'Pending migration {version:04d} {name}')
+      logger.info(f'{len(pending)} pending migrations')
+      return
+   for version, name in apply_migrations(session, target=target):
+      logger.info(f'Applied migration {version:04d} {name}')
+   # A database upgraded from the original schema gets empty materialized tables
+   if session.execute(text('select count(*) from transaction_facts')).scalar() == 0 \
+         and session.execute(text('select count(*) from transactions')).scalar() > 0:
+      logger.warning('transaction_facts is empty, run rebuild-transaction-facts and rebuild-trading-days')
+   invalidate_responses()
+
+@app.command("explain-reports")
+def explain_reports(analyze: bool = Option(False, help="Run the queries with ANALYZE for actual row counts instead of estimates"),
+                    repeat: int = Option(3, help="Timed runs per query, the median is reported"),
+                    min_rows: int = Option(DEFAULT_MIN_ROWS, help="Only flag full scans of tables with at least this many rows"),
+                    apply: bool = Option(False, "--migrate", help="Time the queries, apply pending migrations and time them again"),
+                    plans: bool = Option(False, help="Print the full plan of every query")):
+   """
+   Audit the query plans of the lib/sql reports and the views, flagging full table and index scans
+   """
+   session = db_instance.get_session()
+   queries = report_queries()
+   results = audit(session, queries, analyze, repeat, min_rows)
+   summary = pd.DataFrame([{'query': r['query'],
+                            'seconds': r['seconds'],
+                            'rows': r['rows'],
+                            'full_scans': ', '.join(r['full_scans']) or r['error'] or ''} for r in results])
+   if apply:
+      for version, name in apply_migrations(session):
+         logger.info(f'Applied migration {version:04d} {name}')
+      after = audit(session, queries, analyze, repeat, min_rows)
+      summary['seconds_after'] = [r['seconds'] for r in after]
+      summary['speedup'] = summary['seconds'] / summary['seconds_after']
+      summary['full_scans_after'] = [', '.join(r['full_scans']) or r['error'] or '' for r in after]
+      results = after
+   if plans:
+      for r in results:
+         print(f"\n{r['query']}")
+         print(pd.DataFrame(r['plan']).to_string(index=False) if r['plan'] else r['error'])
+   print(summary.to_string(index=False))
+   flagged = sum(1 for r in results if r['full_scans'])
+   logger.info(f'{flagged} of {len(results)} queries read a table or index in full')
+
+@app.command("seed-synthetic")
+def seed_synthetic_data(transactions: int = Option(100000, help="Synthetic transactions to insert"),
+                        accounts: int = Option(3, help="Synthetic accounts to spread them over"),
+                        start_year: int = Option(2023, help="First year of trade dates"),
+                        seed: int = Option(0, help="Random seed"),
+                        purge: bool = Option(False, help="Delete the synthetic accounts and their data instead"),
+                        chunk_size: int = Option(DEFAULT_CHUNK_SIZE, help="Rows per multi-row INSERT")):
    """
-   Transform and load security details
+   Fill a scratch database with synthetic option trades for explain-reports timings.
+   Point db_name at the scratch database in the environment, it takes precedence over .env.
    """
    session = db_instance.get_session()
-   symbol = instrument.get('symbol')
-   description = instrument.get('description')
-   exchange = instrument.get('exchange')
-   asset_type = instrument.get('assetType')
-   underlying_symbol = instrument.get('underlyingSymbol')
-
-   # Check if the security already exists
-   security = session.query(Security).filter_by(description=description).first()
-
-   if security:
-      # Return the symbol if the security already exists
-      return {'symbol': symbol, 'status': 'exists'}
+   start = perf_counter()
+   if purge:
+      logger.info(f'Purged {purge_synthetic(session)} synthetic accounts in {perf_counter() - start:.2f}s')
    else:
-      # Create new security
-      security = Security(
-         symbol=symbol,
-         description=description,
-         exchange=exchange,
-         asset_type=asset_type,
-      )
-      session.add(security)
-      session.commit()
-      return {'symbol': symbol, 'status': 'created'}
-   
+      rows = seed_synthetic(session, transactions, accounts, start_year, seed=seed, chunk_size=chunk_size)
+      logger.info(f"Seeded {', '.join(f'{count} {table}' for table, count in rows.items())} in {perf_counter() - start:.2f}s")
+   invalidate_responses()
+
 @app.command()
 def generate_requirements():
    """
@@ -277,19 +796,28 @@ def generate_requirements():
    with open('requirements.txt', 'w') as f:
       f.write(filtered_requirements)
 
-def store_orders(account_id: int, orders: list) -> dict:
+def store_orders(account_id: int, orders: list, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
    """
    Transform and load orders.  
-   Orders can change status so we need to update db rows if api status != db status
+   Orders can change status so we need to update db rows if api status != db status.
+   Incoming orders are diffed against the stored (account_id, order_id, status) and
+   new or changed orders and their legs are upserted with multi-row statements
+   and committed once for the whole batch.
    """
    session = db_instance.get_session()
-   existing_orders = get_orders_from_db()
 
+   # The API can return the same order twice when windows overlap, the last one wins
+   orders = {order_json.get('orderId'): order_json for order_json in orders}
+   with metrics.stage('orders.existing'):
+      existing_orders = get_orders_from_db(account_id, set(orders))
+
+   order_batch = ColumnBatch(Order.__table__)
+   order_item_batch = ColumnBatch(OrderItem.__table__)
    skipped_orders = 0
    updated_orders = 0
    new_orders = 0
-   for order_json in orders:
-      order_id = order_json.get('orderId')
+   transform_start = perf_counter()
+   for order_id, order_json in orders.items():
       status = order_json.get('status')
 
       if order_id in existing_orders and existing_orders[order_id] == status:
@@ -297,40 +825,35 @@ def store_orders(account_id: int, orders: list) -> dict:
          # Skip
          skipped_orders += 1
          continue
-      elif order_id in existing_orders and existing_orders[order_id] != status:
+      elif order_id in existing_orders:
          # Order exists in the db and status has changed
-         # Delete the order from the db and insert the the updated one from the API
-         # Rows in order_items table will be deleted by the cascade delete
-         session.query(Order).filter(Order.order_id == order_id).delete()
-         session.commit()
          updated_orders += 1
       else:
          # Order does not exist in the db
          new_orders += 1
 
-      order = Order(
+      order = dict(
             account_id = account_id,
             entered_time = datetime.strptime(order_json.get('enteredTime'),"%Y-%m-%dT%H:%M:%S%z"),
-            order_id = order_json.get('orderId'),
+            order_id = order_id,
             order_type = order_json.get('orderType'),
             quantity = order_json.get('quantity'),
             filled_quantity = order_json.get('filledQuantity'),
             remaining_quantity = order_json.get('remainingQuantity'),
             requested_destination = order_json.get('requestedDestination'),
             order_strategy_type = order_json.get('orderStrategyType'),
-            status = order_json.get('status'),
+            status = status,
             price = order_json.get('price'),
             order_duration = order_json.get('orderDuration'),
             order_class = order_json.get('orderClass')
       )
       if 'cancelTime' in order_json:
-         order.cancel_time = datetime.strptime(order_json['cancelTime'], "%Y-%m-%dT%H:%M:%S%z")
+         order['cancel_time'] = datetime.strptime(order_json['cancelTime'], "%Y-%m-%dT%H:%M:%S%z")
 
       if 'closeTime' in order_json:
-         order.close_time = datetime.strptime(order_json['closeTime'], "%Y-%m-%dT%H:%M:%S%z")
+         order['close_time'] = datetime.strptime(order_json['closeTime'], "%Y-%m-%dT%H:%M:%S%z")
 
-      session.add(order)
-      session.commit()
+      order_batch.append(order)
 
       for order_item in order_json['orderLegCollection']:
          strike_price = None
@@ -343,7 +866,7 @@ def store_orders(account_id: int, orders: list) -> dict:
          else:
             multiplier = 1
 
-         order_item = OrderItem(
+         order_item_batch.append(dict(
             account_id = account_id,
             order_id = order_id,
             order_leg_type = order_item.get('orderLegType'),
@@ -359,19 +882,41 @@ def store_orders(account_id: int, orders: list) -> dict:
             strike_price = strike_price,
             multiplier = multiplier,
             order_item_id = order_item.get('legId')
-         )
-         session.add(order_item)
-
-   session.commit()
+         ))
+
+   metrics.record('orders.transform', perf_counter() - transform_start)
+   metrics.count('orders.new', new_orders)
+   metrics.count('orders.updated', updated_orders)
+   metrics.count('orders.skipped', skipped_orders)
+
+   # Orders go first so the order_items foreign key is satisfied
+   with metrics.stage('orders.insert'):
+      insert_batch(session, order_batch, chunk_size, update_columns=non_key_columns(Order))
+      insert_batch(session, order_item_batch, chunk_size, update_columns=non_key_columns(OrderItem))
+   # transaction_facts carries the order close time
+   with metrics.stage('orders.refresh_facts'):
+      refresh_order_facts(session, account_id, order_batch.columns['order_id'])
+   if len(order_batch):
+      bump_generation(session, account_id)
+   with metrics.stage('orders.commit'):
+      session.commit()
    return {'new_orders': new_orders, 'updated_orders': updated_orders, 'skipped_orders': skipped_orders}
 
-def store_positions(account_id, positions_json: str):
+def non_key_columns(model) -> list:
    """
-   Transform and load positions
+   Names of the columns of a model that are not part of its primary key
+   """
+   return [c.name for c in model.__table__.columns if not c.primary_key]
+
+def store_positions(account_id, positions_json: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+   """
+   Transform and load positions.
+   Each poll is an append-only snapshot, a header row plus bulk inserted positions,
+   and the account's latest_positions pointer is swapped to it in the same commit.
    """
 
    session = db_instance.get_session()
-   date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+   date = datetime.now().replace(microsecond=0)
 
    if account_id is None:
       logger.error(f'Account ID {positions_json["securitiesAccount"]["accountNumber"]} not found in the database. Skipping')
@@ -380,13 +925,21 @@ def store_positions(account_id, positions_json: str):
       logger.error(f'No positions found in the response. Skipping')
       return
 
-   # Reset the latest positions in the database
-   reset_latest_positions(account_id)
+   snapshot = PositionSnapshot(account_id = account_id,
+                               date = date,
+                               position_count = len(positions_json['securitiesAccount']['positions']))
+   session.add(snapshot)
+   session.flush()  # Assigns snapshot_id
 
-   for i, position_json in enumerate(positions_json['securitiesAccount']['positions']):
+   position_batch = ColumnBatch(Position.__table__)
+   equity_symbols = set()
+   equity_cusips = set()
+   transform_start = perf_counter()
+   for position_json in positions_json['securitiesAccount']['positions']:
 
-      position = Position(
+      position = dict(
          account_id = account_id,
+         snapshot_id = snapshot.snapshot_id,
          date = date,
          short_quantity = position_json['shortQuantity'],
          long_quantity = position_json['longQuantity'],
@@ -402,167 +955,183 @@ def store_positions(account_id, positions_json: str):
          description = position_json['instrument'].get('description'),
          variable_rate = position_json['instrument'].get('variableRate'),
          net_change = position_json['instrument'].get('netChange',0),
-         latest = 'Y'
+         latest = 'N'  # Superseded by the latest_positions pointer
       )
       if 'maturityDate' in position_json['instrument']:
-         position.maturity_date = datetime.strptime(position_json['instrument'].get('maturityDate'), "%Y-%m-%dT%H:%M:%S.%f%z")
-      if position.asset_type == 'COLLECTIVE_INVESTMENT':
-         position.asset_type = 'EQUITY'
-      session.add(position)
-      # Get and store the security details in the database
-      if position.asset_type == 'EQUITY' or position.asset_type == 'COLLECTIVE_INVESTMENT':
-         if position.cusip is not None:
-            get_security(cuspid=position.cusip)
-         elif position.symbol is not None:
-            get_security(symbol=position.symbol)
-
-
-   session.commit()
-   return {'positions': i}
+         position['maturity_date'] = datetime.strptime(position_json['instrument'].get('maturityDate'), "%Y-%m-%dT%H:%M:%S.%f%z")
+      if position['asset_type'] == 'COLLECTIVE_INVESTMENT':
+         position['asset_type'] = 'EQUITY'
+      position_batch.append(position)
+      # Collect the securities so their details can be cached in one pass
+      if position['asset_type'] == 'EQUITY':
+         if position['cusip'] is not None:
+            equity_cusips.add(position['cusip'])
+         elif position['symbol'] is not None:
+            equity_symbols.add(position['symbol'])
+
+   metrics.record('positions.transform', perf_counter() - transform_start)
+   metrics.count('positions', len(position_batch))
+
+   with metrics.stage('positions.insert'):
+      changed = snapshot_changed(session, account_id, position_batch)
+      insert_batch(session, position_batch, chunk_size)
+      point_latest(session, account_id, snapshot.snapshot_id)
+
+   # Get and store the security details in the database
+   with metrics.stage('securities.lookup'):
+      security_cache.get_many(symbols=equity_symbols, cusips=equity_cusips)
+
+   # Reports and transactions do not read positions, and a poll that changed nothing invalidates nothing
+   if changed:
+      bump_generation(session, account_id, scope=POSITIONS)
+   with metrics.stage('positions.commit'):
+      session.commit()
+   return {'positions': len(position_batch), 'snapshot_id': snapshot.snapshot_id}
 
-def store_transactions(account_id: int, transactions: list) -> dict:
+def store_transactions(account_id: int, transactions: list, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
    """
-   Transform and load transactions
+   Transform and load transactions.
+   The whole page is transformed into column oriented batches which are written
+   with multi-row inserts of chunk_size rows and committed once.
    """
    session = db_instance.get_session()
-   existing_transactions = get_transactions_from_db()
+   start = perf_counter()
+
+   # Only look up the IDs in this page, scoped to the account and the page's date window
+   with metrics.stage('transactions.existing'):
+      trade_dates = [datetime.strptime(t['tradeDate'], "%Y-%m-%dT%H:%M:%S%z").date() for t in transactions]
+      existing_transactions = get_transactions_from_db(account_id,
+                                                       {int(t['activityId']) for t in transactions},
+                                                       min(trade_dates, default=None),
+                                                       max(trade_dates, default=None))
+
+   transaction_batch = ColumnBatch(Transaction.__table__)
+   item_batch = ColumnBatch(TransactionItem.__table__)
+   batch_transactions = set()
 
    skipped_transactions = 0
    new_transactions = 0
+   # Time per loader, summed locally and recorded once per page to keep the loop cheap
+   load_seconds = dict.fromkeys(TRANSACTION_ITEM_LOADERS, 0.0)
+   transform_start = perf_counter()
    for transaction_json in transactions:
-      if int(transaction_json['activityId']) in existing_transactions:
+      transaction_id = int(transaction_json['activityId'])
+      if transaction_id in existing_transactions or transaction_id in batch_transactions:
          skipped_transactions += 1
          continue
-
-      transaction = Transaction(
-         transaction_id = transaction_json['activityId'],
-         account_id = account_id,
-         date = datetime.strptime(transaction_json['tradeDate'], "%Y-%m-%dT%H:%M:%S%z"),
-         type = transaction_json['type'],
-         status = transaction_json['status'],
-         amount = transaction_json['netAmount'],
-         order_id = transaction_json.get('orderId'),
-         description = transaction_json.get('description'),
-         position_id = transaction_json.get('positionId')
-      )
-      session.add(transaction)
+      batch_transactions.add(transaction_id)
+
+      transaction = {
+         'transaction_id': transaction_id,
+         'account_id': account_id,
+         'date': datetime.strptime(transaction_json['tradeDate'], "%Y-%m-%dT%H:%M:%S%z"),
+         'type': transaction_json['type'],
+         'status': transaction_json['status'],
+         'amount': transaction_json['netAmount'],
+         'order_id': transaction_json.get('orderId'),
+         'description': transaction_json.get('description'),
+         'position_id': transaction_json.get('positionId')
+      }
+      transaction_batch.append(transaction)
       new_transactions += 1
 
       for transferItem in transaction_json['transferItems']:
          assetType = transferItem['instrument']['assetType']
-         load_dividend_or_interest(transaction, transferItem, assetType)
-         load_fee(transaction, transferItem, assetType)
-         load_option(transaction, transferItem, assetType)
-         load_future(transaction, transferItem, assetType)
-         load_equity(transaction, transferItem, assetType)
-         load_fixed_income(transaction, transferItem, assetType)
-   session.commit()
-   return {'new_transactions': new_transactions, 'skipped_transactions': skipped_transactions}
+         for load in TRANSACTION_ITEM_LOADERS:
+            load_start = perf_counter()
+            transaction_item = load(transaction, transferItem, assetType)
+            load_seconds[load] += perf_counter() - load_start
+            if transaction_item is not None:
+               item_batch.append(transaction_item)
+   metrics.record('transactions.transform', perf_counter() - transform_start)
+   for load, seconds in load_seconds.items():
+      metrics.record(f'transactions.{load.__name__}', seconds)
+   metrics.count('transactions.new', new_transactions)
+   metrics.count('transactions.skipped', skipped_transactions)
+   metrics.count('transaction_items', len(item_batch))
 
-def load_dividend_or_interest(transaction: dict, transferItem: dict, assetType: str):
+   # Store the security details in the database to provide a way to lookup the security by description
+   # This is necessary because dividend transactions do not include the symbol for reasons unbeknownst to me
+   with metrics.stage('securities.lookup'):
+      securities = security_cache.get_many(symbols={symbol for symbol, asset_type in zip(item_batch.columns['symbol'], item_batch.columns['asset_type'])
+                                                    if asset_type in ('EQUITY', 'COLLECTIVE_INVESTMENT')})
+      classifier.update_index({security['description']: security['symbol'] for security in securities.values()})
+
+   # Transactions go first so the transaction_items foreign key is satisfied
+   with metrics.stage('transactions.insert'):
+      rows = insert_batch(session, transaction_batch, chunk_size, ignore_duplicates=True)
+      rows += insert_batch(session, item_batch, chunk_size)
+   with metrics.stage('transactions.refresh_facts'):
+      refresh_transaction_facts(session, transaction_batch.columns['transaction_id'])
+      refresh_trading_days(session, transaction_batch.columns['transaction_id'])
+   if new_transactions:
+      bump_generation(session, account_id)
+   with metrics.stage('transactions.commit'):
+      session.commit()
+
+   elapsed = perf_counter() - start
+   rows_per_sec = rows / elapsed if elapsed > 0 else 0
+   logger.info(f'Inserted {rows} rows in {elapsed:.2f}s ({rows_per_sec:,.0f} rows/sec)')
+   return {'new_transactions': new_transactions, 'skipped_transactions': skipped_transactions, 'rows_per_sec': rows_per_sec}
+
+def load_dividend_or_interest(transaction: dict, transferItem: dict, assetType: str) -> dict:
 
    """
    transform activity of type dividend_or_interest to a transaction item
    """
 
-   session = db_instance.get_session()
-   if transaction.type != 'DIVIDEND_OR_INTEREST':
-      return
-
-   transaction_item = TransactionItem(transaction_id = transaction.transaction_id,
-                                       asset_type = assetType,
-                                       transaction = 'DIVIDEND',
-                                       amount = transferItem['amount'],
-                                       extended_amount = transferItem['amount'],
-                                       quantity = 0)
-                                      
-   # Schwab lumps interest and dividend transactions together
-   # so we need to check the description to see if it is a dividend or interest transaction
-   interest_patterns = [
-      r'FREE BALANCE INTEREST ADJUSTMENT~NO DESCRIPTION',
-      r'OFF-CYCLE INTEREST~MMDA1',
-      r'MARGIN INTEREST ADJUSTMENT~NO DESCRIPTION',
-      r'INTEREST INCOME - SECURITIES~.*',
-      r'Free Balance Interest Adjustment',
-      r'Interest Income - Securities',
-      r'BANK INT.*',
-      r'SCHWAB1 INT.*',
-   ]
-   if any(re.match(pattern, transaction.description, re.IGNORECASE) for pattern in interest_patterns):
-      transaction_item.transaction = 'INTEREST'
-   else:
-      transaction_item.transaction = 'DIVIDEND'
-
-   # Check to see if description contains the word interest
-   if 'interest' in transaction.description.lower() or transaction.description.lower().startswith('bank int'):
-      transaction_item.transaction = 'INTEREST'
-   else:
-         transaction_item.transaction = 'DIVIDEND'
+   if transaction['type'] != 'DIVIDEND_OR_INTEREST':
+      return None
 
-   # Set the symbol and underlying.  
+   # Schwab lumps interest and dividend transactions together so the description decides the type.
    # It would be nice if Schwab included the symbol in the transaction but they don't for 
-   # DIVIDEND_OR_INTEREST transactions
-
-   symbol = lookup_symbol(transaction.description)
+   # DIVIDEND_OR_INTEREST transactions so it is parsed from the description or looked up in securities
+   transaction_type, symbol = classifier.classify(transaction['description'])
+
+   transaction_item = dict(transaction_id = transaction['transaction_id'],
+                           asset_type = assetType,
+                           transaction = transaction_type,
+                           amount = transferItem['amount'],
+                           extended_amount = transferItem['amount'],
+                           quantity = 0)
    if symbol is not None:
-         transaction_item.symbol = symbol
-         transaction_item.underlying = symbol
+         transaction_item['symbol'] = symbol
+         transaction_item['underlying'] = symbol
    
-   session.add(transaction_item)
-   return
+   return transaction_item
 
-def load_fee(transaction: Transaction, transferItem: dict, assetType: str):
-   session = db_instance.get_session()
-   if transaction.type != 'TRADE' or assetType != 'CURRENCY':
-      return
+def load_fee(transaction: dict, transferItem: dict, assetType: str) -> dict:
+   if transaction['type'] != 'TRADE' or assetType != 'CURRENCY':
+      return None
 
-   transaction_item = TransactionItem(transaction_id = transaction.transaction_id,
-                                       asset_type = assetType,
-                                       transaction = 'FEE',
-                                       amount = transferItem['amount'],
-                                       extended_amount = transferItem['amount'],
-                                       quantity = 0)
+   transaction_item = dict(transaction_id = transaction['transaction_id'],
+                           asset_type = assetType,
+                           transaction = 'FEE',
+                           amount = transferItem['amount'],
+                           extended_amount = transferItem['amount'],
+                           quantity = 0)
    if 'feeType' in transferItem:
-      transaction_item.description = transferItem['feeType']
+      transaction_item['description'] = transferItem['feeType']
    else:
-      transaction_item.description = 'Not Specified'
-   session.add(transaction_item)
-   return
+      transaction_item['description'] = 'Not Specified'
+   return transaction_item
 
-def lookup_symbol(description: str) -> str:
+def load_option(transaction: dict, transferItem: dict, assetType: str) -> dict:
 
-   session = db_instance.get_session()
-   # Parse symbol and underlying from the description
-   for keyword in ('dividend~', 'foreign tax withheld~'):
-      if keyword in description.lower():
-         parts = description.split('~')
-         if len(parts) > 1:
-               return parts[1].strip()
-
-   # Lookup the symbol in the securities table
-   security = session.query(Security).filter_by(description=description).first()
-   if security:
-      return security.symbol
-
-   return None
-
-def load_option(transaction: Transaction, transferItem: dict, assetType: str):
-
-   session = db_instance.get_session()
    if assetType != 'OPTION':
-      return
+      return None
   
-   transaction_item = TransactionItem(transaction_id = transaction.transaction_id,
-                                       asset_type = transferItem['instrument']['putCall'],
-                                       transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
-                                       amount = transferItem['price'],
-                                       extended_amount = transferItem['cost'],
-                                       quantity = abs(transferItem['amount']),
-                                       symbol = transferItem['instrument']['symbol'],
-                                       description = transferItem['instrument']['description'],
-                                       strike_price = transferItem['instrument']['strikePrice'],
-                                       underlying = transferItem['instrument']['underlyingSymbol'],
-                                       position_effect = transferItem.get('positionEffect'))
+   transaction_item = dict(transaction_id = transaction['transaction_id'],
+                           asset_type = transferItem['instrument']['putCall'],
+                           transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
+                           amount = transferItem['price'],
+                           extended_amount = transferItem['cost'],
+                           quantity = abs(transferItem['amount']),
+                           symbol = transferItem['instrument']['symbol'],
+                           description = transferItem['instrument']['description'],
+                           strike_price = transferItem['instrument']['strikePrice'],
+                           underlying = transferItem['instrument']['underlyingSymbol'],
+                           position_effect = transferItem.get('positionEffect'))
 
    if 'expirationDate' in transferItem['instrument']:
       if transferItem['instrument'].get('status') == 'DISABLED':
@@ -570,91 +1139,96 @@ def load_option(transaction: Transaction, transferItem: dict, assetType: str):
          # Symbol looks like NFLX_041924P550
          symbol_parts = transferItem['instrument']['symbol'].split('_')
          date_str = symbol_parts[1][:6]  # Get the first 6 characters after the underscore
-         transaction_item.expiration_date = datetime.strptime(date_str, "%m%d%y")
+         transaction_item['expiration_date'] = datetime.strptime(date_str, "%m%d%y")
       else:
-         transaction_item.expiration_date = datetime.strptime(transferItem['instrument']['expirationDate'],"%Y-%m-%dT%H:%M:%S%z")
+         transaction_item['expiration_date'] = datetime.strptime(transferItem['instrument']['expirationDate'],"%Y-%m-%dT%H:%M:%S%z")
 
-   session.add(transaction_item)
-   return
+   return transaction_item
 
-def load_future(transaction: Transaction, transferItem: dict, assetType: str):
+def load_future(transaction: dict, transferItem: dict, assetType: str) -> dict:
 
-   session = db_instance.get_session()
    if assetType != 'FUTURE':
-      return
+      return None
   
-   transaction_item = TransactionItem(transaction_id = transaction.transaction_id,
-                                       asset_type = transferItem['instrument']['assetType'],
-                                       transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
-                                       amount = transferItem['price'],
-                                       extended_amount = transferItem['cost'],
-                                       quantity = abs(transferItem['amount']),
-                                       symbol = transferItem['instrument']['symbol'],
-                                       description = transferItem['instrument']['description'])
+   transaction_item = dict(transaction_id = transaction['transaction_id'],
+                           asset_type = transferItem['instrument']['assetType'],
+                           transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
+                           amount = transferItem['price'],
+                           extended_amount = transferItem['cost'],
+                           quantity = abs(transferItem['amount']),
+                           symbol = transferItem['instrument']['symbol'],
+                           description = transferItem['instrument']['description'])
 
    if 'expirationDate' in transferItem['instrument']:
-         transaction_item.expiration_date = datetime.strptime(transferItem['instrument']['expirationDate'],"%Y-%m-%dT%H:%M:%S%z")
+         transaction_item['expiration_date'] = datetime.strptime(transferItem['instrument']['expirationDate'],"%Y-%m-%dT%H:%M:%S%z")
 
-   session.add(transaction_item)
-   return
+   return transaction_item
 
 
 
-def load_equity(transaction: Transaction, transferItem: dict, assetType: str):
+def load_equity(transaction: dict, transferItem: dict, assetType: str) -> dict:
 
-   session = db_instance.get_session()
    if assetType not in ('EQUITY', 'COLLECTIVE_INVESTMENT'):
-      return
-
-   transaction_item = TransactionItem(transaction_id = transaction.transaction_id,
-                                       asset_type = assetType,
-                                       transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
-                                       amount = transferItem['price'],
-                                       extended_amount = transferItem['cost'],
-                                       quantity = abs(transferItem['amount']),
-                                       symbol = transferItem['instrument'].get('symbol'),
-                                       underlying = transferItem['instrument'].get('symbol'))
-   session.add(transaction_item)
-
+      return None
 
-   # Store the security details in the database to provide a way to lookup the security by description
-   # This is necessary because dividend transactions do not include the symbol for reasons unbeknownst to me
-   security = get_security(transaction_item.symbol, projection='instrument')
-   return
+   transaction_item = dict(transaction_id = transaction['transaction_id'],
+                           asset_type = assetType,
+                           transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
+                           amount = transferItem['price'],
+                           extended_amount = transferItem['cost'],
+                           quantity = abs(transferItem['amount']),
+                           symbol = transferItem['instrument'].get('symbol'),
+                           underlying = transferItem['instrument'].get('symbol'))
+   return transaction_item
 
-def load_fixed_income(transaction: Transaction, transferItem: dict, assetType: str):
+def load_fixed_income(transaction: dict, transferItem: dict, assetType: str) -> dict:
 
-   session = db_instance.get_session()
    if assetType != 'FIXED_INCOME':
-      return
+      return None
 
-   transaction_item = TransactionItem(transaction_id = transaction.transaction_id,
-                                       asset_type = assetType,
-                                       transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
-                                       extended_amount = transferItem['cost'],
-                                       quantity = abs(transferItem['amount']),
-                                       symbol = transferItem['instrument']['symbol'],
-                                       description = transferItem['instrument']['description'])
+   transaction_item = dict(transaction_id = transaction['transaction_id'],
+                           asset_type = assetType,
+                           transaction = 'BUY' if transferItem['amount'] > 0 else 'SELL',
+                           extended_amount = transferItem['cost'],
+                           quantity = abs(transferItem['amount']),
+                           symbol = transferItem['instrument']['symbol'],
+                           description = transferItem['instrument']['description'])
 
    maturity_date = transferItem['instrument'].get('maturityDate')
    if maturity_date:
-      transaction_item.expiration_date = datetime.strptime(maturity_date, "%Y-%m-%dT%H:%M:%S%z")
+      transaction_item['expiration_date'] = datetime.strptime(maturity_date, "%Y-%m-%dT%H:%M:%S%z")
    multiplier = transferItem['instrument'].get('multiplier', 1)
-   transaction_item.multiplier = multiplier
-   transaction_item.amount = transferItem['price'] * multiplier
-   session.add(transaction_item)
-   return
+   transaction_item['amount'] = transferItem['price'] * multiplier
+   return transaction_item
+
+# Each transfer item is offered to every loader, the one matching its type returns the item
+TRANSACTION_ITEM_LOADERS = (load_dividend_or_interest, load_fee, load_option, load_future, load_equity, load_fixed_income)
 
-def get_transactions_from_db() -> list:
+def get_transactions_from_db(account_id: int, transaction_ids: set, start_date=None, end_date=None) -> set:
    """
-   Get transaction IDs from the database using SQLAlchemy ORM.
+   Get the subset of transaction_ids that already exist in the database for the account.
+   Uses a single IN (...) query bounded by the batch's date window so the cost
+   scales with the batch size rather than the size of the transactions table.
    """
+   if not transaction_ids:
+      return set()
+
    session = db_instance.get_session()
-   # Query the database directly using the Account model
-   transaction_query = session.query(Transaction.transaction_id).all()
+   query = session.query(Transaction.transaction_id).filter(Transaction.account_id == account_id,
+                                                            Transaction.transaction_id.in_(transaction_ids))
+   if start_date is not None:
+      query = query.filter(Transaction.date >= start_date)
+   if end_date is not None:
+      query = query.filter(Transaction.date <= end_date)
+
+   return {id[0] for id in query.all()}
 
-   # Convert the query result to a list
-   return [id[0] for id in transaction_query]
+def get_account_ids() -> dict:
+   """
+   Get account number to account id from the database
+   """
+   session = db_instance.get_session()
+   return {account_number: account_id for account_number, account_id in session.query(Account.account_number, Account.account_id).all()}
 
 def get_accounts() -> dict:
       """
@@ -669,7 +1243,7 @@ def get_accounts() -> dict:
 
       # Get account hashes from API
       try:
-         resp = client.account_linked()
+         resp = send_request(client.account_linked, 'account_linked')
          resp.raise_for_status()  # Raises an HTTPError if the response was an error
          linked_accounts = resp.json()
       except requests.exceptions.HTTPError as e:
@@ -692,30 +1266,20 @@ def get_accounts() -> dict:
          accounts[account_number] = {'account_id': account_id, 'account_hash': account_hash}
       return accounts
 
-def get_orders_from_db() -> dict:
+def get_orders_from_db(account_id: int, order_ids: set) -> dict:
    """
-   Get order IDs and status from the database
+   Get the status of the given order IDs that already exist in the database for the account
    """
+   if not order_ids:
+      return {}
+
    session = db_instance.get_session()
-   # Query the database directly using the Account model
-   orders_query = session.query(Order.order_id, Order.status).all()
+   orders_query = session.query(Order.order_id, Order.status).filter(Order.account_id == account_id,
+                                                                     Order.order_id.in_(order_ids)).all()
 
    # Convert the query result to a dictionary
    return  {order_id: status for order_id, status in orders_query}
 
-def reset_latest_positions(account_id: int ):
-   """
-   Reset the latest positions in the database using SQLAlchemy ORM
-   """
-   session = db_instance.get_session()
-   if account_id is None:
-      logger.error(f'Account ID {account_id} not found in the database. Skipping')
-      return
-   
-   session.query(Position).filter(Position.account_id == account_id).update({Position.latest: 'N'})
-   session.commit()
-   return
-
 def set_log_file(logger: logging.Logger, filename: str):
     # Create a file handler
     handler = logging.FileHandler(filename)
@@ -751,76 +1315,29 @@ def get_client_and_sync_tokens() -> schwabdev.Client:
     """
     Get the Schwab API client and sync the bearer tokens
     """
+    global token_sync
+
+    def create_client():
+        return schwabdev.Client(os.getenv('appKey'), os.getenv('appSecret'))
+
     # Check if we are using a hashi vault and sync tokens
     # This allows the theta_burn to run in multiple instances and share the same tokens
-
-    if os.getenv('VAULT_URL') is not None:
-        vault_url = os.getenv('VAULT_URL')
-        vault_token = os.getenv('VAULT_TOKEN')
-        vault_mount = os.getenv('VAULT_MOUNT', 'secret')
-        path = 'theta_burn_tokens_json'
-
-        vault_client = hvac.Client(url=vault_url, token=vault_token)
-        
-        # Check if the secret engine is already enabled
-        try:
-            vault_client.sys.read_mount_configuration(path='kv')
-            logger.info('Secrets engine at path "kv" is already enabled.')
-        except hvac.exceptions.InvalidPath:
-            # Enable the secrets engine if it's not already enabled
-            vault_client.sys.enable_secrets_engine(backend_type='kv', path='kv')
-        try:
-            secret_metadata = vault_client.secrets.kv.v2.read_secret_metadata(path=path, mount_point=vault_mount)
-            kv_token_json = vault_client.secrets.kv.v2.read_secret_version(path=path, mount_point=vault_mount, raise_on_deleted_version=False)
-            kv_access_token_issued = kv_token_json['data']['data']['access_token_issued']
-
-            # Convert kv_access_token_issued to a datetime object
-            kv_access_token_issued = datetime.fromisoformat(kv_access_token_issued)
-
-
-            # Construct the absolute path to the tokens.json file
-            tokens_file_path = os.path.join(".", 'tokens.json')
-
-            # Check if the tokens.json file exists
-            if os.path.exists(tokens_file_path):
-                  with open(tokens_file_path, 'r') as f:
-                     tokens = json.load(f)
-                  file_access_token_issued = tokens['access_token_issued']
-
-                  # Convert file_access_token_issued to a datetime object
-                  file_access_token_issued = datetime.fromisoformat(file_access_token_issued)
-
-                  # Ensure both datetime objects are aware
-                  if kv_access_token_issued.tzinfo is None:
-                     kv_access_token_issued = kv_access_token_issued.replace(tzinfo=pytz.UTC)
-                  if file_access_token_issued.tzinfo is None:
-                     file_access_token_issued = file_access_token_issued.replace(tzinfo=pytz.UTC)
-
-                  if kv_access_token_issued and file_access_token_issued:
-                     # Compare the created time of the tokens.json file and the secret in vault
-                     if kv_access_token_issued > file_access_token_issued:
-                        # The secret in vault is newer
-                        logger.info('The secret in vault is newer than the tokens.json file. Updating the tokens.json file')
-                        secret = vault_client.secrets.kv.v2.read_secret_version(path=path, mount_point='kv')
-                        # Update the tokens.json file
-                        with open(tokens_file_path, 'w') as f:
-                              json.dump(secret['data']['data'], f)
-        except hvac.exceptions.InvalidPath:
-            logger.error(f'Secret metadata for path "{path}" not found in Vault at mount point "{vault_mount}".')
-        except Exception as e:
-            logger.error(f'An error occurred: {e}')
-            logger.error(traceback.format_exc())
-    
-    # Get the Schwab API client     
-    client = schwabdev.Client(os.getenv('appKey'), os.getenv('appSecret'))
-    if vault_url is not None and os.path.exists(tokens_file_path):
-        # Update the vault with the new token
-        with open(tokens_file_path, 'r') as f:
-            tokens = json.load(f)
-        logger.info('Updating the vault with the new tokens')
-        vault_client.secrets.kv.v2.create_or_update_secret(path=path, secret=tokens, mount_point='kv')
-
-    return client
+    if not os.getenv('VAULT_URL'):
+        return create_client()
+
+    vault_client = hvac.Client(url=os.getenv('VAULT_URL'), token=os.getenv('VAULT_TOKEN'))
+    token_sync = TokenSync(vault_client, mount=os.getenv('VAULT_MOUNT') or DEFAULT_VAULT_MOUNT,
+                           margin=timedelta(seconds=float(os.getenv('token_refresh_margin_seconds', DEFAULT_REFRESH_MARGIN.total_seconds()))))
+    try:
+        client, outcome = token_sync.client(create_client, lambda client: client.tokens.update_access_token())
+        logger.info(f'Tokens {outcome}, {token_sync.vault_calls} vault calls')
+        return client
+    except Exception as e:
+        # Vault being down must not stop a run that has usable local tokens
+        logger.error(f'Token sync with vault failed: {e}')
+        logger.error(traceback.format_exc())
+        token_sync = None
+        return create_client()
 
 
 if __name__ == '__main__':
@@ -850,5 +1367,19 @@ if __name__ == '__main__':
    except Exception as e:  # Catch all exceptions
       logger.error(f'An error occurred: {e}')
    finally:
+      # Run summary
+      cache_stats = security_cache.stats()
+      if any(cache_stats.values()):
+         logger.info(f'Security cache: {cache_stats}')
+      logger.info(f'Database pool: {db_instance.pool_stats()}')
+
+      # Push tokens schwabdev refreshed during the run so the other instances pick them up
+      if token_sync is not None:
+         try:
+            if token_sync.publish():
+               logger.info('Published refreshed tokens to vault')
+         except Exception as e:
+            logger.error(f'Token publish to vault failed: {e}')
+
       # Close the database connection      
       db_instance.close()
\ No newline at end of file
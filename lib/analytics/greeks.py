@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import numpy as np
+
+from analytics.black_scholes import price, intrinsic, norm_cdf, norm_pdf, DAYS_PER_YEAR
+from analytics.payoff import parse_occ_symbol, OPTION_MULTIPLIER
+from orm.models import Position, LatestPosition
+
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+MARKET_CLOSE_MINUTES = 16 * 60  # Options stop trading at 16:00 eastern on expiration day
+GREEKS = ('delta', 'gamma', 'theta', 'vega', 'rho')
+
+
+def greeks(spot, strike, time_to_expiry, vol, rate, is_call) -> dict:
+    """
+    Black-Scholes Greeks over arrays. theta is per calendar day, vega per
+    1 point of volatility and rho per 1% of rate, the way brokers quote them.
+    """
+    spot, strike, t, vol, is_call = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (spot, strike, time_to_expiry, vol, is_call)))
+    is_call = is_call > 0
+    t = np.maximum(t, 1e-9)
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol ** 2) * t) / (vol * sqrt_t)
+    d2 = d1 - vol * sqrt_t
+    pdf = norm_pdf(d1)
+    discount = strike * np.exp(-rate * t)
+
+    call_delta = norm_cdf(d1)
+    gamma = pdf / (spot * vol * sqrt_t)
+    vega = spot * pdf * sqrt_t
+    decay = -spot * pdf * vol / (2 * sqrt_t)
+    call_theta = decay - rate * discount * norm_cdf(d2)
+    put_theta = decay + rate * discount * norm_cdf(-d2)
+    call_rho = discount * t * norm_cdf(d2)
+    put_rho = -discount * t * norm_cdf(-d2)
+
+    return {'delta': np.where(is_call, call_delta, call_delta - 1),
+            'gamma': gamma,
+            'theta': np.where(is_call, call_theta, put_theta) / DAYS_PER_YEAR,
+            'vega': vega / 100,
+            'rho': np.where(is_call, call_rho, put_rho) / 100}
+
+
+def implied_vol(option_price, spot, strike, time_to_expiry, rate, is_call, tol: float = 1e-6, max_iter: int = 50):
+    """
+    Batched implied volatility solver.
+    Newton steps on vega, safeguarded by a bisection bracket [MIN_VOL, MAX_VOL]
+    that every step narrows, so contracts where Newton overshoots still converge.
+    Contracts priced outside the no-arbitrage bounds or already expired get NaN.
+    """
+    option_price, spot, strike, t, is_call = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (option_price, spot, strike, time_to_expiry, is_call)))
+    is_call = is_call > 0
+    lower_bound = intrinsic(spot, strike * np.exp(-rate * np.maximum(t, 0)), is_call)
+    upper_bound = np.where(is_call, spot, strike)
+    valid = (t > 0) & (option_price > lower_bound) & (option_price < upper_bound)
+
+    low = np.full(option_price.shape, MIN_VOL)
+    high = np.full(option_price.shape, MAX_VOL)
+    vol = np.full(option_price.shape, 0.2)
+    active = valid.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        index = np.flatnonzero(active)
+        sigma = vol[index]
+        diff = price(spot[index], strike[index], t[index], sigma, rate, is_call[index]) - option_price[index]
+
+        converged = np.abs(diff) < tol
+        # Too expensive means vol is too high
+        high[index] = np.where(diff > 0, sigma, high[index])
+        low[index] = np.where(diff <= 0, sigma, low[index])
+
+        vega = greeks(spot[index], strike[index], t[index], sigma, rate, is_call[index])['vega'] * 100
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = sigma - diff / vega
+        bisect = ~np.isfinite(step) | (step <= low[index]) | (step >= high[index])
+        vol[index] = np.where(converged, sigma, np.where(bisect, 0.5 * (low[index] + high[index]), step))
+        active[index] = ~converged & (high[index] - low[index] > tol)
+
+    return np.where(valid, vol, np.nan)
+
+
+def time_to_expiry(expiration, as_of: datetime):
+    """
+    Years from as_of (naive eastern time) to the close of each expiration date, floored at 0
+    """
+    close = np.asarray(expiration, dtype='datetime64[D]').astype('datetime64[m]') + np.timedelta64(MARKET_CLOSE_MINUTES, 'm')
+    days = (close - np.datetime64(as_of, 'm')) / np.timedelta64(1, 'D')
+    return np.maximum(days, 0) / DAYS_PER_YEAR
+
+
+def option_contracts(session, account_ids: list = None) -> dict:
+    """
+    Distinct option contracts of the latest positions snapshot keyed by symbol.
+    Each holds the parsed OCC fields, the underlying, the net quantity per account
+    and the mark implied by the position market value, used when no quote is available.
+    """
+    query = (session.query(Position)
+             .join(LatestPosition, LatestPosition.snapshot_id == Position.snapshot_id)
+             .filter(Position.asset_type.in_(('CALL', 'PUT'))))
+    if account_ids:
+        query = query.filter(Position.account_id.in_(account_ids))
+
+    contracts = {}
+    for position in query.all():
+        option = parse_occ_symbol(position.symbol)
+        if option is None:
+            continue
+        contract = contracts.setdefault(position.symbol, dict(option, underlying=position.underlying or option['underlying'], quantities={}, mark=None))
+        quantity = float((position.long_quantity or 0) - (position.short_quantity or 0))
+        contract['quantities'][position.account_id] = contract['quantities'].get(position.account_id, 0) + quantity
+        if quantity and position.market_value is not None:
+            contract['mark'] = abs(float(position.market_value) / (quantity * OPTION_MULTIPLIER))
+    return contracts
@@ -0,0 +1,203 @@
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from ingest.bulk import ColumnBatch, insert_batch, DEFAULT_CHUNK_SIZE
+from orm.models import Calendar
+
+DEFAULT_START_YEAR = 2000
+DEFAULT_END_YEAR = 2100
+
+# Unscheduled NYSE closures
+SPECIAL_CLOSURES = ('2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',  # September 11
+                    '2004-06-11',  # President Reagan
+                    '2007-01-02',  # President Ford
+                    '2012-10-29', '2012-10-30',  # Hurricane Sandy
+                    '2018-12-05',  # President George H.W. Bush
+                    '2025-01-09')  # President Carter
+
+CALENDAR_COLUMNS = ('date', 'year', 'quarter', 'month', 'month_name', 'short_month_name', 'day', 'week',
+                    'weekday', 'day_name', 'is_weekday', 'is_holiday', 'is_early_close', 'is_market_open')
+
+MONDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = 0, 3, 4, 5, 6
+
+
+def _weekday(days):
+    # 1970-01-01 was a Thursday, Monday is 0 like date.weekday()
+    return (days.astype('datetime64[D]').astype(np.int64) + THURSDAY) % 7
+
+
+def _month_start(years, month):
+    return ((years - 1970) * 12 + (month - 1)).astype('datetime64[M]').astype('datetime64[D]')
+
+
+def _fixed(years, month: int, day: int):
+    return _month_start(years, month) + (day - 1)
+
+
+def _nth_weekday(years, month: int, weekday: int, n: int):
+    first = _month_start(years, month)
+    return first + (weekday - _weekday(first)) % 7 + 7 * (n - 1)
+
+
+def _last_weekday(years, month: int, weekday: int):
+    last = _month_start(years, month + 1) - 1 if month < 12 else _fixed(years + 1, 1, 1) - 1
+    return last - (_weekday(last) - weekday) % 7
+
+
+def _observed(days):
+    # Saturday holidays close the Friday before, Sunday holidays the Monday after
+    weekday = _weekday(days)
+    return days - (weekday == SATURDAY) + (weekday == SUNDAY)
+
+
+def _easter(years):
+    # Anonymous Gregorian algorithm
+    a = years % 19
+    b, c = years // 100, years % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return _month_start(years, month) + (day - 1)
+
+
+def nyse_holidays(start_year: int = DEFAULT_START_YEAR, end_year: int = DEFAULT_END_YEAR) -> np.ndarray:
+    """
+    Sorted NYSE full day closures that fall on weekdays, as datetime64[D]
+    """
+    years = np.arange(start_year, end_year + 1)
+    new_year = _fixed(years, 1, 1)
+    juneteenth_years = years[years >= 2022]
+
+    holidays = np.concatenate([
+        # No closure on the Friday before a Saturday New Year's Day (NYSE rule 7.2)
+        new_year + (_weekday(new_year) == SUNDAY),
+        _nth_weekday(years[years >= 1998], 1, MONDAY, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(years, 2, MONDAY, 3),  # Washington's Birthday
+        _easter(years) - 2,  # Good Friday
+        _last_weekday(years, 5, MONDAY),  # Memorial Day
+        _observed(_fixed(juneteenth_years, 6, 19)),  # Juneteenth
+        _observed(_fixed(years, 7, 4)),  # Independence Day
+        _nth_weekday(years, 9, MONDAY, 1),  # Labor Day
+        _nth_weekday(years, 11, THURSDAY, 4),  # Thanksgiving
+        _observed(_fixed(years, 12, 25)),  # Christmas
+        np.array(SPECIAL_CLOSURES, dtype='datetime64[D]'),
+    ])
+    holidays = holidays[(holidays >= _fixed(years[:1], 1, 1)[0]) & (holidays <= _fixed(years[-1:], 12, 31)[0])]
+    return np.unique(holidays[_weekday(holidays) < SATURDAY])
+
+
+def nyse_early_closes(start_year: int = DEFAULT_START_YEAR, end_year: int = DEFAULT_END_YEAR) -> np.ndarray:
+    """
+    Sorted 13:00 eastern early closes, as datetime64[D]
+    """
+    years = np.arange(start_year, end_year + 1)
+    july_3 = _fixed(years, 7, 3)
+    christmas_eve = _fixed(years, 12, 24)
+    early = np.concatenate([
+        july_3[(_weekday(july_3) >= MONDAY) & (_weekday(july_3) < FRIDAY)],  # Independence Day on Tuesday to Friday
+        _nth_weekday(years, 11, THURSDAY, 4) + 1,  # Day after Thanksgiving
+        christmas_eve[_weekday(christmas_eve) < FRIDAY],  # A Friday Christmas Eve is the observed holiday
+    ])
+    return np.unique(early)
+
+
+def build_calendar(start: date, end: date) -> dict:
+    """
+    Column arrays of the calendar table for start through end inclusive
+    """
+    days = pd.date_range(start, end, freq='D')
+    dates = days.values.astype('datetime64[D]')
+    weekday = np.asarray(days.weekday)
+    holidays = nyse_holidays(start.year, end.year)
+    is_holiday = np.isin(dates, holidays)
+    is_weekday = weekday < SATURDAY
+    return {'date': days.date,
+            'year': days.year,
+            'quarter': days.quarter,
+            'month': days.month,
+            'month_name': days.month_name(),
+            'short_month_name': days.strftime('%b'),
+            'day': days.day,
+            'week': days.strftime('%U').astype(int),
+            'weekday': weekday,
+            'day_name': days.day_name(),
+            'is_weekday': is_weekday,
+            'is_holiday': is_holiday,
+            'is_early_close': np.isin(dates, nyse_early_closes(start.year, end.year)),
+            'is_market_open': is_weekday & ~is_holiday}
+
+
+def upsert_calendar(session, start: date, end: date, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Insert or update the calendar rows for start through end inclusive and commit.
+    Returns the number of days written.
+    """
+    batch = ColumnBatch.from_columns(Calendar.__table__, build_calendar(start, end))
+    insert_batch(session, batch, chunk_size, update_columns=[name for name in CALENDAR_COLUMNS if name != 'date'])
+    session.commit()
+    return len(batch)
+
+
+class MarketCalendar:
+    """
+    In-memory NYSE calendar built from the same rules as the calendar table,
+    lookups are NumPy business day operations with no database round trip.
+    Accepts dates, ISO strings or datetime64 and arrays of them.
+    """
+    def __init__(self, start_year: int = DEFAULT_START_YEAR, end_year: int = DEFAULT_END_YEAR):
+        self.start_year = start_year
+        self.end_year = end_year
+        self.holidays = nyse_holidays(start_year, end_year)
+        self.early_closes = nyse_early_closes(start_year, end_year)
+        self.busdaycal = np.busdaycalendar(holidays=self.holidays)
+
+    def is_market_open(self, day):
+        return np.is_busday(np.asarray(day, dtype='datetime64[D]'), busdaycal=self.busdaycal)
+
+    def is_early_close(self, day):
+        return np.isin(np.asarray(day, dtype='datetime64[D]'), self.early_closes)
+
+    def market_days_between(self, start, end):
+        """
+        Number of market days from start through end, both inclusive
+        """
+        end = np.asarray(end, dtype='datetime64[D]') + 1
+        return np.busday_count(np.asarray(start, dtype='datetime64[D]'), end, busdaycal=self.busdaycal)
+
+    def market_days(self, start, end) -> np.ndarray:
+        """
+        The market days from start through end inclusive as datetime64[D]
+        """
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        return days[self.is_market_open(days)]
+
+    def next_market_day(self, day, offset: int = 1):
+        """
+        The market day offset market days after day, or before it for a negative offset
+        """
+        # Roll against the direction of travel so a closed day counts from the adjacent session
+        return np.busday_offset(np.asarray(day, dtype='datetime64[D]'), offset, roll='backward' if offset >= 0 else 'forward', busdaycal=self.busdaycal)
+
+
+@lru_cache(maxsize=None)
+def market_calendar(start_year: int = DEFAULT_START_YEAR, end_year: int = DEFAULT_END_YEAR) -> MarketCalendar:
+    """
+    Shared MarketCalendar, built once per process
+    """
+    return MarketCalendar(start_year, end_year)
+
+
+def is_market_open(day) -> bool:
+    return bool(market_calendar().is_market_open(day))
+
+
+def market_days_between(start, end) -> int:
+    return int(market_calendar().market_days_between(start, end))
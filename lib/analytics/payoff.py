@@ -0,0 +1,166 @@
+import re
+from datetime import date, datetime
+
+import numpy as np
+
+from orm.models import Position, LatestPosition, Transaction, TransactionItem
+from analytics.black_scholes import price, intrinsic, DAYS_PER_YEAR
+
+OPTION_MULTIPLIER = 100
+DEFAULT_VOL = 0.20
+
+# OCC option symbol as used by Schwab, e.g. 'SPXW  240119C04800000'
+OCC_SYMBOL = re.compile(r'^(?P<underlying>[A-Z./]+)\s*(?P<expiration>\d{6})(?P<put_call>[CP])(?P<strike>\d{8})$')
+
+
+def parse_occ_symbol(symbol: str) -> dict:
+    """
+    Split an OCC option symbol into underlying, expiration_date, put_call and strike_price
+    """
+    match = OCC_SYMBOL.match(symbol or '')
+    if match is None:
+        return None
+    return {'underlying': match['underlying'],
+            'expiration_date': datetime.strptime(match['expiration'], '%y%m%d').date(),
+            'put_call': 'CALL' if match['put_call'] == 'C' else 'PUT',
+            'strike_price': int(match['strike']) / 1000}
+
+
+class Legs:
+    """
+    Option legs of many structures stored as parallel NumPy arrays.
+    Legs are sorted by structure so per structure sums are a single reduceat.
+    quantity is signed (long > 0, short < 0) and premium is the per share price paid.
+    """
+    def __init__(self, keys: list, group, strike, is_call, quantity, premium, expiration, multiplier):
+        order = np.argsort(group, kind='stable')
+        self.keys = keys
+        self.group = np.asarray(group)[order]
+        self.strike = np.asarray(strike, dtype=float)[order]
+        self.is_call = np.asarray(is_call, dtype=bool)[order]
+        self.quantity = np.asarray(quantity, dtype=float)[order]
+        self.premium = np.asarray(premium, dtype=float)[order]
+        self.expiration = np.asarray(expiration, dtype='datetime64[D]')[order]
+        self.multiplier = np.asarray(multiplier, dtype=float)[order]
+        # Index of the first leg of each structure
+        self.starts = np.flatnonzero(np.r_[True, self.group[1:] != self.group[:-1]]) if len(self.group) else np.array([], dtype=int)
+
+    def __len__(self):
+        return len(self.group)
+
+    @classmethod
+    def from_records(cls, records: list, key):
+        """
+        Build legs from dicts with strike_price, put_call ('CALL' or 'PUT'), signed quantity,
+        premium, expiration_date and optionally multiplier. key(record) names the structure.
+        """
+        keys = []
+        groups = {}
+        columns = {name: [] for name in ('group', 'strike', 'is_call', 'quantity', 'premium', 'expiration', 'multiplier')}
+        for record in records:
+            structure = key(record)
+            if structure not in groups:
+                groups[structure] = len(keys)
+                keys.append(structure)
+            columns['group'].append(groups[structure])
+            columns['strike'].append(float(record['strike_price']))
+            columns['is_call'].append(record['put_call'] == 'CALL')
+            columns['quantity'].append(float(record['quantity']))
+            columns['premium'].append(float(record.get('premium') or 0))
+            columns['expiration'].append(record['expiration_date'])
+            columns['multiplier'].append(record.get('multiplier') or OPTION_MULTIPLIER)
+        return cls(keys, **{name: np.array(values) for name, values in columns.items()})
+
+
+def price_grid(legs: Legs, points: int = 200, width: float = 0.10):
+    """
+    Evenly spaced underlying prices from width below the lowest strike to width above the highest
+    """
+    return np.linspace(legs.strike.min() * (1 - width), legs.strike.max() * (1 + width), points)
+
+
+def payoff_at_expiry(legs: Legs, prices) -> np.ndarray:
+    """
+    P&L of every structure at expiration, shape (structures, prices)
+    """
+    prices = np.asarray(prices, dtype=float)
+    value = intrinsic(prices[None, :], legs.strike[:, None], legs.is_call[:, None])
+    pnl = (value - legs.premium[:, None]) * (legs.quantity * legs.multiplier)[:, None]
+    return np.add.reduceat(pnl, legs.starts, axis=0)
+
+
+def payoff_curves(legs: Legs, prices, days=(0,), vol=DEFAULT_VOL, rate: float = 0.0, as_of: date = None) -> np.ndarray:
+    """
+    Theoretical P&L of every structure at several dates, shape (structures, days, prices).
+    days are offsets from as_of (default today), each leg is valued with Black-Scholes
+    on its remaining time to expiry and at intrinsic value once expired.
+    vol is a scalar or one implied volatility per leg.
+    """
+    prices = np.asarray(prices, dtype=float)
+    days = np.asarray(days, dtype=float)
+    as_of = np.datetime64(as_of or date.today(), 'D')
+    vol = np.broadcast_to(np.asarray(vol, dtype=float), legs.strike.shape)
+    days_to_expiry = (legs.expiration - as_of).astype(float)
+
+    # Structures on the same underlying share most of their contracts so each
+    # distinct (strike, put/call, expiration, vol) is only priced once
+    contracts, inverse = np.unique(np.column_stack((legs.strike, legs.is_call, days_to_expiry, vol)), axis=0, return_inverse=True)
+    strike, is_call, days_left, contract_vol = contracts.T
+    time_to_expiry = np.maximum(days_left[:, None] - days[None, :], 0) / DAYS_PER_YEAR
+
+    value = price(prices[None, None, :],
+                  strike[:, None, None],
+                  time_to_expiry[:, :, None],
+                  contract_vol[:, None, None],
+                  rate,
+                  is_call[:, None, None] > 0)
+    size = legs.quantity * legs.multiplier
+    pnl = np.add.reduceat(value[inverse.ravel()] * size[:, None, None], legs.starts, axis=0)
+    cost = np.add.reduceat(legs.premium * size, legs.starts)
+    return pnl - cost[:, None, None]
+
+
+def legs_from_positions(session, underlyings: list = None, account_ids: list = None) -> Legs:
+    """
+    Option legs of the latest positions snapshot grouped by (account_id, underlying, expiration_date)
+    """
+    query = (session.query(Position)
+             .join(LatestPosition, LatestPosition.snapshot_id == Position.snapshot_id)
+             .filter(Position.asset_type.in_(('CALL', 'PUT'))))
+    if underlyings:
+        query = query.filter(Position.underlying.in_(underlyings))
+    if account_ids:
+        query = query.filter(Position.account_id.in_(account_ids))
+
+    records = []
+    for position in query.all():
+        option = parse_occ_symbol(position.symbol)
+        if option is None:
+            continue
+        records.append(dict(option,
+                            account_id=position.account_id,
+                            underlying=position.underlying or option['underlying'],
+                            quantity=(position.long_quantity or 0) - (position.short_quantity or 0),
+                            premium=position.average_price))
+    return Legs.from_records(records, key=lambda r: (r['account_id'], r['underlying'], r['expiration_date']))
+
+
+def legs_from_transactions(session, trade_ids: list) -> Legs:
+    """
+    Option legs of the BUY/SELL transaction items of trades grouped by trade_id
+    """
+    rows = (session.query(Transaction.trade_id, TransactionItem)
+            .join(TransactionItem, TransactionItem.transaction_id == Transaction.transaction_id)
+            .filter(Transaction.trade_id.in_(trade_ids),
+                    TransactionItem.asset_type.in_(('CALL', 'PUT')),
+                    TransactionItem.transaction.in_(('BUY', 'SELL')))
+            .all())
+
+    records = [{'trade_id': trade_id,
+                'strike_price': item.strike_price,
+                'put_call': item.asset_type,
+                'quantity': item.quantity if item.transaction == 'BUY' else -item.quantity,
+                'premium': item.amount,
+                'expiration_date': item.expiration_date}
+               for trade_id, item in rows]
+    return Legs.from_records(records, key=lambda r: r['trade_id'])
@@ -0,0 +1,246 @@
+import os
+import glob
+import json
+from datetime import date
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from ingest.trading_days import TARGET_TRADING_RATIO
+from ingest.generations import ALL
+from orm.backends import duckdb_connect
+from analytics.market_calendar import market_calendar
+
+DEFAULT_CACHE_DIR = './data/cache'
+INDEX_UNDERLYINGS = ('SPX', 'SPXW', 'VIX')
+
+# Every ingest, rebuild and trade assignment bumps the all generation in the transaction that changes the facts.
+# The stamp tells apart a database that was recreated and counted up to the same generation again.
+SELECT_CACHE_KEY = text('select generation, updated_at from cache_generations where tag = :tag')
+
+# Every report reads from this one frame, add columns here rather than querying in a report
+SELECT_FACTS = text("""
+select
+   f.account_id,
+   a.name account,
+   a.type account_type,
+   f.date,
+   f.transaction_id,
+   f.position_id,
+   f.trade_id,
+   f.symbol,
+   f.underlying,
+   f.`transaction`,
+   f.asset_type,
+   f.quantity,
+   f.extended_amount,
+   f.commission,
+   f.fees
+from
+   transaction_facts f
+   join accounts a using (account_id)
+""")
+
+NUMERIC_COLUMNS = ('quantity', 'extended_amount', 'commission', 'fees')
+CATEGORY_COLUMNS = ('account', 'account_type', 'transaction', 'asset_type', 'underlying')
+
+REPORTS = {}
+
+
+def report(name: str):
+    """
+    Register a report, a function of (ReportData, **params) returning a DataFrame
+    """
+    def register(func):
+        REPORTS[name] = func
+        return func
+    return register
+
+
+class ReportData:
+    """
+    The fact frame every report is computed from, with the market days of the shared NYSE calendar
+    """
+    def __init__(self, facts: pd.DataFrame, key: str, as_of: date = None):
+        self.facts = facts
+        self.key = key
+        self.as_of = pd.Timestamp(as_of or date.today())
+
+    @cached_property
+    def market_days(self) -> pd.Series:
+        calendar = market_calendar()
+        return pd.Series(pd.to_datetime(calendar.market_days(date(calendar.start_year, 1, 1), date(calendar.end_year, 12, 31))))
+
+    @property
+    def trades(self) -> pd.DataFrame:
+        """
+        BUY and SELL rows
+        """
+        return self.facts[self.facts['transaction'].isin(('BUY', 'SELL'))]
+
+
+class ReportEngine:
+    """
+    Loads the report facts in one read and caches them on disk and in memory,
+    keyed by the all cache generation so the frame is reloaded after anything changes the facts.
+    With duckdb_path the facts are read from that SQLite file by DuckDB's columnar scan
+    instead of row by row through SQLAlchemy.
+    """
+    def __init__(self, get_session, cache_dir: str = DEFAULT_CACHE_DIR, duckdb_path: str = None):
+        self.get_session = get_session
+        self.cache_dir = cache_dir
+        self.duckdb_path = duckdb_path
+        self._data = None
+
+    def cache_key(self) -> str:
+        row = self.get_session().execute(SELECT_CACHE_KEY, {'tag': ALL}).first()
+        if row is None:
+            return '0'
+        generation, updated_at = row
+        # SQLite hands back the stamp as text
+        stamp = pd.Timestamp(updated_at).strftime('%Y%m%d%H%M%S') if updated_at else ''
+        return f'{generation}_{stamp}'
+
+    def load(self, refresh: bool = False) -> ReportData:
+        key = self.cache_key()
+        if not refresh and self._data is not None and self._data.key == key:
+            return self._data
+
+        path = os.path.join(self.cache_dir, f'report_facts_{key}.pkl')
+        if not refresh and os.path.exists(path):
+            facts = pd.read_pickle(path)
+        else:
+            facts = self._read()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            pd.to_pickle(facts, path)
+            # Frames of older keys are stale
+            for stale in glob.glob(os.path.join(self.cache_dir, 'report_facts_*.pkl')):
+                if stale != path:
+                    os.remove(stale)
+
+        self._data = ReportData(facts, key)
+        return self._data
+
+    def _read(self) -> pd.DataFrame:
+        if self.duckdb_path:
+            facts = self._read_duckdb()
+        else:
+            result = self.get_session().execute(SELECT_FACTS)
+            facts = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+        facts['date'] = pd.to_datetime(facts['date'])
+        facts['year'] = facts['date'].dt.year
+        for column in NUMERIC_COLUMNS:
+            facts[column] = pd.to_numeric(facts[column]).fillna(0.0)
+        for column in CATEGORY_COLUMNS:
+            facts[column] = facts[column].astype('category')
+        return facts
+
+    def _read_duckdb(self) -> pd.DataFrame:
+        connection = duckdb_connect(self.duckdb_path)
+        try:
+            connection.execute('USE store')
+            return connection.execute(SELECT_FACTS.text.replace('`', '"')).df()
+        finally:
+            connection.close()
+
+    def run(self, names: list = None, refresh: bool = False, **params) -> dict:
+        """
+        Compute the named reports, all registered reports by default, from one load of the facts
+        """
+        data = self.load(refresh)
+        unknown = set(names or ()) - set(REPORTS)
+        if unknown:
+            raise ValueError(f'Unknown reports: {", ".join(sorted(unknown))}')
+        return {name: REPORTS[name](data, **params) for name in (names or REPORTS)}
+
+
+def to_records(frame: pd.DataFrame) -> list:
+    """
+    JSON ready rows of a report, dates as ISO strings
+    """
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+
+def _years(frame: pd.DataFrame, years: list) -> pd.DataFrame:
+    return frame[frame['year'].isin(years)] if years else frame
+
+
+@report('trade_days')
+def trade_days(data: ReportData, years: list = None, **params) -> pd.DataFrame:
+    """
+    Days with a buy or sell in taxable accounts against the market days of the year.
+    The ratio matters for trader tax status, see TARGET_TRADING_RATIO.
+    """
+    years = years or [data.as_of.year]
+    trades = _years(data.trades, years)
+    trades = trades[trades['account_type'] == 'TAXABLE']
+    # One transaction per date, symbol and side like the original query
+    trades = trades.drop_duplicates(['year', 'account', 'date', 'symbol', 'transaction'])
+
+    result = (trades.groupby(['year', 'account'], observed=True)
+              .agg(days_with_trade=('date', 'nunique'), transactions=('date', 'size'), last_trade=('date', 'max'))
+              .reset_index())
+
+    market_year = data.market_days.dt.year
+    days_total = data.market_days.groupby(market_year).size()
+    days_completed = data.market_days[data.market_days <= data.as_of].groupby(market_year).size()
+    result['market_days_completed'] = result['year'].map(days_completed).fillna(0).astype(int)
+    result['market_days_left'] = result['year'].map(days_total).fillna(0).astype(int) - result['market_days_completed']
+    days_total = result['market_days_completed'] + result['market_days_left']
+
+    result['trading_ratio_ytd'] = (result['days_with_trade'] / result['market_days_completed'] * 100).round(1)
+    result['trading_ratio'] = (result['days_with_trade'] / days_total * 100).round(1)
+    result['avg_daily_transactions'] = (result['transactions'] / result['market_days_completed']).round(2)
+    result['target_trading_ratio'] = TARGET_TRADING_RATIO * 100
+    result['target_trading_days'] = np.ceil(days_total * TARGET_TRADING_RATIO).astype(int)
+    result['days_allowed_with_no_trade'] = result['market_days_left'] - (result['target_trading_days'] - result['days_with_trade'])
+    return result
+
+
+@report('trade_days_across_all_accounts')
+def trade_days_across_all_accounts(data: ReportData, years: list = None, account_ids: list = None, **params) -> pd.DataFrame:
+    """
+    Distinct days with a buy or sell per year
+    """
+    trades = _years(data.trades, years)
+    if account_ids:
+        trades = trades[trades['account_id'].isin(account_ids)]
+    return trades.groupby('year')['date'].nunique().rename('days_with_trade').reset_index()
+
+
+@report('average_days_in_trade_and_trade_volume')
+def average_days_in_trade(data: ReportData, years: list = None, **params) -> pd.DataFrame:
+    """
+    Average days a position is held and the number of transactions, positions with a single transaction are open
+    """
+    trades = _years(data.trades, years)
+    positions = (trades.groupby(['year', 'position_id', 'account'], observed=True)
+                 .agg(transactions=('date', 'size'), first=('date', 'min'), last=('date', 'max'))
+                 .reset_index())
+    positions = positions[positions['transactions'] > 1]
+    positions['days'] = (positions['last'] - positions['first']).dt.days
+    return (positions.groupby(['year', 'account'], observed=True)
+            .agg(transactions=('transactions', 'sum'), average_days=('days', 'mean'))
+            .round(2)
+            .reset_index())
+
+
+@report('monthly_income')
+def monthly_income(data: ReportData, years: list = None, **params) -> pd.DataFrame:
+    """
+    Income from the wheel, dividends and interest by month, index options and futures are excluded
+    """
+    facts = _years(data.facts, years)
+    income = facts[facts['asset_type'].isin(('CURRENCY', 'CALL', 'PUT'))
+                   & ~facts['underlying'].isin(INDEX_UNDERLYINGS)
+                   & ~facts['symbol'].str.startswith('/')]
+    income = income.assign(month_number=income['date'].dt.month,
+                           net=income['extended_amount'] - income['commission'] - income['fees'])
+    result = (income.groupby(['year', 'month_number'])
+              .agg(income=('net', 'sum'), trades=('position_id', 'nunique'))
+              .reset_index())
+    result.insert(1, 'month', pd.to_datetime(result['month_number'], format='%m').dt.strftime('%b'))
+    result['income'] = result['income'].round(2)
+    return result.drop(columns='month_number')
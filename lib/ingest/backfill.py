@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import case
+
+from ingest.bulk import upsert
+from orm.models import SyncCheckpoint
+
+DEFAULT_WINDOW = timedelta(days=30)
+# Smallest window a capped request is split down to
+MIN_WINDOW = timedelta(hours=1)
+
+# Maximum number of activities the transactions endpoint returns per request
+TRANSACTIONS_RESULT_CAP = 3000
+
+
+def split_windows(start: datetime, end: datetime, window: timedelta = DEFAULT_WINDOW) -> list:
+    """
+    Split start..end into consecutive (start, end) windows of at most window length
+    """
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start = windows[-1][1]
+    return windows
+
+
+def fetch_adaptive(fetch_window, start: datetime, end: datetime, cap: int, key=None, min_window: timedelta = MIN_WINDOW) -> list:
+    """
+    Call fetch_window(start, end) and, whenever a response reaches the result cap,
+    split the window in half and fetch both halves instead.
+    Results are concatenated and de-duplicated on key(result) because halves
+    share their boundary timestamp. Returns None if any request failed.
+    """
+    results = fetch_window(start, end)
+    if results is None:
+        return None
+    if len(results) < cap or end - start <= min_window:
+        return results
+
+    middle = start + (end - start) / 2
+    left = fetch_adaptive(fetch_window, start, middle, cap, key, min_window)
+    right = fetch_adaptive(fetch_window, middle, end, cap, key, min_window)
+    if left is None or right is None:
+        return None
+    if key is None:
+        return left + right
+
+    seen = set()
+    merged = []
+    for result in left + right:
+        if key(result) not in seen:
+            seen.add(key(result))
+            merged.append(result)
+    return merged
+
+
+class CheckpointTracker:
+    """
+    Tracks completed windows for one account and type. The high-water mark only
+    advances across a contiguous run of completed windows so windows finishing
+    out of order never skip a failed one.
+    """
+    def __init__(self, windows: list):
+        self.pending = sorted(windows)
+        self.completed = set()
+
+    def complete(self, window: tuple) -> datetime:
+        """
+        Mark a window complete and return the new high-water mark, or None if it did not move
+        """
+        self.completed.add(window)
+        mark = None
+        while self.pending and self.pending[0] in self.completed:
+            mark = self.pending.pop(0)[1]
+        return mark
+
+
+def get_checkpoint(session, account_id: int, type: str) -> datetime:
+    """
+    Get the high-water mark for an account and type, None if it has never been synced
+    """
+    checkpoint = session.get(SyncCheckpoint, (account_id, type))
+    return checkpoint.high_water_mark if checkpoint else None
+
+
+def save_checkpoint(session, account_id: int, type: str, high_water_mark: datetime):
+    """
+    Upsert a high-water mark. It never moves backwards so re-loading an old
+    range does not rewind the incremental sync. The caller owns the commit.
+    """
+    stmt = upsert(session, SyncCheckpoint.__table__,
+                  lambda row: {'high_water_mark': case((SyncCheckpoint.high_water_mark > row.high_water_mark, SyncCheckpoint.high_water_mark),
+                                                       else_=row.high_water_mark),
+                               'updated_at': row.updated_at})
+    session.execute(stmt.values(account_id=account_id,
+                                type=type,
+                                high_water_mark=high_water_mark,
+                                updated_at=datetime.now()))
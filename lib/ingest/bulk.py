@@ -0,0 +1,103 @@
+from sqlalchemy.dialects import mysql, sqlite
+
+from orm.backends import is_mysql
+
+# Number of rows sent per multi-row INSERT statement
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ColumnBatch:
+    """
+    Column oriented buffer of rows destined for a single table.
+    Rows are appended as dicts and stored as one list per column so a whole
+    API page can be accumulated cheaply and written with executemany.
+    """
+    def __init__(self, table, columns=None):
+        self.table = table
+        if columns is None:
+            # Let the database assign auto increment keys
+            columns = [c.name for c in table.columns if c.autoincrement is not True]
+        self.columns = {name: [] for name in columns}
+        self._length = 0
+
+    @classmethod
+    def from_columns(cls, table, columns: dict) -> 'ColumnBatch':
+        """
+        Build a batch from equal length column sequences, e.g. NumPy arrays
+        """
+        batch = cls(table, list(columns))
+        for name, values in columns.items():
+            batch.columns[name] = values.tolist() if hasattr(values, 'tolist') else list(values)
+        batch._length = len(next(iter(batch.columns.values()), []))
+        return batch
+
+    def __len__(self):
+        return self._length
+
+    def append(self, row: dict):
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        self._length += 1
+
+    def rows(self, start: int = 0, stop: int = None) -> list:
+        """
+        Materialize a slice of the batch as a list of row dicts
+        """
+        names = list(self.columns)
+        values = [self.columns[name][start:stop] for name in names]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def upsert(session, table, update=None):
+    """
+    INSERT for the session's database that updates the existing row instead of failing on a duplicate key.
+    update gets the proposed row's columns and returns the values to set, MariaDB's inserted or SQLite's
+    excluded. Without update existing rows are left untouched.
+    """
+    if is_mysql(session):
+        stmt = mysql.insert(table)
+        if update is None:
+            key = table.primary_key.columns.values()[0].name
+            return stmt.on_duplicate_key_update({key: stmt.inserted[key]})
+        return stmt.on_duplicate_key_update(update(stmt.inserted))
+    stmt = sqlite.insert(table)
+    if update is None:
+        return stmt.on_conflict_do_nothing()
+    # Without a conflict target SQLite applies the update on whichever unique key the row collides with, like MariaDB
+    return stmt.on_conflict_do_update(set_=update(stmt.excluded))
+
+
+def on_duplicate_update(session, keys: tuple, columns: tuple) -> str:
+    """
+    Upsert clause that ends a text INSERT ... SELECT, overwriting columns of the rows whose keys already exist
+    """
+    if is_mysql(session):
+        return ' on duplicate key update ' + ', '.join(f'{column} = values({column})' for column in columns)
+    return (f" on conflict ({', '.join(keys)}) do update set "
+            + ', '.join(f'{column} = excluded.{column}' for column in columns))
+
+
+def insert_batch(session, batch: ColumnBatch, chunk_size: int = DEFAULT_CHUNK_SIZE, ignore_duplicates: bool = False, update_columns: list = None) -> int:
+    """
+    Write a ColumnBatch with one executemany INSERT per chunk.
+    When ignore_duplicates is set rows whose primary key already exists are left
+    untouched (INSERT ... ON DUPLICATE KEY UPDATE pk = pk, ON CONFLICT DO NOTHING on SQLite).
+    When update_columns is given existing rows are upserted, only those columns
+    are overwritten and MariaDB skips the write for rows whose values did not change.
+    Returns the number of rows sent to the database.
+    """
+    if len(batch) == 0:
+        return 0
+    if chunk_size is None or chunk_size < 1:
+        chunk_size = DEFAULT_CHUNK_SIZE
+
+    if update_columns:
+        stmt = upsert(session, batch.table, lambda row: {name: row[name] for name in update_columns})
+    elif ignore_duplicates:
+        stmt = upsert(session, batch.table)
+    else:
+        stmt = batch.table.insert()
+
+    for start in range(0, len(batch), chunk_size):
+        session.execute(stmt, batch.rows(start, start + chunk_size))
+    return len(batch)
@@ -0,0 +1,83 @@
+import re
+
+# Schwab lumps interest and dividend transactions together so the type has to be
+# taken from the description. Rules are tried in order, the first match wins and
+# anything unmatched is a dividend.
+RULES = [
+    ('INTEREST', r'FREE BALANCE INTEREST ADJUSTMENT~NO DESCRIPTION'),
+    ('INTEREST', r'OFF-CYCLE INTEREST~MMDA1'),
+    ('INTEREST', r'MARGIN INTEREST ADJUSTMENT~NO DESCRIPTION'),
+    ('INTEREST', r'INTEREST INCOME - SECURITIES~.*'),
+    ('INTEREST', r'Free Balance Interest Adjustment'),
+    ('INTEREST', r'Interest Income - Securities'),
+    ('INTEREST', r'BANK INT.*'),
+    ('INTEREST', r'SCHWAB1 INT.*'),
+    ('INTEREST', r'.*interest'),
+]
+DEFAULT_TYPE = 'DIVIDEND'
+
+# Descriptions that carry the symbol after the first '~', e.g. QUALIFIED DIVIDEND~AAPL
+SYMBOL_KEYWORDS = r'dividend~|foreign tax withheld~'
+
+
+def compile_rules(rules: list):
+    """
+    Compile a rule table into one anchored alternation with a named group per rule
+    """
+    return re.compile('|'.join(f'(?P<r{i}>{pattern})' for i, (_, pattern) in enumerate(rules)), re.IGNORECASE)
+
+
+class DescriptionClassifier:
+    """
+    Single pass classifier of DIVIDEND_OR_INTEREST descriptions to (type, symbol).
+    Results are memoized per description. Symbols that are not in the description
+    are looked up in a description -> symbol index of the securities table which
+    load_index() returns the first time it is needed.
+    """
+    def __init__(self, load_index=None, rules: list = RULES):
+        self.types = [type for type, _ in rules]
+        self.pattern = compile_rules(rules)
+        self.symbol_keywords = re.compile(SYMBOL_KEYWORDS, re.IGNORECASE)
+        self.load_index = load_index
+        self.index = None
+        self.memo = {}
+
+    def classify(self, description: str) -> tuple:
+        """
+        Get (transaction type, symbol) for a description, symbol may be None
+        """
+        result = self.memo.get(description)
+        if result is None:
+            result = self.memo[description] = (self.classify_type(description), self.lookup_symbol(description))
+        return result
+
+    def classify_type(self, description: str) -> str:
+        match = self.pattern.match(description or '')
+        if match is None:
+            return DEFAULT_TYPE
+        return self.types[int(match.lastgroup[1:])]
+
+    def lookup_symbol(self, description: str) -> str:
+        if not description:
+            return None
+
+        # Parse symbol from the description
+        if self.symbol_keywords.search(description):
+            parts = description.split('~')
+            if len(parts) > 1:
+                return parts[1].strip()
+
+        # Lookup the symbol in the securities index
+        if self.index is None:
+            self.index = dict(self.load_index()) if self.load_index else {}
+        return self.index.get(description)
+
+    def update_index(self, securities: dict):
+        """
+        Add description -> symbol entries, e.g. securities stored during the run
+        """
+        if self.index is None:
+            self.index = dict(self.load_index()) if self.load_index else {}
+        self.index.update(securities)
+        # Memoized misses may now resolve to a symbol
+        self.memo = {description: result for description, result in self.memo.items() if result[1] is not None}
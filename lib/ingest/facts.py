@@ -0,0 +1,99 @@
+from sqlalchemy import text, bindparam
+
+from orm.models import Transaction
+
+FACT_COLUMNS = ('item_id, account_id, date, month, year, transaction_id, position_id, trade_id, order_id, order_date, '
+                'description, quantity, symbol, underlying, amount, commission, fees, `transaction`, asset_type, '
+                'expiration_date, strike_price, extended_amount')
+
+# Same rows and columns as transaction_view plus the item_id key.
+# {fees_filter} and {filter} restrict the refresh to the touched transactions.
+SELECT_FACTS = """
+select
+   ti.item_id,
+   a.account_id, 
+   t.date, 
+   date_format(t.date, '%b') month,
+   year(t.date) year,
+   t.transaction_id,
+   t.position_id,
+   t.trade_id,
+   t.order_id,
+   o.close_time order_date,
+   ifnull(ti.description,t.description) description,
+   ti.quantity,
+   ifnull(ti.symbol,'') symbol,
+   ifnull(ti.underlying, '') underlying,
+   ti.amount,
+   ifnull((fees.commission / fees.quantity * ti.quantity * -1),0) commission,
+   ifnull((fees.other / fees.quantity * ti.quantity * -1),0) fees,
+   ti.`transaction`,
+   ti.asset_type,
+   ti.expiration_date,
+   ti.strike_price,
+   round(ti.extended_amount,2) extended_amount
+from 
+   accounts a
+   join transactions t using (account_id)
+   join transaction_items ti using (transaction_id)
+   left join orders o using (order_id)
+   join (select
+            transaction_id, 
+            sum(quantity) quantity,
+            sum(if(ti.description = 'COMMISSION', ti.amount,0)) commission,
+            sum(if(`transaction` = 'FEE' and ti.description != 'COMMISSION',ti.amount,0)) other
+         from 
+            transactions t
+            join transaction_items ti using (transaction_id)
+         {fees_filter}
+         group by 1) fees using (transaction_id)
+where 
+   ti.`transaction` in ('BUY', 'SELL', 'INTEREST', 'DIVIDEND')
+   {filter}
+"""
+
+REFRESH_CHUNK_SIZE = 1000
+
+
+def refresh_transaction_facts(session, transaction_ids) -> int:
+    """
+    Re-materialize the transaction_facts rows of the given transactions.
+    Runs in the caller's transaction so facts commit together with the data
+    they are derived from. Returns the number of transactions refreshed.
+    """
+    transaction_ids = sorted(set(transaction_ids))
+    delete = text('delete from transaction_facts where transaction_id in :ids').bindparams(bindparam('ids', expanding=True))
+    insert = text(f'insert into transaction_facts ({FACT_COLUMNS}) '
+                  + SELECT_FACTS.format(fees_filter='where t.transaction_id in :ids',
+                                        filter='and t.transaction_id in :ids')).bindparams(bindparam('ids', expanding=True))
+
+    for start in range(0, len(transaction_ids), REFRESH_CHUNK_SIZE):
+        ids = transaction_ids[start:start + REFRESH_CHUNK_SIZE]
+        session.execute(delete, {'ids': ids})
+        session.execute(insert, {'ids': ids})
+    return len(transaction_ids)
+
+
+def refresh_order_facts(session, account_id: int, order_ids) -> int:
+    """
+    Refresh the facts of transactions belonging to orders whose close time may have changed
+    """
+    order_ids = list(order_ids)
+    transaction_ids = []
+    for start in range(0, len(order_ids), REFRESH_CHUNK_SIZE):
+        transaction_ids += [id[0] for id in session.query(Transaction.transaction_id)
+                            .filter(Transaction.account_id == account_id,
+                                    Transaction.order_id.in_(order_ids[start:start + REFRESH_CHUNK_SIZE]))
+                            .all()]
+    return refresh_transaction_facts(session, transaction_ids)
+
+
+def rebuild_transaction_facts(session) -> int:
+    """
+    Rebuild transaction_facts from scratch in one transaction. Returns the number of rows.
+    """
+    session.execute(text('delete from transaction_facts'))
+    result = session.execute(text(f'insert into transaction_facts ({FACT_COLUMNS}) '
+                                  + SELECT_FACTS.format(fees_filter='', filter='')))
+    session.commit()
+    return result.rowcount
@@ -0,0 +1,83 @@
+import time
+from threading import Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Schwab trader API allows 120 requests per minute per app
+DEFAULT_REQUESTS_PER_MINUTE = 120
+DEFAULT_WORKERS = 4
+# Jobs submitted per worker ahead of the results written, bounds the results waiting in memory
+IN_FLIGHT_PER_WORKER = 2
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread that calls the API
+    """
+    def __init__(self, rate: int = DEFAULT_REQUESTS_PER_MINUTE, per: float = 60.0):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+def fetch_concurrently(jobs, fetch, write, max_workers: int = DEFAULT_WORKERS, executor_class=ThreadPoolExecutor, next_job=None) -> int:
+    """
+    Run fetch(job) for every job on a bounded thread pool and hand each result
+    to write(job, result) on the calling thread as soon as it arrives.
+    Only the calling thread touches the database so the shared session stays
+    single threaded. Jobs whose fetch returns None are skipped.
+    At most max_workers * IN_FLIGHT_PER_WORKER jobs are submitted ahead of the
+    results written, jobs may be a generator and is consumed as results drain.
+    next_job(job, result) may return a follow-up job, e.g. the next batch of a
+    file, which is submitted before the result is written so the two overlap.
+    Pass executor_class=ProcessPoolExecutor for CPU bound work, fetch and the
+    jobs must then be picklable.
+    Returns the number of results written.
+    """
+    jobs = iter(jobs)
+    follow_ups = deque()
+    window = max(1, max_workers) * IN_FLIGHT_PER_WORKER
+    written = 0
+    with executor_class(max_workers=max(1, max_workers)) as executor:
+        futures = {}
+
+        def submit():
+            while len(futures) < window:
+                job = follow_ups.popleft() if follow_ups else next(jobs, None)
+                if job is None:
+                    return
+                futures[executor.submit(fetch, job)] = job
+
+        submit()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = futures.pop(future)
+                result = future.result()
+                if result is None:
+                    continue
+                follow_up = next_job(job, result) if next_job else None
+                if follow_up is not None:
+                    follow_ups.append(follow_up)
+                    submit()
+                write(job, result)
+                written += 1
+            submit()
+    return written
@@ -0,0 +1,88 @@
+import io
+import json
+
+# Activities handed to store_transactions at a time
+DEFAULT_BATCH_SIZE = 5000
+BUFFER_SIZE = 1 << 16
+# Separators between array elements, JSON whitespace is ASCII so characters and bytes agree
+SEPARATORS = ' \t\r\n,'
+
+
+def iter_json_array(f, buffer_size: int = BUFFER_SIZE, inside: bool = False):
+    """
+    Yield (element, offset) for the elements of a top level JSON array one at a time, offset being
+    the UTF-8 bytes of f consumed through the end of the element. The file is read buffer_size
+    characters at a time so only the element being decoded has to fit in memory, not the whole export.
+    With inside f is positioned in the array after an element, at an offset yielded earlier.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(buffer_size)
+    offset = 0
+    if not inside:
+        stripped = buffer.lstrip()
+        if not stripped.startswith('['):
+            raise ValueError('Expected a JSON array')
+        offset = len(buffer) - len(stripped) + 1
+        buffer = stripped[1:]
+    eof = False
+    while True:
+        stripped = buffer.lstrip(SEPARATORS)
+        offset += len(buffer) - len(stripped)
+        buffer = stripped
+        if buffer.startswith(']'):
+            return
+        try:
+            element, end = decoder.raw_decode(buffer)
+            # A scalar at the end of the buffer may continue in the next read
+            complete = eof or end < len(buffer) or isinstance(element, (dict, list))
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            chunk = f.read(buffer_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        offset += len(buffer[:end].encode('utf-8'))
+        yield element, offset
+        buffer = buffer[end:]
+
+
+def parse_transaction_file(job: dict, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Parse the next batch of at most batch_size activities of a Schwab transactions export, starting at
+    job['offset'], the byte offset the previous batch of the file ended at. The result holds the offset
+    to continue from, None after the last batch, so a worker only ever holds and returns one batch.
+    Runs in a worker process so errors are returned rather than raised or logged.
+    """
+    batch = []
+    offset = None
+    try:
+        with open(job['path'], 'rb') as raw:
+            raw.seek(job['offset'])
+            f = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            for activity, end in iter_json_array(f, inside=job['offset'] > 0):
+                batch.append(activity)
+                if len(batch) >= batch_size:
+                    offset = job['offset'] + end
+                    break
+    except (OSError, ValueError) as e:
+        return {'path': job['path'], 'error': str(e)}
+    return {'path': job['path'], 'batch': batch, 'offset': offset}
+
+
+def transaction_file_jobs(paths: list) -> list:
+    """
+    Jobs parsing the first batch of each file
+    """
+    return [{'path': path, 'offset': 0} for path in paths]
+
+
+def next_batch(job: dict, parsed: dict) -> dict:
+    """
+    The job parsing the batch after a parsed one, None at the end of the file or after an error
+    """
+    if parsed.get('offset') is None:
+        return None
+    return dict(job, offset=parsed['offset'])
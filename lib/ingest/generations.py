@@ -0,0 +1,36 @@
+from sqlalchemy import select
+
+from ingest.bulk import upsert
+from orm.models import CacheGeneration
+
+# Bumped by every change, for cached responses spanning all accounts
+ALL = 'all'
+# Bumped by rebuilds that touch every account, account scoped responses include it
+GLOBAL = 'global'
+# Bumped by position snapshots instead of ALL, cross-account responses built from positions include it
+POSITIONS = 'positions'
+
+
+def account_tag(account_id: int) -> str:
+    return f'account:{account_id}'
+
+
+def bump_generation(session, account_id: int = None, scope: str = ALL):
+    """
+    Invalidate cached responses for an account, or for every account when account_id is None.
+    scope is the cross-account tag bumped along, POSITIONS for changes only position responses see.
+    Runs in the caller's transaction so readers see the new generation together with the data.
+    """
+    for tag in (scope, account_tag(account_id) if account_id is not None else GLOBAL):
+        stmt = upsert(session, CacheGeneration.__table__, lambda row: {'generation': CacheGeneration.__table__.c.generation + 1})
+        session.execute(stmt.values(tag=tag, generation=1))
+
+
+def get_generations(session, tags: list) -> dict:
+    """
+    Current generation of each tag, 0 for tags that were never bumped
+    """
+    rows = session.execute(select(CacheGeneration.tag, CacheGeneration.generation).where(CacheGeneration.tag.in_(tags))).all()
+    generations = dict.fromkeys(tags, 0)
+    generations.update({tag: generation for tag, generation in rows})
+    return generations
@@ -0,0 +1,218 @@
+import os
+import json
+import io
+import cProfile
+import pstats
+import tempfile
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+
+# Samples kept per timer for percentiles
+DEFAULT_WINDOW = 1000
+DEFAULT_PROFILE_TOP = 25
+PROMETHEUS_PREFIX = 'theta_burn'
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest rank percentile of sorted values
+    """
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+class Timer:
+    """
+    Call count, total and maximum of one timed thing, the last window durations are kept for percentiles
+    """
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+        return {'count': self.count,
+                'total_s': self.total,
+                'avg_ms': self.total / self.count * 1000 if self.count else 0.0,
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p95_ms': percentile(samples, 0.95) * 1000,
+                'max_ms': self.max * 1000}
+
+
+class IngestMetrics:
+    """
+    Stage timings, counters, API calls by endpoint and database statements of one run.
+    Safe to record from the fetch threads, every update takes one short lock.
+    """
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self.command = None
+        self.started = perf_counter()
+        self.stages = defaultdict(lambda: Timer(self.window))
+        self.counters = defaultdict(int)
+        self.http = defaultdict(lambda: Timer(self.window))
+        self.http_errors = defaultdict(int)
+        self.statements = Timer(window)
+        self.rows = 0
+        self.commits = 0
+        self.max_statements_per_commit = 0
+        self.max_rows_per_commit = 0
+        self._lock = Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name].record(seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def record_http(self, endpoint: str, seconds: float, status: int = None):
+        """
+        One API call, a missing status means the request raised before a response arrived
+        """
+        with self._lock:
+            self.http[endpoint].record(seconds)
+            if status is None or status >= 400:
+                self.http_errors[endpoint] += 1
+
+    def instrument_engine(self, engine):
+        """
+        Count and time every statement the engine executes, with the rows each affected,
+        and the statements and rows each commit carried
+        """
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info['statement_start'] = perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            seconds = perf_counter() - conn.info.pop('statement_start', perf_counter())
+            rows = max(cursor.rowcount or 0, 0)
+            conn.info['pending_statements'] = conn.info.get('pending_statements', 0) + 1
+            conn.info['pending_rows'] = conn.info.get('pending_rows', 0) + rows
+            with self._lock:
+                self.statements.record(seconds)
+                self.rows += rows
+
+        @event.listens_for(engine, 'commit')
+        def commit(conn):
+            with self._lock:
+                self.commits += 1
+                self.max_statements_per_commit = max(self.max_statements_per_commit, conn.info.pop('pending_statements', 0))
+                self.max_rows_per_commit = max(self.max_rows_per_commit, conn.info.pop('pending_rows', 0))
+
+        @event.listens_for(engine, 'rollback')
+        def rollback(conn):
+            conn.info.pop('pending_statements', None)
+            conn.info.pop('pending_rows', None)
+
+    def summary(self) -> list:
+        """
+        One row per stage, endpoint and counter for the end of run table
+        """
+        with self._lock:
+            rows = [dict(kind='stage', name=name, errors='', **timer.snapshot()) for name, timer in sorted(self.stages.items())]
+            rows += [dict(kind='http', name=endpoint, errors=self.http_errors[endpoint], **timer.snapshot())
+                     for endpoint, timer in sorted(self.http.items())]
+            if self.statements.count:
+                rows.append(dict(kind='db', name='statements', errors='', **self.statements.snapshot()))
+            rows += [{'kind': 'counter', 'name': name, 'count': value} for name, value in sorted(self.counters.items())]
+        return rows
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'command': self.command,
+                    'elapsed_s': perf_counter() - self.started,
+                    'stages': {name: timer.snapshot() for name, timer in self.stages.items()},
+                    'http': {endpoint: dict(timer.snapshot(), errors=self.http_errors[endpoint])
+                             for endpoint, timer in self.http.items()},
+                    'db': {'statements': self.statements.snapshot(),
+                           'rows': self.rows,
+                           'commits': self.commits,
+                           'statements_per_commit': self.statements.count / self.commits if self.commits else 0.0,
+                           'rows_per_commit': self.rows / self.commits if self.commits else 0.0,
+                           'max_statements_per_commit': self.max_statements_per_commit,
+                           'max_rows_per_commit': self.max_rows_per_commit},
+                    'counters': dict(self.counters)}
+
+    def prometheus(self) -> str:
+        """
+        The snapshot in the Prometheus text exposition format, labelled with the command
+        """
+        snapshot = self.snapshot()
+        command = snapshot['command'] or ''
+        lines = []
+
+        def metric(name: str, kind: str, samples: list):
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                labels = ','.join(f'{key}="{label}"' for key, label in {'command': command, **labels}.items())
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{labels}}} {value}')
+
+        def summary(name: str, timers: dict, label: str):
+            name = f'{PROMETHEUS_PREFIX}_{name}_seconds'
+            lines.append(f'# TYPE {name} summary')
+            for key, timer in timers.items():
+                labels = f'command="{command}",{label}="{key}"'
+                lines.append(f'{name}{{{labels},quantile="0.5"}} {timer["p50_ms"] / 1000}')
+                lines.append(f'{name}{{{labels},quantile="0.95"}} {timer["p95_ms"] / 1000}')
+                lines.append(f'{name}_sum{{{labels}}} {timer["total_s"]}')
+                lines.append(f'{name}_count{{{labels}}} {timer["count"]}')
+
+        metric('run_seconds', 'gauge', [({}, snapshot['elapsed_s'])])
+        summary('stage', snapshot['stages'], 'stage')
+        summary('http_request', snapshot['http'], 'endpoint')
+        metric('http_errors_total', 'counter', [({'endpoint': endpoint}, timer['errors']) for endpoint, timer in snapshot['http'].items()])
+        metric('db_statements_total', 'counter', [({}, snapshot['db']['statements']['count'])])
+        metric('db_statement_seconds_total', 'counter', [({}, snapshot['db']['statements']['total_s'])])
+        metric('db_rows_total', 'counter', [({}, snapshot['db']['rows'])])
+        metric('db_commits_total', 'counter', [({}, snapshot['db']['commits'])])
+        metric('events_total', 'counter', [({'name': name}, value) for name, value in snapshot['counters'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str):
+        _replace(path, json.dumps(self.snapshot(), indent=2))
+
+    def write_prometheus(self, path: str):
+        """
+        Write a textfile for the node exporter, replaced atomically so a scrape never reads half a file
+        """
+        _replace(path, self.prometheus())
+
+
+def _replace(path: str, content: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def profile_report(profiler: cProfile.Profile, top: int = DEFAULT_PROFILE_TOP, sort: str = 'cumulative') -> str:
+    """
+    The top functions of a finished profile as the pstats table
+    """
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats(sort).print_stats(top)
+    return stream.getvalue()
@@ -0,0 +1,189 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+
+from sqlalchemy import or_
+
+from ingest.bulk import upsert
+from orm.models import Security
+
+# Securities rarely change so a week old description/exchange is still good
+DEFAULT_TTL = timedelta(days=7)
+DEFAULT_MAXSIZE = 4096
+
+# Number of symbols requested per instruments API call
+SYMBOL_BATCH_SIZE = 50
+
+
+class TTLCache:
+    """
+    Small thread safe LRU with a per entry time to live
+    """
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: timedelta = DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < datetime.now():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires: datetime = None):
+        with self._lock:
+            self._data[key] = (value, expires or datetime.now() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SecurityCache:
+    """
+    Two tier cache of security metadata keyed by symbol and CUSIP.
+    Tier one is an in-process LRU, tier two is the securities table. The Schwab
+    instruments API is only called for keys missing from both (or older than ttl)
+    and missing symbols are requested in batches of SYMBOL_BATCH_SIZE.
+
+    fetch_symbols(symbols) and fetch_cusip(cusip) return lists of instrument dicts
+    as found under 'instruments' in the API response.
+    """
+    def __init__(self, get_session, fetch_symbols, fetch_cusip, ttl: timedelta = DEFAULT_TTL, maxsize: int = DEFAULT_MAXSIZE):
+        self.get_session = get_session
+        self.fetch_symbols = fetch_symbols
+        self.fetch_cusip = fetch_cusip
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize, ttl)
+        self.counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'api_calls': 0, 'not_found': 0}
+
+    def get(self, symbol: str = None, cusip: str = None) -> dict:
+        """
+        Get a single security by symbol or CUSIP
+        """
+        if symbol is not None:
+            return self.get_many(symbols=[symbol]).get(('symbol', symbol))
+        if cusip is not None:
+            return self.get_many(cusips=[cusip]).get(('cusip', cusip))
+        return None
+
+    def get_many(self, symbols=(), cusips=()) -> dict:
+        """
+        Resolve many securities at once.
+        Returns {('symbol', symbol) | ('cusip', cusip): security dict} for every key found.
+        """
+        keys = {('symbol', s) for s in symbols if s} | {('cusip', c) for c in cusips if c}
+        found = {}
+
+        # Tier one: in-process LRU
+        for key in keys:
+            security = self.memory.get(key)
+            if security is not None:
+                found[key] = security
+                self.counters['memory_hits'] += 1
+        missing = keys - found.keys()
+        if not missing:
+            return found
+
+        # Tier two: securities table
+        for key, security in self._load_from_db(missing).items():
+            found[key] = security
+            self._remember(security)
+            self.counters['db_hits'] += 1
+        missing = keys - found.keys()
+        if not missing:
+            return found
+
+        # Tier three: Schwab API
+        self.counters['misses'] += len(missing)
+        instruments = []
+        missing_symbols = sorted(value for kind, value in missing if kind == 'symbol')
+        for i in range(0, len(missing_symbols), SYMBOL_BATCH_SIZE):
+            self.counters['api_calls'] += 1
+            instruments.extend(self.fetch_symbols(missing_symbols[i:i + SYMBOL_BATCH_SIZE]) or [])
+        for cusip in sorted(value for kind, value in missing if kind == 'cusip'):
+            self.counters['api_calls'] += 1
+            instruments.extend(self.fetch_cusip(cusip) or [])
+
+        for security in self._store(instruments):
+            self._remember(security)
+            for key in self._keys(security):
+                if key in missing:
+                    found[key] = security
+        self.counters['not_found'] += len(keys - found.keys())
+        return found
+
+    def stats(self) -> dict:
+        return dict(self.counters)
+
+    def _load_from_db(self, keys: set) -> dict:
+        session = self.get_session()
+        symbols = [value for kind, value in keys if kind == 'symbol']
+        cusips = [value for kind, value in keys if kind == 'cusip']
+        conditions = []
+        if symbols:
+            conditions.append(Security.symbol.in_(symbols))
+        if cusips:
+            conditions.append(Security.cusip.in_(cusips))
+
+        fresh = datetime.now() - self.ttl
+        rows = session.query(Security).filter(or_(*conditions), Security.updated_at >= fresh).all()
+
+        found = {}
+        for row in rows:
+            security = row.to_dict()
+            for key in self._keys(security):
+                if key in keys:
+                    found[key] = security
+        return found
+
+    def _store(self, instruments: list) -> list:
+        """
+        Upsert instruments into the securities table. The caller owns the commit.
+        """
+        now = datetime.now()
+        securities = {}
+        for instrument in instruments:
+            if instrument.get('symbol') is None:
+                continue
+            securities[instrument['symbol']] = {
+                'symbol': instrument.get('symbol'),
+                'cusip': instrument.get('cusip'),
+                'description': instrument.get('description') or '',
+                'exchange': instrument.get('exchange') or '',
+                'asset_type': instrument.get('assetType') or '',
+                'updated_at': now,
+            }
+        if not securities:
+            return []
+
+        session = self.get_session()
+        stmt = upsert(session, Security.__table__, lambda row: {name: row[name] for name in ('cusip', 'description', 'exchange', 'asset_type', 'updated_at')})
+        session.execute(stmt, list(securities.values()))
+        return list(securities.values())
+
+    def _remember(self, security: dict):
+        # Expire from memory when the persisted row goes stale
+        expires = security['updated_at'] + self.ttl if security.get('updated_at') else None
+        for key in self._keys(security):
+            self.memory.set(key, security, expires)
+
+    @staticmethod
+    def _keys(security: dict) -> list:
+        keys = [('symbol', security['symbol'])]
+        if security.get('cusip'):
+            keys.append(('cusip', security['cusip']))
+        return keys
@@ -0,0 +1,67 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from ingest.bulk import upsert
+from orm.models import PositionSnapshot, LatestPosition, Position
+
+# Keep every snapshot this long, older ones are thinned to the last snapshot of each day
+DEFAULT_KEEP_DAYS = 30
+# What the position responses show, a poll that leaves all of them alone changes nothing cached
+COMPARED_COLUMNS = ('symbol', 'underlying', 'asset_type', 'short_quantity', 'long_quantity', 'average_price',
+                    'market_value', 'current_day_profit_loss', 'maintenance_requirement', 'net_change')
+
+
+def point_latest(session, account_id: int, snapshot_id: int):
+    """
+    Swap the account's latest_positions pointer to a snapshot.
+    Done in the same transaction as the snapshot insert so readers see either
+    the old or the new snapshot, never a partial one. The caller owns the commit.
+    """
+    stmt = upsert(session, LatestPosition.__table__, lambda row: {'snapshot_id': row.snapshot_id})
+    session.execute(stmt.values(account_id=account_id, snapshot_id=snapshot_id))
+
+
+def _compared(row) -> tuple:
+    # The columns are DECIMAL(10,2), the API sends more digits
+    return tuple(round(float(value), 2) if isinstance(value, (int, float, Decimal)) else value for value in row)
+
+
+def snapshot_changed(session, account_id: int, batch) -> bool:
+    """
+    Whether a polled ColumnBatch of positions differs in COMPARED_COLUMNS from the account's latest snapshot.
+    Call it before point_latest moves the pointer to the new snapshot.
+    """
+    latest = (select(*(getattr(Position, name) for name in COMPARED_COLUMNS))
+              .join(LatestPosition, LatestPosition.snapshot_id == Position.snapshot_id)
+              .where(LatestPosition.account_id == account_id))
+    previous = Counter(_compared(row) for row in session.execute(latest).all())
+    current = Counter(_compared(row) for row in zip(*(batch.columns[name] for name in COMPARED_COLUMNS)))
+    return previous != current
+
+
+def compact_snapshots(session, keep_days: int = DEFAULT_KEEP_DAYS, chunk_size: int = 1000) -> int:
+    """
+    Delete snapshots older than keep_days except the last snapshot of each
+    account and day and any snapshot a latest_positions pointer refers to.
+    Position rows are removed by the cascade on positions.snapshot_id.
+    Returns the number of snapshots deleted.
+    """
+    cutoff = datetime.now() - timedelta(days=keep_days)
+
+    daily = (session.query(func.max(PositionSnapshot.snapshot_id))
+             .filter(PositionSnapshot.date < cutoff)
+             .group_by(PositionSnapshot.account_id, func.date(PositionSnapshot.date)))
+    latest = session.query(LatestPosition.snapshot_id)
+    expired = [id[0] for id in session.query(PositionSnapshot.snapshot_id)
+               .filter(PositionSnapshot.date < cutoff,
+                       PositionSnapshot.snapshot_id.not_in(daily.scalar_subquery()),
+                       PositionSnapshot.snapshot_id.not_in(latest.scalar_subquery()))
+               .all()]
+
+    for start in range(0, len(expired), chunk_size):
+        session.query(PositionSnapshot).filter(PositionSnapshot.snapshot_id.in_(expired[start:start + chunk_size])).delete(synchronize_session=False)
+        session.commit()
+    return len(expired)
@@ -0,0 +1,339 @@
+import os
+import json
+import queue
+import tempfile
+import threading
+from time import sleep, monotonic
+from datetime import date, datetime
+
+from ingest.bulk import ColumnBatch, insert_batch, DEFAULT_CHUNK_SIZE
+from orm.models import Position, LatestPosition, Quote
+
+LEVELONE_OPTIONS = 'LEVELONE_OPTIONS'
+LEVELONE_EQUITIES = 'LEVELONE_EQUITIES'
+# Streamer field numbers of the quote columns per service, the streamer only sends fields that changed
+OPTION_FIELDS = {'bid': 2, 'ask': 3, 'last': 4, 'volume': 8, 'open_interest': 9, 'mark': 37}
+EQUITY_FIELDS = {'bid': 1, 'ask': 2, 'last': 3, 'volume': 8, 'mark': 33}
+SERVICE_FIELDS = {LEVELONE_OPTIONS: OPTION_FIELDS, LEVELONE_EQUITIES: EQUITY_FIELDS}
+OPTION_ASSET_TYPES = ('CALL', 'PUT')
+
+DEFAULT_FLUSH_SECONDS = 5
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MARK_CACHE_PATH = './data/cache/marks.json'
+# Quote columns the stream owns, ivol and the Greeks are left to compute-greeks
+QUOTE_COLUMNS = ('bid', 'ask', 'last', 'open_interest', 'volume')
+
+
+def subscription_symbols(session) -> dict:
+    """
+    Symbols of the latest positions snapshot per streamer service,
+    options with their underlyings so the marks and spots move together
+    """
+    rows = (session.query(Position.symbol, Position.asset_type, Position.underlying)
+            .join(LatestPosition, LatestPosition.snapshot_id == Position.snapshot_id)
+            .all())
+    options = {symbol for symbol, asset_type, underlying in rows if asset_type in OPTION_ASSET_TYPES}
+    equities = {symbol for symbol, asset_type, underlying in rows if asset_type not in OPTION_ASSET_TYPES}
+    equities |= {underlying for symbol, asset_type, underlying in rows if asset_type in OPTION_ASSET_TYPES and underlying}
+    return {LEVELONE_OPTIONS: sorted(options), LEVELONE_EQUITIES: sorted(equities)}
+
+
+def parse_message(message) -> list:
+    """
+    (service, symbol, fields) of each quote update in a streamer message, heartbeats
+    and responses carry no data and yield nothing
+    """
+    payload = json.loads(message) if isinstance(message, (str, bytes)) else message
+    updates = []
+    for data in payload.get('data', []):
+        mapping = SERVICE_FIELDS.get(data.get('service'))
+        if mapping is None:
+            continue
+        for content in data.get('content', []):
+            fields = {name: content[str(number)] for name, number in mapping.items() if str(number) in content}
+            if fields:
+                updates.append((data['service'], content['key'], fields))
+    return updates
+
+
+class QuoteCoalescer:
+    """
+    Latest quote of every symbol, merged from the partial updates of the stream.
+    Any number of ticks between two flushes collapse into one row per symbol.
+    """
+    def __init__(self):
+        self.quotes = {}
+        self.dirty = set()
+        self.ticks = 0
+        self._lock = threading.Lock()
+
+    def update(self, symbol: str, fields: dict):
+        with self._lock:
+            self.quotes.setdefault(symbol, {}).update(fields)
+            self.dirty.add(symbol)
+            self.ticks += 1
+
+    def drain(self) -> dict:
+        """
+        The merged quote of every symbol updated since the last drain
+        """
+        with self._lock:
+            changed = {symbol: dict(self.quotes[symbol]) for symbol in self.dirty}
+            self.dirty.clear()
+        return changed
+
+
+class TickPipeline:
+    """
+    Bounded queue between the stream receiver and the coalescer.
+    While there is room receive only enqueues, so bursts never stall the websocket thread.
+    When the consumer falls behind the receiver coalesces the backlog and then the message itself,
+    which slows reading from the socket to the coalescer's pace instead of dropping ticks or growing
+    memory, and keeps the updates in arrival order. Flushing to the database reads the coalescer
+    and never holds up the queue.
+    """
+    def __init__(self, coalescer: QuoteCoalescer, maxsize: int = DEFAULT_QUEUE_SIZE):
+        self.coalescer = coalescer
+        self.queue = queue.Queue(maxsize)
+        self.received = 0
+        self.inline = 0
+        self.errors = 0
+        self._thread = None
+        self._stop = threading.Event()
+        # Held while a message is taken off the queue and coalesced so updates apply in arrival order
+        self._order = threading.Lock()
+
+    def receive(self, message, **kwargs):
+        self.received += 1
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.inline += 1
+            with self._order:
+                while True:
+                    try:
+                        self._coalesce(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._coalesce(message)
+
+    def _coalesce(self, message):
+        try:
+            for service, symbol, fields in parse_message(message):
+                self.coalescer.update(symbol, fields)
+        except (ValueError, KeyError, TypeError):
+            self.errors += 1
+
+    def _consume(self):
+        while not self._stop.is_set() or not self.queue.empty():
+            # Blocks the receiver only while the queue is empty, when it has no reason to take the lock
+            with self._order:
+                try:
+                    message = self.queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                self._coalesce(message)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop after the queued messages are coalesced
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> dict:
+        return {'received': self.received, 'inline': self.inline, 'errors': self.errors,
+                'queued': self.queue.qsize(), 'ticks': self.coalescer.ticks}
+
+
+class MarkCache:
+    """
+    Marks by symbol published by stream-quotes and read by the www workers.
+    The publisher replaces a JSON file atomically, readers keep it in memory
+    and reload it only when its modification time changes.
+    """
+    def __init__(self, path: str = DEFAULT_MARK_CACHE_PATH):
+        self.path = path
+        self.marks = {}
+        self.as_of = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def publish(self, marks: dict, as_of: datetime):
+        with self._lock:
+            self.marks.update(marks)
+            self.as_of = as_of.isoformat()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'as_of': self.as_of, 'marks': self.marks}, f)
+            os.replace(temp_path, self.path)
+
+    def refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.marks = published['marks']
+            self.as_of = published['as_of']
+            self._mtime = mtime
+
+    def get(self, symbol: str):
+        self.refresh()
+        return self.marks.get(symbol)
+
+    def snapshot(self) -> dict:
+        self.refresh()
+        return {'as_of': self.as_of, 'marks': dict(self.marks)}
+
+
+def quote_mark(quote: dict):
+    """
+    The streamed mark, or the bid/ask midpoint, or the last trade
+    """
+    if quote.get('mark'):
+        return quote['mark']
+    if quote.get('bid') and quote.get('ask'):
+        return round((quote['bid'] + quote['ask']) / 2, 4)
+    return quote.get('last')
+
+
+def flush_quotes(session, quotes: dict, day: date, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Upsert one quotes row per symbol for day in multi-row statements, the caller commits.
+    New rows get zero ivol and Greeks until compute-greeks fills them, existing rows keep theirs.
+    An existing row is only overwritten in the columns its symbol received, so quotes are
+    grouped by the columns they carry and each group is written with its own upsert.
+    """
+    groups = {}
+    for symbol, quote in quotes.items():
+        present = tuple(name for name in QUOTE_COLUMNS if name in quote)
+        batch = groups.setdefault(present, ColumnBatch(Quote.__table__))
+        batch.append({'symbol': symbol, 'date': day,
+                      'bid': quote.get('bid', 0), 'ask': quote.get('ask', 0), 'last': quote.get('last', 0),
+                      'open_interest': quote.get('open_interest', 0), 'volume': quote.get('volume', 0),
+                      'ivol': 0, 'delta': 0, 'gamma': 0, 'theta': 0, 'vega': 0, 'rho': 0})
+    # Quotes with only a mark insert a placeholder row and leave an existing one untouched
+    return sum(insert_batch(session, batch, chunk_size, ignore_duplicates=not present, update_columns=list(present))
+               for present, batch in groups.items())
+
+
+def subscribe(stream, symbols: dict, subscribed: dict) -> dict:
+    """
+    Add the symbols not yet subscribed and remove the ones no longer held.
+    Returns the new subscriptions per service.
+    """
+    builders = {LEVELONE_OPTIONS: stream.level_one_options, LEVELONE_EQUITIES: stream.level_one_equities}
+    requests = []
+    for service, build in builders.items():
+        fields = ','.join(str(number) for number in sorted({0, *SERVICE_FIELDS[service].values()}))
+        wanted, current = set(symbols.get(service, ())), set(subscribed.get(service, ()))
+        if wanted - current:
+            requests.append(build(sorted(wanted - current), fields, command='ADD'))
+        if current - wanted:
+            requests.append(build(sorted(current - wanted), fields, command='UNSUBS'))
+    if requests:
+        stream.send(requests)
+    return {service: sorted(symbols.get(service, ())) for service in builders}
+
+
+def next_bucket(now: float, seconds: float) -> float:
+    """
+    End of the flush bucket now falls in, buckets are aligned to multiples of seconds
+    """
+    return (now // seconds + 1) * seconds
+
+
+class TickRecorder:
+    """
+    Receiver that appends each raw message with its offset in seconds to a JSON lines file
+    and passes it on, the file replays with ReplayStream
+    """
+    def __init__(self, path: str, receiver):
+        self.file = open(path, 'a')
+        self.receiver = receiver
+        self.start = monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, message, **kwargs):
+        with self._lock:
+            self.file.write(json.dumps({'t': round(monotonic() - self.start, 3), 'message': message}) + '\n')
+        self.receiver(message, **kwargs)
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayStream:
+    """
+    Stands in for the schwabdev Stream with a recorded tick file, for tests and
+    benchmarks without a market or credentials. speed multiplies the recorded pace,
+    0 replays as fast as the receiver takes it.
+    """
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.active = False
+        self.requests = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _request(service: str, command: str, keys: list, fields: str) -> dict:
+        return {'service': service, 'command': command, 'parameters': {'keys': ','.join(keys), 'fields': fields}}
+
+    def level_one_options(self, keys, fields, command: str = 'ADD') -> dict:
+        return self._request(LEVELONE_OPTIONS, command, keys, fields)
+
+    def level_one_equities(self, keys, fields, command: str = 'ADD') -> dict:
+        return self._request(LEVELONE_EQUITIES, command, keys, fields)
+
+    def send(self, requests):
+        self.requests.extend(requests if isinstance(requests, list) else [requests])
+
+    def _replay(self, receiver, **kwargs):
+        while not self._stop.is_set():
+            started = monotonic()
+            with open(self.path) as f:
+                for line in f:
+                    if self._stop.is_set():
+                        break
+                    tick = json.loads(line)
+                    if self.speed:
+                        delay = tick['t'] / self.speed - (monotonic() - started)
+                        if delay > 0:
+                            sleep(delay)
+                    receiver(tick['message'], **kwargs)
+            if not self.loop:
+                break
+        self.active = False
+
+    def start(self, receiver=print, daemon: bool = True, **kwargs):
+        self._stop.clear()
+        self.active = True
+        self._thread = threading.Thread(target=self._replay, args=(receiver,), kwargs=kwargs, daemon=daemon)
+        self._thread.start()
+
+    def stop(self, clear_subscriptions: bool = True):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.active = False
+        if clear_subscriptions:
+            self.requests = []
@@ -0,0 +1,128 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, func, text, bindparam
+
+from analytics.market_calendar import market_calendar
+from ingest.bulk import ColumnBatch, insert_batch, DEFAULT_CHUNK_SIZE
+from ingest.facts import refresh_transaction_facts
+from ingest.trading_days import refresh_trading_days
+from orm.models import Broker, User, Account, Transaction, TransactionItem, Order
+
+# Synthetic rows hang off this broker so they can be told apart and purged
+SYNTHETIC_BROKER = 'Synthetic'
+UNDERLYINGS = np.array(['SPX', 'SPXW', 'QQQ', 'IWM', 'AAPL', 'MSFT', 'NVDA', 'TSLA'])
+COMMISSION_PER_CONTRACT = 0.65
+# Transactions per position on average, opening, adjusting and closing
+TRANSACTIONS_PER_POSITION = 3
+
+
+def _synthetic_accounts(session, accounts: int) -> list:
+    broker = session.query(Broker).filter(Broker.name == SYNTHETIC_BROKER).one_or_none()
+    if broker is None:
+        broker = Broker(name=SYNTHETIC_BROKER)
+        session.add(broker)
+        session.flush()
+    existing = session.query(Account).filter(Account.broker_id == broker.broker_id).order_by(Account.account_id).all()
+    if existing:
+        user_id = existing[0].user_id
+    else:
+        user = User(first_name='Synthetic', last_name='Data', email='synthetic@example.com', phone='', address='',
+                    city='', state='', zip='', country='')
+        session.add(user)
+        session.flush()
+        user_id = user.user_id
+    for i in range(len(existing), accounts):
+        account = Account(user_id=user_id, broker_id=broker.broker_id, name=f'Synthetic {i + 1}',
+                          type='TAXABLE' if i % 2 == 0 else 'IRA', balance=0)
+        session.add(account)
+        existing.append(account)
+    session.flush()
+    return [account.account_id for account in existing[:accounts]]
+
+
+def seed_synthetic(session, transactions: int, accounts: int = 3, start_year: int = 2023, end_year: int = None,
+                   seed: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Insert transactions option trades with their items and orders for synthetic accounts,
+    spread over the market days of start_year through end_year, refresh their facts and
+    trading days and commit. Meant for a scratch database to time queries at volume.
+    Returns the rows written per table.
+    """
+    rng = np.random.default_rng(seed)
+    end_year = end_year or date.today().year
+    account_ids = np.array(_synthetic_accounts(session, accounts))
+
+    first_transaction = (session.execute(select(func.max(Transaction.transaction_id))).scalar() or 0) + 1
+    first_order = (session.execute(select(func.max(Order.order_id))).scalar() or 0) + 1
+    transaction_ids = first_transaction + np.arange(transactions)
+    order_ids = first_order + np.arange(transactions)
+    days = market_calendar().market_days(date(start_year, 1, 1), min(date(end_year, 12, 31), date.today()))
+    trade_dates = np.sort(rng.choice(days, transactions))
+    account = rng.choice(account_ids, transactions)
+    position_ids = first_transaction + rng.integers(0, max(transactions // TRANSACTIONS_PER_POSITION, 1), transactions)
+    legs = rng.integers(1, 5, transactions)
+    amount = np.round(rng.normal(50, 400, transactions), 2)
+
+    transaction_batch = ColumnBatch.from_columns(Transaction.__table__, {
+        'transaction_id': transaction_ids, 'account_id': account, 'date': trade_dates.astype(object),
+        'type': np.full(transactions, 'TRADE'), 'status': np.full(transactions, 'VALID'), 'order_id': order_ids,
+        'position_id': position_ids, 'amount': amount, 'description': np.full(transactions, 'Synthetic trade')})
+
+    close_time = trade_dates.astype('datetime64[s]') + np.timedelta64(9 * 3600 + 1800, 's') + rng.integers(0, 23400, transactions).astype('timedelta64[s]')
+    order_batch = ColumnBatch.from_columns(Order.__table__, {
+        'account_id': account, 'order_id': order_ids, 'entered_time': close_time.astype(object), 'close_time': close_time.astype(object),
+        'order_type': np.full(transactions, 'NET_CREDIT'), 'quantity': legs, 'filled_quantity': legs, 'remaining_quantity': np.zeros(transactions),
+        'order_strategy_type': np.full(transactions, 'SINGLE'), 'status': np.full(transactions, 'FILLED'), 'price': np.abs(amount) / 100})
+
+    # One item per leg plus the commission item the facts spread over the legs
+    leg_transaction = np.repeat(np.arange(transactions), legs)
+    underlying = rng.choice(UNDERLYINGS, transactions)[leg_transaction]
+    expiration = (trade_dates[leg_transaction] + rng.integers(0, 60, len(leg_transaction)).astype('timedelta64[D]'))
+    strike = np.round(rng.uniform(100, 5000, len(leg_transaction)) / 5) * 5
+    put_call = rng.choice(np.array(['PUT', 'CALL']), len(leg_transaction))
+    side = rng.choice(np.array(['BUY', 'SELL']), len(leg_transaction))
+    price = np.round(rng.uniform(0.05, 20, len(leg_transaction)), 2)
+    symbol = np.char.add(np.char.add(underlying, ' '), expiration.astype(str))
+    symbol = np.char.add(np.char.add(symbol, ' '), np.char.add(put_call, strike.astype(int).astype(str)))
+    item_columns = {
+        'transaction_id': np.concatenate([transaction_ids[leg_transaction], transaction_ids]),
+        'asset_type': np.concatenate([put_call, np.full(transactions, 'CURRENCY')]),
+        'transaction': np.concatenate([side, np.full(transactions, 'FEE')]),
+        'amount': np.concatenate([price, -COMMISSION_PER_CONTRACT * legs]),
+        'quantity': np.concatenate([np.ones(len(leg_transaction)), np.zeros(transactions)]),
+        'symbol': np.concatenate([symbol, np.full(transactions, '')]),
+        'description': np.concatenate([symbol, np.full(transactions, 'COMMISSION')]),
+        'strike_price': np.concatenate([strike, np.full(transactions, None)]),
+        'expiration_date': np.concatenate([expiration.astype(object), np.full(transactions, None)]),
+        'underlying': np.concatenate([underlying, np.full(transactions, None)]),
+        'extended_amount': np.concatenate([np.where(side == 'SELL', 100.0, -100.0) * price, -COMMISSION_PER_CONTRACT * legs]),
+        'position_effect': np.concatenate([np.full(len(leg_transaction), 'OPENING'), np.full(transactions, None)])}
+    item_batch = ColumnBatch.from_columns(TransactionItem.__table__, item_columns)
+
+    rows = {'transactions': insert_batch(session, transaction_batch, chunk_size),
+            'orders': insert_batch(session, order_batch, chunk_size),
+            'transaction_items': insert_batch(session, item_batch, chunk_size)}
+    refresh_transaction_facts(session, transaction_batch.columns['transaction_id'])
+    refresh_trading_days(session, transaction_batch.columns['transaction_id'])
+    session.commit()
+    return rows
+
+
+def purge_synthetic(session) -> int:
+    """
+    Delete the synthetic accounts and everything under them. Returns the number of accounts removed.
+    """
+    account_ids = [account_id for account_id, in session.query(Account.account_id).join(Broker, Broker.broker_id == Account.broker_id)
+                   .filter(Broker.name == SYNTHETIC_BROKER).all()]
+    if account_ids:
+        # orders and transaction_facts do not cascade from accounts
+        for table in ('transaction_facts', 'orders'):
+            session.execute(text(f'delete from {table} where account_id in :ids').bindparams(bindparam('ids', expanding=True)),
+                            {'ids': account_ids})
+        user_ids = {user_id for user_id, in session.query(Account.user_id).filter(Account.account_id.in_(account_ids)).all()}
+        session.query(Account).filter(Account.account_id.in_(account_ids)).delete(synchronize_session=False)
+        session.query(User).filter(User.user_id.in_(user_ids)).delete(synchronize_session=False)
+    session.query(Broker).filter(Broker.name == SYNTHETIC_BROKER).delete(synchronize_session=False)
+    session.commit()
+    return len(account_ids)
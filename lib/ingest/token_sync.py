@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from hvac.exceptions import InvalidPath, InvalidRequest
+
+DEFAULT_TOKENS_FILE = 'tokens.json'
+DEFAULT_VAULT_PATH = 'theta_burn_tokens_json'
+DEFAULT_VAULT_MOUNT = 'kv'
+# Schwab access tokens last 30 minutes, schwabdev refreshes them itself only in the last minute
+ACCESS_TOKEN_LIFETIME = timedelta(minutes=30)
+# Tokens expiring sooner than this are refreshed at startup so a command never starts on a dying token
+DEFAULT_REFRESH_MARGIN = timedelta(minutes=5)
+DEFAULT_LOCK_TIMEOUT = 60
+
+# What client() did, for the caller to log
+CACHED = 'cached'
+PULLED = 'pulled'
+REFRESHED = 'refreshed'
+PUBLISHED = 'published'
+
+
+def issued(tokens: dict) -> datetime:
+    """
+    When the access token of a tokens file was issued, naive times are UTC
+    """
+    at = datetime.fromisoformat(tokens['access_token_issued'])
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+def _write_json(path: str, content: dict):
+    # Replaced atomically so schwabdev or another instance never reads half a file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(content, f, indent=4)
+    os.replace(temp_path, path)
+
+
+def _try_lock(f) -> bool:
+    """
+    Take the exclusive lock of an open file without waiting, flock on POSIX and msvcrt on Windows
+    """
+    f.seek(0)
+    if os.name == 'nt':
+        import msvcrt
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    import fcntl
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _unlock(f):
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class TokenSync:
+    """
+    Schwab tokens shared by every instance through a Vault kv v2 secret, with the local tokens file as cache.
+    The Vault version and issue time the file was last synced with are kept next to it, so a start with a
+    synced token that is not about to expire reads only local files. Otherwise a file lock serializes the
+    instances on this host, and writes to Vault are check-and-set on the synced version so instances on
+    other hosts never overwrite a newer token. The losing writer adopts the token in Vault instead.
+    """
+    def __init__(self, vault_client, path: str = DEFAULT_VAULT_PATH, mount: str = DEFAULT_VAULT_MOUNT,
+                 tokens_file: str = DEFAULT_TOKENS_FILE, margin: timedelta = DEFAULT_REFRESH_MARGIN,
+                 lock_timeout: float = DEFAULT_LOCK_TIMEOUT):
+        self.vault = vault_client
+        self.path = path
+        self.mount = mount
+        self.tokens_file = tokens_file
+        self.state_file = f'{tokens_file}.vault'
+        self.margin = margin
+        self.lock_timeout = lock_timeout
+        self.vault_calls = 0
+
+    def local(self) -> dict:
+        try:
+            with open(self.tokens_file) as f:
+                tokens = json.load(f)
+            issued(tokens)
+            return tokens
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def state(self) -> dict:
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, version: int, tokens: dict):
+        _write_json(self.state_file, {'version': version, 'access_token_issued': tokens['access_token_issued']})
+
+    def expires(self, tokens: dict) -> datetime:
+        return issued(tokens) + ACCESS_TOKEN_LIFETIME
+
+    def fresh(self, tokens: dict) -> bool:
+        return tokens is not None and self.expires(tokens) - self.margin > datetime.now(timezone.utc)
+
+    def synced(self, tokens: dict) -> bool:
+        """
+        Whether the tokens are the ones last read from or written to Vault
+        """
+        return tokens is not None and self.state().get('access_token_issued') == tokens['access_token_issued']
+
+    @contextmanager
+    def lock(self):
+        """
+        Exclusive lock of the tokens file between the instances on this host
+        """
+        with open(f'{self.tokens_file}.lock', 'w') as f:
+            deadline = time.monotonic() + self.lock_timeout
+            while not _try_lock(f):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'Timed out after {self.lock_timeout}s waiting for {f.name}')
+                time.sleep(0.1)
+            try:
+                yield
+            finally:
+                _unlock(f)
+
+    def read(self) -> tuple:
+        """
+        The tokens in Vault and their version, (None, 0) when the secret does not exist yet
+        """
+        self.vault_calls += 1
+        try:
+            secret = self.vault.secrets.kv.v2.read_secret_version(path=self.path, mount_point=self.mount,
+                                                                  raise_on_deleted_version=False)
+        except InvalidPath:
+            return None, 0
+        if not secret or not secret['data'].get('data'):
+            return None, secret['data']['metadata']['version'] if secret else 0
+        return secret['data']['data'], secret['data']['metadata']['version']
+
+    def pull(self, tokens: dict) -> dict:
+        """
+        Adopt the tokens in Vault when they were issued after the local ones. Returns the tokens now in the file.
+        """
+        remote, version = self.read()
+        if remote is not None and (tokens is None or issued(remote) > issued(tokens)):
+            _write_json(self.tokens_file, remote)
+            tokens = remote
+        if remote is not None and remote['access_token_issued'] == tokens['access_token_issued']:
+            self._save_state(version, tokens)
+        else:
+            # Local tokens are newer or Vault has none, publish writes them on top of this version
+            _write_json(self.state_file, {'version': version})
+        return tokens
+
+    def publish(self) -> bool:
+        """
+        Write the local tokens to Vault if they changed since the last sync, check-and-set on the synced
+        version. When another instance wrote first its tokens are pulled instead if they are newer.
+        Returns whether Vault was written.
+        """
+        tokens = self.local()
+        if tokens is None or self.synced(tokens):
+            return False
+        for _ in range(2):
+            self.vault_calls += 1
+            try:
+                result = self.vault.secrets.kv.v2.create_or_update_secret(path=self.path, secret=tokens, mount_point=self.mount,
+                                                                          cas=self.state().get('version', 0))
+            except InvalidPath:
+                # First write on this Vault, the kv v2 engine is not mounted yet
+                self.vault_calls += 1
+                self.vault.sys.enable_secrets_engine(backend_type='kv', path=self.mount, options={'version': '2'})
+                continue
+            except InvalidRequest:
+                # The version moved on, someone else synced since
+                tokens = self.pull(tokens)
+                if self.synced(tokens):
+                    return False
+                continue
+            self._save_state(result['data']['version'], tokens)
+            return True
+        return False
+
+    def client(self, create_client, refresh) -> tuple:
+        """
+        The API client from create_client() with current tokens and what it took: CACHED without any
+        Vault call, PULLED when Vault had newer tokens, REFRESHED when refresh(client) renewed them
+        and PUBLISHED when tokens refreshed by an earlier run were written to Vault.
+        """
+        tokens = self.local()
+        if self.fresh(tokens) and self.synced(tokens):
+            return create_client(), CACHED
+        with self.lock():
+            # Another instance on this host may have synced while this one waited
+            tokens = self.local()
+            if self.fresh(tokens) and self.synced(tokens):
+                return create_client(), CACHED
+            before = tokens
+            tokens = self.pull(tokens)
+            client = create_client()
+            if not self.fresh(tokens):
+                refresh(client)
+                self.publish()
+                return client, REFRESHED
+            if self.publish():
+                return client, PUBLISHED
+            return client, PULLED if tokens is not before else CACHED
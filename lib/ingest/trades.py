@@ -0,0 +1,263 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam, select, update, func, Table, Column, MetaData, Integer, BigInteger
+
+from ingest.bulk import ColumnBatch, insert_batch, DEFAULT_CHUNK_SIZE
+from ingest.generations import bump_generation
+from orm.backends import is_mysql
+from orm.models import Trade
+
+OPEN = 'OPEN'
+CLOSED = 'CLOSED'
+# Trades created by hand are never read or changed, assembled ones are extended, merged and removed by later runs
+USER = 'USER'
+ASSEMBLED = 'ASSEMBLED'
+AUTO_COMMENT = 'Assembled from position, order and expiration'
+# Remaining quantities below this are rounding noise from the DECIMAL(10,2) columns
+FLAT_TOLERANCE = 1e-6
+
+# Trade legs not yet in a trade plus the legs of open assembled trades, which may have been extended or closed since
+# The trade comes from transactions, the one copy every way of assigning a trade writes
+SELECT_LEGS = """
+select
+   f.account_id,
+   a.user_id,
+   f.transaction_id,
+   t.trade_id,
+   f.date,
+   f.order_id,
+   f.position_id,
+   f.symbol,
+   f.underlying,
+   f.asset_type,
+   f.`transaction`,
+   f.quantity,
+   f.expiration_date,
+   t.amount net_amount
+from
+   transaction_facts f
+   join transactions t on t.account_id = f.account_id and t.transaction_id = f.transaction_id
+   join accounts a on a.account_id = f.account_id
+where
+   f.`transaction` in ('BUY', 'SELL')
+   and (t.trade_id is null or t.trade_id in (select trade_id from trades where status = :open and origin = :assembled))
+   {filter}
+"""
+
+# Transaction to trade mapping for one run, so the trade_id update is a single statement.
+# The transaction_facts_trade_id trigger carries it over to transaction_facts.
+assignments = Table('trade_assignments', MetaData(),
+                    Column('account_id', Integer, primary_key=True),
+                    Column('transaction_id', BigInteger, primary_key=True),
+                    Column('trade_id', BigInteger, nullable=False),
+                    prefixes=['TEMPORARY'])
+
+ASSIGN_TRADE_IDS = """
+update transactions x
+   join trade_assignments a on a.account_id = x.account_id and a.transaction_id = x.transaction_id
+set x.trade_id = a.trade_id
+"""
+
+# SQLite has no joins in an update, the other table goes in a from clause
+ASSIGN_TRADE_IDS_FROM = """
+update transactions as x
+set trade_id = a.trade_id
+from trade_assignments a
+where a.account_id = x.account_id and a.transaction_id = x.transaction_id
+"""
+
+
+def load_legs(session, account_ids: list = None) -> pd.DataFrame:
+    query = text(SELECT_LEGS.format(filter='and f.account_id in :account_ids' if account_ids else ''))
+    params = {'open': OPEN, 'assembled': ASSEMBLED}
+    if account_ids:
+        query = query.bindparams(bindparam('account_ids', expanding=True))
+        params['account_ids'] = list(account_ids)
+    result = session.execute(query, params)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+
+def _components(frame: pd.DataFrame, keys: list) -> np.ndarray:
+    """
+    Connected components of the rows linked by sharing all of the columns of any key.
+    Each row starts with its own label and takes the minimum label of every group it
+    belongs to until no label changes, keys with a null column link nothing.
+    """
+    labels = np.arange(len(frame))
+    groups = [frame.groupby(key, dropna=True, sort=False).ngroup().to_numpy() for key in keys]
+    while True:
+        previous = labels
+        for group in groups:
+            linked = group >= 0
+            minimum = pd.Series(labels[linked]).groupby(group[linked]).transform('min').to_numpy()
+            labels = labels.copy()
+            labels[linked] = minimum
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def assemble_trades(legs: pd.DataFrame, as_of: date = None) -> tuple:
+    """
+    Group trade legs into trades.
+    Each transaction belongs to the cycle of its underlying (the symbol for legs without one) and
+    its nearest expiration, transactions without options form a cycle of their own. Within a cycle
+    transactions of the same account are linked when they share a position_id or an order_id,
+    the legs of a transaction and of an open trade stay together. Nothing links across cycles,
+    so stock held through many option cycles does not chain them into one trade.
+    Each linked group is then cut into trades wherever every symbol in it is flat again,
+    so repeated trades in the same expiration become separate trades. A trade is closed once
+    every symbol in it is flat or is an option past its expiration.
+    Returns the trades frame and the transaction to trade number mapping.
+    """
+    as_of = pd.Timestamp(as_of or date.today())
+    legs = legs.copy()
+    legs['quantity'] = legs['quantity'].astype(float) * np.where(legs['transaction'] == 'BUY', 1.0, -1.0)
+    legs['date'] = pd.to_datetime(legs['date']).dt.date
+    legs['expiration_date'] = pd.to_datetime(legs['expiration_date'])
+    legs['instrument'] = legs['underlying'].where(legs['underlying'] != '', legs['symbol'])
+    transaction = legs.groupby(['account_id', 'transaction_id'], sort=False)
+    legs['instrument'] = transaction['instrument'].transform('first')
+    legs['cycle'] = transaction['expiration_date'].transform('min').fillna(pd.Timestamp.min)
+    legs['component'] = _components(legs, [['account_id', 'transaction_id'],
+                                           ['account_id', 'instrument', 'cycle', 'position_id'],
+                                           ['account_id', 'instrument', 'cycle', 'order_id'],
+                                           ['account_id', 'trade_id']])
+
+    # Walk each component in time order and cut it after a transaction that leaves every symbol flat
+    legs = legs.sort_values(['component', 'date', 'transaction_id'], kind='stable').reset_index(drop=True)
+    position = legs.groupby(['component', 'symbol'])['quantity'].cumsum()
+    legs['open_quantity'] = (position.abs() - (position - legs['quantity']).abs()).groupby(legs['component']).cumsum()
+    members = legs.groupby(['component', 'transaction_id'], sort=False).agg(
+        account_id=('account_id', 'first'),
+        user_id=('user_id', 'first'),
+        trade_id=('trade_id', 'min'),
+        date=('date', 'first'),
+        order_id=('order_id', 'first'),
+        position_id=('position_id', 'first'),
+        net_amount=('net_amount', 'first'),
+        open_quantity=('open_quantity', 'last')).reset_index()
+    members['flat'] = members['open_quantity'].abs() < FLAT_TOLERANCE
+    members['trade'] = members.groupby('component')['flat'].transform(lambda flat: flat.shift(fill_value=False).cumsum())
+    members['trade'] = members.groupby(['component', 'trade'], sort=False).ngroup()
+    # Transactions without an order count as an order of their own
+    members['order_key'] = members['order_id'].fillna(-members['transaction_id'])
+    legs = legs.merge(members[['component', 'transaction_id', 'trade']], on=['component', 'transaction_id'])
+
+    trades = members.groupby('trade').agg(account_id=('account_id', 'first'),
+                                          user_id=('user_id', 'first'),
+                                          trade_id=('trade_id', 'min'),
+                                          open_date=('date', 'min'),
+                                          last_date=('date', 'max'),
+                                          order_id=('order_id', 'first'),
+                                          position_id=('position_id', 'first'),
+                                          amount=('net_amount', 'sum'),
+                                          orders=('order_key', 'nunique'))
+    trades = trades.join(legs.groupby('trade').agg(instrument=('instrument', 'first'),
+                                                   first_expiration=('expiration_date', 'min'),
+                                                   last_expiration=('expiration_date', 'max'),
+                                                   type=('asset_type', lambda types: '/'.join(sorted(set(types))))))
+
+
+    # A symbol is done once it is flat again or is an option past its expiration, stock never expires
+    symbols = legs.groupby(['trade', 'symbol']).agg(quantity=('quantity', 'sum'), expiration_date=('expiration_date', 'max'))
+    flat = symbols['quantity'].abs() < FLAT_TOLERANCE
+    expired = ~flat & symbols['expiration_date'].notna() & (symbols['expiration_date'] < as_of)
+    symbols = symbols.assign(flat=flat, done=flat | expired, expired_on=symbols['expiration_date'].where(expired))
+    trades = trades.join(symbols.groupby('trade').agg(flat=('flat', 'all'), done=('done', 'all'), expired_on=('expired_on', 'max')))
+
+    trades['status'] = np.where(trades['done'], CLOSED, OPEN)
+    # Options left to expire close the trade on their expiration when that is after its last transaction
+    expired_on = trades['expired_on'].dt.date
+    closes_on_expiration = ~trades['flat'] & expired_on.notna() & (expired_on > trades['last_date'])
+    trades['close_date'] = trades['last_date'].where(~closes_on_expiration, expired_on)
+    # The opening and closing orders are not adjustments, expiring legs have no closing order
+    trades['adjustments'] = (trades['orders'] - np.where(trades['flat'], 2, 1)).clip(lower=0)
+    expiration = trades['first_expiration'].dt.strftime('%Y-%m-%d')
+    spans = trades['last_expiration'] != trades['first_expiration']
+    expiration = expiration.where(~spans, expiration + ' to ' + trades['last_expiration'].dt.strftime('%Y-%m-%d'))
+    trades['description'] = (trades['instrument'] + ' ' + expiration.fillna('')).str.strip()
+    trades = trades.drop(columns=['done', 'expired_on'])
+    return trades.reset_index(), members[['account_id', 'transaction_id', 'trade']]
+
+
+def _ids(values) -> list:
+    return [None if pd.isna(value) else int(value) for value in values]
+
+
+def assign_trades(session, strategy_id: int, account_ids: list = None, as_of: date = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Assemble the unassigned trade transactions into trades in one set-based pass and commit.
+    New trades are inserted in bulk under strategy_id with user_trade_id numbered here, so the
+    trigger skips its MAX(user_trade_id) lookup. Open assembled trades are extended or closed by later
+    transactions instead of starting new trades, open assembled trades merged into another are removed.
+    Trades created by hand and their transactions are left alone.
+    transactions.trade_id is updated, transaction_facts follows by trigger, and the cache generation
+    of every account touched is bumped. Returns the counts of transactions and trades.
+    """
+    legs = load_legs(session, account_ids)
+    if legs.empty:
+        return {'transactions': 0, 'created': 0, 'updated': 0, 'removed': 0}
+    for name in ('order_id', 'position_id', 'trade_id'):
+        legs[name] = legs[name].astype('Int64')
+    trades, members = assemble_trades(legs, as_of)
+
+    # A trade keeps the lowest open trade it absorbed, the later parts of a split open trade become new trades
+    existing = trades['trade_id'].notna() & ~trades['trade_id'].duplicated()
+    updated = trades[existing]
+    new = trades[~existing].copy()
+    absorbed = set(_ids(legs['trade_id'].dropna())) - set(_ids(updated['trade_id']))
+
+    next_ids = {}
+    if len(new):
+        last = select(Trade.user_id, func.max(Trade.user_trade_id)).where(Trade.user_id.in_(_ids(new['user_id'].unique()))) \
+            .group_by(Trade.user_id).with_for_update()
+        next_ids = {user_id: int(maximum or 0) for user_id, maximum in session.execute(last).all()}
+    new['user_trade_id'] = new.groupby('user_id').cumcount() + 1 + new['user_id'].map(lambda user_id: next_ids.get(user_id, 0))
+
+    zeros = [0] * len(new)
+    insert_batch(session, ColumnBatch.from_columns(Trade.__table__, {
+        'user_trade_id': new['user_trade_id'], 'strategy_id': [strategy_id] * len(new), 'user_id': new['user_id'],
+        'account_id': new['account_id'], 'open_date': new['open_date'], 'close_date': new['close_date'],
+        'type': new['type'], 'status': new['status'], 'order_id': _ids(new['order_id']), 'position_id': _ids(new['position_id']),
+        'origin': [ASSEMBLED] * len(new),
+        'amount': new['amount'], 'profit_target': zeros, 'stop_loss_target': zeros, 'starting_margin': zeros,
+        'ending_margin': zeros, 'max_margin': zeros, 'adjustments': new['adjustments'],
+        'comment': [AUTO_COMMENT] * len(new), 'description': new['description']}), chunk_size)
+
+    # The new trades are found again by their (user_id, user_trade_id)
+    created = text('select user_trade_id, trade_id from trades where user_id = :user_id and user_trade_id > :after')
+    trade_ids = {}
+    for user_id in _ids(new['user_id'].unique()):
+        for user_trade_id, trade_id in session.execute(created, {'user_id': user_id, 'after': next_ids.get(user_id, 0)}).all():
+            trade_ids[(user_id, user_trade_id)] = trade_id
+    new['trade_id'] = [trade_ids[(int(user_id), int(user_trade_id))] for user_id, user_trade_id in zip(new['user_id'], new['user_trade_id'])]
+
+    if len(updated):
+        session.execute(update(Trade), [{'trade_id': int(row.trade_id), 'close_date': row.close_date, 'status': row.status,
+                                         'amount': row.amount, 'adjustments': int(row.adjustments), 'type': row.type,
+                                         'description': row.description}
+                                        for row in updated.itertuples()])
+
+    trade_id = pd.concat([updated, new]).set_index('trade')['trade_id']
+    connection = session.connection()
+    assignments.drop(connection, checkfirst=True)
+    assignments.create(connection)
+    insert_batch(session, ColumnBatch.from_columns(assignments, {'account_id': _ids(members['account_id']),
+                                                                 'transaction_id': _ids(members['transaction_id']),
+                                                                 'trade_id': _ids(members['trade'].map(trade_id))}), chunk_size)
+    assign = ASSIGN_TRADE_IDS if is_mysql(session) else ASSIGN_TRADE_IDS_FROM
+    session.execute(text(assign))
+    assignments.drop(connection)
+
+    removed = 0
+    if absorbed:
+        emptied = text('delete from trades where trade_id in :ids and origin = :assembled and not exists '
+                       '(select 1 from transactions t where t.trade_id = trades.trade_id)').bindparams(bindparam('ids', expanding=True))
+        removed = session.execute(emptied, {'ids': sorted(absorbed), 'assembled': ASSEMBLED}).rowcount
+    for account_id in _ids(members['account_id'].unique()):
+        bump_generation(session, account_id)
+    session.commit()
+    return {'transactions': len(members), 'created': len(new), 'updated': len(updated), 'removed': removed}
@@ -0,0 +1,160 @@
+import math
+from datetime import date
+
+from sqlalchemy import text, bindparam, Integer, Date
+
+from ingest.bulk import on_duplicate_update
+from analytics.market_calendar import market_days_between
+
+REFRESH_CHUNK_SIZE = 1000
+TARGET_TRADING_RATIO = 0.75  # IRS trader tax status wants trades on 75% of the market days
+
+# One row per account and trade date, transactions counts distinct symbol and side like trade_days.sql.
+# Distinct in a derived table since count(distinct symbol, transaction) is MariaDB only.
+SELECT_TRADING_DAYS = """
+select
+   account_id,
+   date,
+   count(*) transactions
+from (
+   select distinct
+      account_id,
+      date,
+      symbol,
+      `transaction`
+   from
+      transaction_facts
+   where
+      `transaction` in ('BUY', 'SELL')
+      {filter}
+   ) sides
+group by
+   account_id, date
+"""
+
+INSERT_TRADING_DAYS = 'insert into trading_days (account_id, date, transactions) ' + SELECT_TRADING_DAYS
+
+STATS_KEYS = ('account_id', 'year')
+STATS_COLUMNS = ('days_with_trade', 'transactions', 'first_trade', 'last_trade')
+
+INSERT_STATS = """
+insert into trading_day_stats (account_id, year, days_with_trade, transactions, first_trade, last_trade)
+select
+   account_id,
+   :year,
+   count(*),
+   sum(transactions),
+   min(date),
+   max(date)
+from
+   trading_days
+where
+   account_id = :account_id
+   and date >= :start and date < :end
+group by
+   account_id
+"""
+
+SELECT_STATS = text("""
+select
+   a.account_id,
+   a.name account,
+   a.type account_type,
+   s.days_with_trade,
+   s.transactions,
+   s.last_trade
+from
+   trading_day_stats s
+   join accounts a using (account_id)
+where
+   s.year = :year
+""")
+
+
+def upsert_trading_days(session, filter: str) -> str:
+    return (INSERT_TRADING_DAYS.format(filter=filter)
+            + on_duplicate_update(session, ('account_id', 'date'), ('transactions',)))
+
+
+def _year_bounds(year: int) -> dict:
+    return {'start': date(year, 1, 1), 'end': date(year + 1, 1, 1)}
+
+
+def refresh_trading_days(session, transaction_ids) -> set:
+    """
+    Update trading_days and trading_day_stats for the trade dates of the given transactions.
+    Reads their transaction_facts, so run it after refresh_transaction_facts in the same
+    transaction. Returns the (account_id, year) pairs refreshed.
+    """
+    transaction_ids = sorted(set(transaction_ids))
+    touched = text("select distinct account_id, date from transaction_facts "
+                   "where transaction_id in :ids and `transaction` in ('BUY', 'SELL')").bindparams(bindparam('ids', expanding=True)) \
+        .columns(account_id=Integer, date=Date)
+    trade_dates = set()
+    for start in range(0, len(transaction_ids), REFRESH_CHUNK_SIZE):
+        trade_dates.update(session.execute(touched, {'ids': transaction_ids[start:start + REFRESH_CHUNK_SIZE]}).all())
+
+    upsert = text(upsert_trading_days(session, 'and account_id = :account_id and date in :dates')).bindparams(bindparam('dates', expanding=True))
+    by_account = {}
+    for account_id, trade_date in trade_dates:
+        by_account.setdefault(account_id, []).append(trade_date)
+    for account_id, dates in by_account.items():
+        dates.sort()
+        for start in range(0, len(dates), REFRESH_CHUNK_SIZE):
+            session.execute(upsert, {'account_id': account_id, 'dates': dates[start:start + REFRESH_CHUNK_SIZE]})
+
+    years = {(account_id, trade_date.year) for account_id, trade_date in trade_dates}
+    upsert_stats = text(INSERT_STATS + on_duplicate_update(session, STATS_KEYS, STATS_COLUMNS))
+    for account_id, year in years:
+        session.execute(upsert_stats, dict(_year_bounds(year), account_id=account_id, year=year))
+    return years
+
+
+def rebuild_trading_days(session) -> int:
+    """
+    Rebuild trading_days and trading_day_stats from transaction_facts in one transaction.
+    Returns the number of (account, year) stats rows.
+    """
+    session.execute(text('delete from trading_day_stats'))
+    session.execute(text('delete from trading_days'))
+    session.execute(text(upsert_trading_days(session, '')))
+    years = session.execute(text('select distinct account_id, year(date) from trading_days')).all()
+    upsert_stats = text(INSERT_STATS + on_duplicate_update(session, STATS_KEYS, STATS_COLUMNS))
+    for account_id, year in years:
+        session.execute(upsert_stats, dict(_year_bounds(year), account_id=account_id, year=year))
+    session.commit()
+    return len(years)
+
+
+def trader_status(session, year: int = None, as_of: date = None, account_types: tuple = ('TAXABLE',)) -> list:
+    """
+    Trading ratios per account for a year from the maintained counters.
+    One primary key lookup per account, market days come from the in-memory NYSE calendar.
+    """
+    as_of = as_of or date.today()
+    year = year or as_of.year
+    days_total = market_days_between(date(year, 1, 1), date(year, 12, 31))
+    days_completed = market_days_between(date(year, 1, 1), min(as_of, date(year, 12, 31))) if as_of.year >= year else 0
+    days_left = days_total - days_completed
+    target_days = math.ceil(days_total * TARGET_TRADING_RATIO)
+
+    status = []
+    for row in session.execute(SELECT_STATS, {'year': year}).all():
+        if account_types and row.account_type not in account_types:
+            continue
+        days_with_trade = int(row.days_with_trade)
+        status.append({'year': year,
+                       'account_id': row.account_id,
+                       'account': row.account,
+                       'market_days_completed': days_completed,
+                       'market_days_left': days_left,
+                       'days_with_trade': days_with_trade,
+                       'trading_ratio_ytd': round(days_with_trade / days_completed * 100, 1) if days_completed else None,
+                       'trading_ratio': round(days_with_trade / days_total * 100, 1) if days_total else None,
+                       'transactions': int(row.transactions),
+                       'avg_daily_transactions': round(int(row.transactions) / days_completed, 2) if days_completed else None,
+                       'last_trade': str(row.last_trade) if row.last_trade else None,
+                       'target_trading_ratio': TARGET_TRADING_RATIO * 100,
+                       'target_trading_days': target_days,
+                       'days_allowed_with_no_trade': days_left - (target_days - days_with_trade)})
+    return status
@@ -0,0 +1,195 @@
+import os
+import math
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+MARIADB = 'mariadb'
+SQLITE = 'sqlite'
+BACKENDS = (MARIADB, SQLITE)
+# analytics_engine that reads the report facts from the SQLite file with DuckDB
+DUCKDB = 'duckdb'
+DEFAULT_SQLITE_PATH = './data/optionality.db'
+# Seconds a SQLite connection waits for another writer before failing with database is locked
+DEFAULT_SQLITE_BUSY_TIMEOUT = 30
+
+# MariaDB date_format specifiers and their strftime equivalents
+DATE_FORMATS = {'%Y': '%Y', '%y': '%y', '%m': '%m', '%c': '{month}', '%b': '%b', '%M': '%B', '%d': '%d', '%e': '{day}',
+                '%a': '%a', '%W': '%A', '%j': '%j', '%H': '%H', '%h': '%I', '%i': '%M', '%s': '%S', '%S': '%S',
+                '%p': '%p', '%T': '%H:%M:%S', '%%': '%%'}
+
+
+def get_backend() -> str:
+    """
+    The backend named by db_backend in .env, mariadb when unset
+    """
+    backend = os.getenv('db_backend', MARIADB).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown db_backend {backend}, use one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def sqlite_path() -> str:
+    return os.path.abspath(os.getenv('db_path') or DEFAULT_SQLITE_PATH)
+
+
+def engine_url(backend: str) -> str:
+    if backend == SQLITE:
+        os.makedirs(os.path.dirname(sqlite_path()), exist_ok=True)
+        return f'sqlite:///{sqlite_path()}'
+    db_name = os.getenv('db_name')
+    db_user = os.getenv('db_user')
+    db_password = os.getenv('db_password')
+    db_host = os.getenv('db_host')
+    # Change from utf8mb4 to utf8 to avoid encoding issues
+    return f'mysql+mysqlconnector://{db_user}:{db_password}@{db_host}/{db_name}?charset=utf8&collation=utf8_unicode_ci'
+
+
+def connect_args(backend: str) -> dict:
+    if backend == SQLITE:
+        # Pooled connections move between the fetch threads, SQLite serializes the writes itself
+        return {'check_same_thread': False,
+                'timeout': float(os.getenv('db_busy_timeout', DEFAULT_SQLITE_BUSY_TIMEOUT))}
+    return {}
+
+
+def is_mysql(session) -> bool:
+    """
+    Whether the session talks to MariaDB, the dialect the hand written SQL was first written for
+    """
+    return session.get_bind().dialect.name in ('mysql', 'mariadb')
+
+
+def _datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def _year(value):
+    value = _datetime(value)
+    return value.year if value else None
+
+
+def _month(value):
+    value = _datetime(value)
+    return value.month if value else None
+
+
+def _date_format(value, format):
+    value = _datetime(value)
+    if value is None or format is None:
+        return None
+    parts = []
+    i = 0
+    while i < len(format):
+        specifier = format[i:i + 2]
+        if specifier in DATE_FORMATS:
+            parts.append(DATE_FORMATS[specifier].format(month=value.month, day=value.day))
+            i += 2
+        else:
+            parts.append(format[i].replace('%', '%%'))
+            i += 1
+    return value.strftime(''.join(parts))
+
+
+def _datediff(end, start):
+    if end is None or start is None:
+        return None
+    return (_datetime(end).date() - _datetime(start).date()).days
+
+
+def _makedate(year, day_of_year):
+    if year is None or day_of_year is None or day_of_year < 1:
+        return None
+    return (date(int(year), 1, 1) + timedelta(days=int(day_of_year) - 1)).isoformat()
+
+
+def _if(condition, when_true, when_false):
+    return when_true if condition else when_false
+
+
+def _greatest(*values):
+    return None if any(value is None for value in values) else max(values)
+
+
+def _least(*values):
+    return None if any(value is None for value in values) else min(values)
+
+
+def _concat(*values):
+    return None if any(value is None for value in values) else ''.join(str(value) for value in values)
+
+
+def _format(number, decimals):
+    if number is None or decimals is None:
+        return None
+    return f'{float(number):,.{int(decimals)}f}'
+
+
+def _ceil(number):
+    return None if number is None else math.ceil(number)
+
+
+# (name, arguments, function, deterministic) registered on every SQLite connection so the view,
+# the ingest SQL and the lib/sql reports run unchanged. -1 arguments is variadic.
+SQLITE_FUNCTIONS = (
+    ('year', 1, _year, True),
+    ('month', 1, _month, True),
+    ('date_format', 2, _date_format, True),
+    ('datediff', 2, _datediff, True),
+    ('makedate', 2, _makedate, True),
+    ('if', 3, _if, True),
+    ('greatest', -1, _greatest, True),
+    ('least', -1, _least, True),
+    ('concat', -1, _concat, True),
+    ('format', 2, _format, True),
+    ('ceil', 1, _ceil, True),
+    ('now', 0, lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'), False),
+    ('curdate', 0, lambda: date.today().isoformat(), False),
+)
+
+
+def configure_sqlite(engine):
+    """
+    Enforce foreign keys, which SQLite leaves off per connection, let readers run beside
+    the writer and register the MariaDB functions on every new connection of the engine
+    """
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.execute('PRAGMA journal_mode = WAL')
+        cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.close()
+        for name, arguments, function, deterministic in SQLITE_FUNCTIONS:
+            dbapi_connection.create_function(name, arguments, function, deterministic=deterministic)
+
+
+def duckdb_source() -> str:
+    """
+    The SQLite file the reports read with DuckDB when analytics_engine = duckdb, None to read through SQLAlchemy
+    """
+    if os.getenv('analytics_engine', '').lower() != DUCKDB:
+        return None
+    if get_backend() != SQLITE:
+        raise ValueError('analytics_engine = duckdb reads the SQLite file, set db_backend = sqlite')
+    return sqlite_path()
+
+
+def duckdb_connect(path: str = None):
+    """
+    In-memory DuckDB connection with the SQLite database file attached read-only as store,
+    for reading the report facts with DuckDB's columnar engine. duckdb is optional.
+    """
+    try:
+        import duckdb
+    except ImportError:
+        raise ValueError('analytics_engine = duckdb needs the duckdb package, pip install duckdb')
+    connection = duckdb.connect()
+    connection.execute('INSTALL sqlite')
+    connection.execute('LOAD sqlite')
+    connection.execute(f"ATTACH '{path or sqlite_path()}' AS store (TYPE sqlite, READ_ONLY)")
+    return connection
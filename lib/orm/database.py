@@ -1,38 +1,120 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 import os
 from .models import Base
+from .backends import get_backend, engine_url, connect_args, configure_sqlite, SQLITE
 from dotenv import load_dotenv
 from contextlib import contextmanager
+from collections import deque
+from threading import Lock
+from time import perf_counter
+
+# Pool defaults, overridden by db_pool_* in .env
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_TIMEOUT = 30  # seconds to wait for a connection before giving up
+DEFAULT_POOL_RECYCLE = 3600  # seconds, below MariaDB's wait_timeout
+
+class PoolMetrics:
+    """
+    Connection checkout wait times, the last window checkouts are kept for percentiles
+    """
+    def __init__(self, window: int = 1000):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waits = deque(maxlen=window)
+        self._lock = Lock()
+
+    def record(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.waits.append(wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self.waits)
+        def percentile(q):
+            return waits[min(int(q * len(waits)), len(waits) - 1)] * 1000 if waits else 0.0
+        return {'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_ms_avg': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                'wait_ms_p50': percentile(0.50),
+                'wait_ms_p95': percentile(0.95),
+                'wait_ms_p99': percentile(0.99),
+                'wait_ms_max': self.max_wait * 1000}
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited, including pre-ping
+    """
+    metrics = None
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            raise
+        if self.metrics is not None:
+            self.metrics.record(perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
 
 class Database:
     def __init__(self):
         # Load environment variables from .env file
         load_dotenv()
 
-        db_name = os.getenv('db_name')
-        db_user = os.getenv('db_user')
-        db_password = os.getenv('db_password')
-        db_host = os.getenv('db_host')
+        # mariadb by default, sqlite keeps the whole database in the db_path file
+        self.backend = get_backend()
+        self.pool_size = int(os.getenv('db_pool_size', DEFAULT_POOL_SIZE))
+        self.max_overflow = int(os.getenv('db_max_overflow', DEFAULT_MAX_OVERFLOW))
+        self.metrics = PoolMetrics()
 
-        # Change from utf8mb4 to utf8 to avoid encoding issues
-        self.engine = create_engine(f'mysql+mysqlconnector://{db_user}:{db_password}@{db_host}/{db_name}?charset=utf8&collation=utf8_unicode_ci')
+        self.engine = create_engine(engine_url(self.backend),
+                                    connect_args=connect_args(self.backend),
+                                    poolclass=InstrumentedQueuePool,
+                                    pool_size=self.pool_size,
+                                    max_overflow=self.max_overflow,
+                                    pool_timeout=float(os.getenv('db_pool_timeout', DEFAULT_POOL_TIMEOUT)),
+                                    pool_recycle=int(os.getenv('db_pool_recycle', DEFAULT_POOL_RECYCLE)),
+                                    pool_pre_ping=os.getenv('db_pool_pre_ping', 'true').lower() == 'true')
+        self.engine.pool.metrics = self.metrics
+        if self.backend == SQLITE:
+            configure_sqlite(self.engine)
         self.session_factory = sessionmaker(bind=self.engine)
+        # One session per thread
         self.Session = scoped_session(self.session_factory)
-        self._singleton_session = None
+
+        # A forked worker must open its own connections instead of sharing the parent's sockets
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: self.engine.dispose(close=False))
 
     def get_session(self, singleton=True):
+        """
+        The calling thread's session, or with singleton=False a new session the caller must close
+        """
         if singleton:
-            if self._singleton_session is None:
-                self._singleton_session = self.Session()
-            return self._singleton_session
-        else:
             return self.Session()
+        else:
+            return self.session_factory()
 
     @contextmanager
     def session_scope(self):
-        """Provide a transactional scope around a series of operations."""
-        session = self.get_session()
+        """Provide a transactional scope around a series of operations on a session of its own."""
+        session = self.session_factory()
         try:
             yield session
             session.commit()
@@ -44,12 +126,20 @@ class Database:
 
     def get_engine(self):
         return self.engine
-    
+
+    def pool_stats(self) -> dict:
+        """
+        Checkout wait times and current pool usage, saturation is checked out over pool_size + max_overflow
+        """
+        pool = self.engine.pool
+        checked_out = pool.checkedout()
+        return dict(self.metrics.snapshot(),
+                    pool_size=self.pool_size,
+                    max_overflow=self.max_overflow,
+                    checked_out=checked_out,
+                    overflow=max(pool.overflow(), 0),
+                    saturation=checked_out / (self.pool_size + self.max_overflow))
+
     def close(self):
-        if self._singleton_session is not None:
-            self._singleton_session.close()
         self.Session.remove()
         self.engine.dispose()
-
-# Example usage
-db_instance = Database()
\ No newline at end of file
@@ -0,0 +1,127 @@
+import os
+import re
+import hashlib
+
+from sqlalchemy import select, text, inspect
+
+from .models import SchemaMigration
+from .backends import is_mysql
+
+MIGRATIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sql', 'migrations'))
+SCHEMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sql', 'optionality.sql'))
+SQLITE_SCHEMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sql', 'sqlite', 'optionality.sql'))
+
+# 0001_report_indexes.sql -> version 1, name report_indexes
+MIGRATION_FILE = re.compile(r'(\d+)_(\w+)\.sql')
+COMMENT = re.compile(r'^\s*(#|--).*$', re.MULTILINE)
+# mysql client directive that changes the statement terminator, used around trigger bodies
+DELIMITER = re.compile(r'^\s*DELIMITER\s+(\S+)\s*$', re.MULTILINE | re.IGNORECASE)
+CREATE_DATABASE = re.compile(r'^create\s+database\b', re.IGNORECASE)
+
+
+def split_statements(sql: str) -> list:
+    """
+    Statements of a SQL script, comment lines removed. Statements end with a semicolon, or with
+    the terminator set by a DELIMITER line so a trigger body stays one statement.
+    """
+    sql = COMMENT.sub('', sql)
+    segments = []
+    delimiter = ';'
+    position = 0
+    for match in DELIMITER.finditer(sql):
+        segments.append((sql[position:match.start()], delimiter))
+        delimiter = match.group(1)
+        position = match.end()
+    segments.append((sql[position:], delimiter))
+    return [statement.strip().rstrip(';').strip() for segment, delimiter in segments
+            for statement in segment.split(delimiter) if statement.strip().rstrip(';').strip()]
+
+
+def available_migrations(directory: str = MIGRATIONS_DIR) -> list:
+    """
+    (version, name, path) of every migration file in version order
+    """
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.fullmatch(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    return sorted(migrations)
+
+
+def checksum(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def applied_migrations(session) -> dict:
+    """
+    Checksum by version of the applied migrations, none before schema_migrations exists
+    """
+    if not inspect(session.get_bind()).has_table(SchemaMigration.__tablename__):
+        return {}
+    return dict(session.execute(select(SchemaMigration.version, SchemaMigration.checksum)).all())
+
+
+def pending_migrations(session, directory: str = MIGRATIONS_DIR) -> list:
+    """
+    Migrations not yet applied. Raises ValueError when an applied migration file was edited since.
+    """
+    applied = applied_migrations(session)
+    changed = [name for version, name, path in available_migrations(directory)
+               if version in applied and applied[version] != checksum(path)]
+    if changed:
+        raise ValueError(f"Applied migrations were modified, add a new migration instead: {', '.join(changed)}")
+    return [migration for migration in available_migrations(directory) if migration[0] not in applied]
+
+
+def apply_migrations(session, directory: str = MIGRATIONS_DIR, target: int = None) -> list:
+    """
+    Apply the pending migrations up to target in version order, each recorded as soon as it completes
+    since MariaDB commits DDL implicitly. Creates schema_migrations in a database that predates it.
+    Returns the (version, name) applied.
+    """
+    SchemaMigration.__table__.create(session.get_bind(), checkfirst=True)
+    applied = []
+    for version, name, path in pending_migrations(session, directory):
+        if target is not None and version > target:
+            break
+        with open(path) as f:
+            statements = split_statements(f.read())
+        for statement in statements:
+            session.execute(text(statement))
+        session.add(SchemaMigration(version=version, name=name, checksum=checksum(path)))
+        session.commit()
+        applied.append((version, name))
+    return applied
+
+
+def record_migrations(session, directory: str = MIGRATIONS_DIR) -> list:
+    """
+    Mark every migration applied without running it, for a database created from a schema script
+    that already includes them. Returns the (version, name) recorded.
+    """
+    SchemaMigration.__table__.create(session.get_bind(), checkfirst=True)
+    recorded = []
+    for version, name, path in pending_migrations(session, directory):
+        session.add(SchemaMigration(version=version, name=name, checksum=checksum(path)))
+        recorded.append((version, name))
+    session.commit()
+    return recorded
+
+
+def create_schema(session, path: str = None) -> int:
+    """
+    Create the tables, triggers and views of the schema script in the session's database, skipping its
+    create database, and record the migrations as applied since the scripts are kept current with them.
+    For an empty scratch database. The script defaults to the one for the session's backend.
+    Returns the statements run.
+    """
+    path = path or (SCHEMA_PATH if is_mysql(session) else SQLITE_SCHEMA_PATH)
+    with open(path) as f:
+        statements = [statement for statement in split_statements(f.read()) if not CREATE_DATABASE.match(statement)]
+    for statement in statements:
+        session.execute(text(statement))
+    session.commit()
+    record_migrations(session)
+    return len(statements)
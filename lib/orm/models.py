@@ -1,5 +1,5 @@
 from sqlalchemy import create_engine, Column, Integer, String, DECIMAL, Date, DateTime, ForeignKey
-from sqlalchemy import Boolean, Text, CHAR, BigInteger
+from sqlalchemy import Boolean, Text, CHAR, BigInteger, UniqueConstraint, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -75,6 +75,8 @@ class Trade(BaseModel):
     status = Column(String(255), nullable=False)
     order_id = Column(BigInteger)
     position_id = Column(BigInteger)
+    # USER for trades created by hand, ASSEMBLED for trades assign-trades may extend, merge or remove
+    origin = Column(String(16), nullable=False, default='USER')
     amount = Column(DECIMAL(10,2), nullable=False)
     profit_target = Column(DECIMAL(10,2), nullable=False)
     stop_loss_target = Column(DECIMAL(10,2), nullable=False)
@@ -84,6 +86,7 @@ class Trade(BaseModel):
     adjustments = Column(Integer, default=0)
     comment = Column(String(1024))
     description = Column(String(255), nullable=False)
+    __table_args__ = (UniqueConstraint('user_id', 'user_trade_id', name='uq_trades_user_trade'),)
     strategy = relationship("Strategy")
     user = relationship("User")
     account = relationship("Account")
@@ -121,6 +124,7 @@ class TransactionItem(BaseModel):
 
 class Quote(BaseModel):
     __tablename__ = 'quotes'
+    __table_args__ = (UniqueConstraint('symbol', 'date', name='uq_quotes_symbol_date'),)
     quote_id = Column(BigInteger, primary_key=True, autoincrement=True)
     symbol = Column(String(255), nullable=False)
     date = Column(Date, nullable=False)
@@ -129,12 +133,12 @@ class Quote(BaseModel):
     last = Column(DECIMAL(10,2), nullable=False)
     open_interest = Column(Integer, nullable=False)
     volume = Column(Integer, nullable=False)
-    ivol = Column(DECIMAL(10,2), nullable=False)
-    delta = Column(DECIMAL(10,2), nullable=False)
-    gamma = Column(DECIMAL(10,2), nullable=False)
-    theta = Column(DECIMAL(10,2), nullable=False)
-    vega = Column(DECIMAL(10,2), nullable=False)
-    rho = Column(DECIMAL(10,2), nullable=False)
+    ivol = Column(DECIMAL(12,6), nullable=False)
+    delta = Column(DECIMAL(12,6), nullable=False)
+    gamma = Column(DECIMAL(12,6), nullable=False)
+    theta = Column(DECIMAL(12,6), nullable=False)
+    vega = Column(DECIMAL(12,6), nullable=False)
+    rho = Column(DECIMAL(12,6), nullable=False)
 
 class Calendar(BaseModel):
     __tablename__ = 'calendar'
@@ -152,12 +156,28 @@ class Calendar(BaseModel):
     is_holiday = Column(Boolean)
     is_current_year = Column(Boolean)
     is_current_month = Column(Boolean)
+    is_early_close = Column(Boolean)
     is_market_open = Column(Boolean)
     
+class PositionSnapshot(BaseModel):
+    __tablename__ = 'position_snapshots'
+    snapshot_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    account_id = Column(Integer, ForeignKey('accounts.account_id'), nullable=False)
+    date = Column(DateTime, nullable=False)
+    position_count = Column(Integer, nullable=False, default=0)
+    account = relationship("Account")
+
+class LatestPosition(BaseModel):
+    __tablename__ = 'latest_positions'
+    account_id = Column(Integer, ForeignKey('accounts.account_id'), primary_key=True)
+    snapshot_id = Column(BigInteger, ForeignKey('position_snapshots.snapshot_id'), nullable=False)
+    snapshot = relationship("PositionSnapshot")
+
 class Position(BaseModel):
     __tablename__ = 'positions'
     position_id = Column(BigInteger, primary_key=True, autoincrement=True)
     account_id = Column(Integer, ForeignKey('accounts.account_id'), nullable=False)
+    snapshot_id = Column(BigInteger, ForeignKey('position_snapshots.snapshot_id'))
     date = Column(DateTime, nullable=False)
     asset_type = Column(String(255))
     short_quantity = Column(DECIMAL(10, 2))
@@ -218,9 +238,19 @@ class OrderItem(BaseModel):
 class Security(BaseModel):
     __tablename__ = 'securities'
     symbol = Column(String(255), primary_key=True)
+    cusip = Column(String(255))
     description = Column(String(255), nullable=False)
     exchange = Column(String(255), nullable=False)
     asset_type = Column(String(255), nullable=False)
+    updated_at = Column(DateTime)
+
+class SyncCheckpoint(BaseModel):
+    __tablename__ = 'sync_checkpoints'
+    account_id = Column(Integer, ForeignKey('accounts.account_id'), primary_key=True)
+    type = Column(String(255), primary_key=True)
+    high_water_mark = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime)
+    account = relationship("Account")
 
 class TransactionView(BaseModel):
     __tablename__ = 'transaction_view'
@@ -247,4 +277,57 @@ class TransactionView(BaseModel):
                              
     def to_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
-     
\ No newline at end of file
+     
+class TransactionFact(BaseModel):
+    __tablename__ = 'transaction_facts'
+    item_id = Column(BigInteger, primary_key=True)
+    account_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    month = Column(String(3))
+    year = Column(Integer)
+    transaction_id = Column(BigInteger, nullable=False)
+    position_id = Column(BigInteger)
+    trade_id = Column(BigInteger)
+    order_id = Column(BigInteger)
+    order_date = Column(DateTime)
+    description = Column(String(255))
+    quantity = Column(DECIMAL(10, 2))
+    symbol = Column(String(255))
+    underlying = Column(String(255))
+    amount = Column(DECIMAL(10, 2))
+    commission = Column(DECIMAL(15, 6))
+    fees = Column(DECIMAL(15, 6))
+    transaction = Column(String(255))
+    asset_type = Column(String(255))
+    expiration_date = Column(Date)
+    strike_price = Column(DECIMAL(10, 2))
+    extended_amount = Column(DECIMAL(10, 2))
+
+class TradingDay(BaseModel):
+    __tablename__ = 'trading_days'
+    account_id = Column(Integer, ForeignKey('accounts.account_id'), primary_key=True)
+    date = Column(Date, primary_key=True)
+    transactions = Column(Integer, nullable=False)
+
+class TradingDayStats(BaseModel):
+    __tablename__ = 'trading_day_stats'
+    account_id = Column(Integer, ForeignKey('accounts.account_id'), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    days_with_trade = Column(Integer, nullable=False)
+    transactions = Column(Integer, nullable=False)
+    first_trade = Column(Date)
+    last_trade = Column(Date)
+    updated_at = Column(DateTime)
+
+class CacheGeneration(BaseModel):
+    __tablename__ = 'cache_generations'
+    tag = Column(String(255), primary_key=True)
+    generation = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime)
+
+class SchemaMigration(BaseModel):
+    __tablename__ = 'schema_migrations'
+    version = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    checksum = Column(CHAR(64), nullable=False)
+    applied_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,89 @@
+import os
+import statistics
+from time import perf_counter
+
+from sqlalchemy import text, exc
+
+from .backends import is_mysql
+
+SQL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sql'))
+# Schema scripts rather than reports
+EXCLUDED_FILES = ('optionality.sql',)
+VIEWS = ('transaction_view', 'current_positions')
+
+# EXPLAIN access types that read the whole table or the whole index
+FULL_SCAN_TYPES = ('ALL', 'index')
+# SQLite's EXPLAIN QUERY PLAN step for a table or index read in full, SEARCH steps use an index
+SQLITE_SCAN = 'SCAN '
+# Full scans of tables estimated below this many rows are not worth flagging
+DEFAULT_MIN_ROWS = 1000
+
+
+def report_queries(directory: str = SQL_DIR) -> dict:
+    """
+    The report queries in directory by file name, plus a select of every view
+    """
+    queries = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.sql') and filename not in EXCLUDED_FILES:
+            with open(os.path.join(directory, filename)) as f:
+                queries[filename[:-4]] = f.read().strip().rstrip(';')
+    queries.update({view: f'select * from {view}' for view in VIEWS})
+    return queries
+
+
+def explain(session, sql: str, analyze: bool = False) -> list:
+    """
+    The query plan as one dict per row. ANALYZE runs the query and adds the actual
+    r_rows and r_filtered next to the optimizer estimates. SQLite has neither ANALYZE
+    nor row estimates, its plan is the EXPLAIN QUERY PLAN tree.
+    """
+    if not is_mysql(session):
+        analyze = False
+        sql = f'QUERY PLAN {sql}'
+    result = session.execute(text(f"{'ANALYZE' if analyze else 'EXPLAIN'} {sql}"))
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result.all()]
+
+
+def full_scans(plan: list, min_rows: int = DEFAULT_MIN_ROWS) -> list:
+    """
+    Tables of the plan read in full, with the rows the optimizer expects to read.
+    SQLite plans carry no estimate so all of their scans are listed.
+    """
+    if plan and 'detail' in plan[0]:
+        return [step['detail'] for step in plan if step['detail'].startswith(SQLITE_SCAN)]
+    return [f"{step['table']} ({step['type']}, {int(step['rows'] or 0):,} rows)" for step in plan
+            if step.get('type') in FULL_SCAN_TYPES and int(step.get('rows') or 0) >= min_rows]
+
+
+def time_query(session, sql: str, repeat: int = 3) -> tuple:
+    """
+    Median seconds over repeat runs fetching every row, and the number of rows
+    """
+    timings = []
+    rows = 0
+    for _ in range(max(repeat, 1)):
+        start = perf_counter()
+        rows = len(session.execute(text(sql)).all())
+        timings.append(perf_counter() - start)
+    return statistics.median(timings), rows
+
+
+def audit(session, queries: dict, analyze: bool = False, repeat: int = 3, min_rows: int = DEFAULT_MIN_ROWS) -> list:
+    """
+    Plan, full scans and timing of each query. A query that fails is reported with its error
+    and does not stop the audit.
+    """
+    results = []
+    for name, sql in queries.items():
+        try:
+            plan = explain(session, sql, analyze)
+            seconds, rows = time_query(session, sql, repeat)
+        except exc.DBAPIError as e:
+            session.rollback()
+            results.append({'query': name, 'seconds': None, 'rows': None, 'full_scans': [], 'plan': [], 'error': str(e.orig)})
+            continue
+        results.append({'query': name, 'seconds': seconds, 'rows': rows, 'full_scans': full_scans(plan, min_rows),
+                        'plan': plan, 'error': None})
+    return results
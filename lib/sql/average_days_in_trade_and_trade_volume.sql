@@ -11,8 +11,8 @@ from
    join transaction_items ti using (transaction_id)
    join accounts a using (account_id)
 where 
-   year(date) in (2023, 2024) and t.type = 'TRADE'
-   and transaction in ('SELL', 'BUY')
+   t.type = 'TRADE' and t.date >= '2023-01-01' and t.date < '2025-01-01'
+   and `transaction` in ('SELL', 'BUY')
 group by 1, 2, 3
 having transactions > 1
 ) a
@@ -10,10 +10,9 @@ from (
          tv.asset_type,
          sum(extended_amount) extended_amount
       from
-         transaction_view tv
+         transaction_facts tv
       group by 1,2,3) t
-     left join positions p on (t.account_id = p.account_id 
-                               and t.underlying = p.underlying 
-                               and t.asset_type = p.asset_type 
-                               and latest = 'Y') 
+     left join current_positions p on (t.account_id = p.account_id 
+                                       and t.underlying = p.underlying 
+                                       and t.asset_type = p.asset_type) 
 group by 1,2
\ No newline at end of file
@@ -0,0 +1,171 @@
+# Upgrade a database created from the original optionality.sql to the tables and columns the ingest,
+# snapshot, facts and trade assembly code expects. Databases created by init-db already have them and
+# record this migration as applied. IF [NOT] EXISTS lets a run that failed part way be repeated,
+# MariaDB commits every statement on its own.
+# transaction_facts and trading_days start empty, fill them with theta_burn.py rebuild-transaction-facts
+# and rebuild-trading-days afterwards.
+
+# Security metadata cache
+ALTER TABLE securities
+    ADD COLUMN IF NOT EXISTS cusip VARCHAR(255) AFTER symbol,
+    ADD COLUMN IF NOT EXISTS updated_at DATETIME,
+    ADD INDEX IF NOT EXISTS idx_securities_cusip (cusip);
+
+# High-water mark of the last synced window per account and API type (TRADE, DIVIDEND_OR_INTEREST, ORDERS)
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+    account_id INT NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    high_water_mark DATETIME NOT NULL,
+    updated_at DATETIME,
+    PRIMARY KEY (account_id, type),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+# Positions as append-only snapshots with a latest pointer per account
+CREATE TABLE IF NOT EXISTS position_snapshots (
+    snapshot_id bigint AUTO_INCREMENT PRIMARY KEY,
+    account_id INT NOT NULL,
+    date datetime NOT NULL,
+    position_count INT NOT NULL default 0,
+    INDEX idx_snapshot_account_date (account_id, date),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+ALTER TABLE positions
+    CHANGE COLUMN IF EXISTS underlying_symbol underlying VARCHAR(255),
+    ADD COLUMN IF NOT EXISTS snapshot_id bigint AFTER account_id,
+    ADD INDEX IF NOT EXISTS idx_positions_snapshot (snapshot_id),
+    ADD CONSTRAINT fk_positions_snapshot FOREIGN KEY IF NOT EXISTS (snapshot_id)
+        REFERENCES position_snapshots(snapshot_id) ON DELETE CASCADE;
+
+CREATE TABLE IF NOT EXISTS latest_positions (
+    account_id INT PRIMARY KEY,
+    snapshot_id bigint NOT NULL,
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
+    FOREIGN KEY (snapshot_id) REFERENCES position_snapshots(snapshot_id)
+);
+
+# The rows flagged latest become each account's first snapshot
+INSERT INTO position_snapshots (account_id, date, position_count)
+SELECT account_id, max(date), count(*)
+FROM positions
+WHERE latest = 'Y' AND snapshot_id IS NULL
+  AND account_id NOT IN (SELECT account_id FROM latest_positions)
+GROUP BY account_id;
+
+UPDATE positions p
+   JOIN position_snapshots s ON (s.account_id = p.account_id)
+SET p.snapshot_id = s.snapshot_id
+WHERE p.latest = 'Y' AND p.snapshot_id IS NULL
+  AND p.account_id NOT IN (SELECT account_id FROM latest_positions);
+
+INSERT IGNORE INTO latest_positions (account_id, snapshot_id)
+SELECT account_id, max(snapshot_id) FROM position_snapshots GROUP BY account_id;
+
+create or replace view current_positions as (
+select
+   p.*
+from
+   latest_positions lp
+   join positions p on (p.snapshot_id = lp.snapshot_id)
+);
+
+ALTER TABLE order_items
+    CHANGE COLUMN IF EXISTS underlying_symbol underlying VARCHAR(255);
+
+# Greeks need more than two decimals, one quote row per symbol and day
+ALTER TABLE quotes
+    MODIFY COLUMN ivol DECIMAL(12,6) NOT NULL,
+    MODIFY COLUMN delta DECIMAL(12,6) NOT NULL,
+    MODIFY COLUMN gamma DECIMAL(12,6) NOT NULL,
+    MODIFY COLUMN theta DECIMAL(12,6) NOT NULL,
+    MODIFY COLUMN vega DECIMAL(12,6) NOT NULL,
+    MODIFY COLUMN rho DECIMAL(12,6) NOT NULL;
+
+DELETE q FROM quotes q
+   JOIN quotes newer ON (newer.symbol = q.symbol AND newer.date = q.date AND newer.quote_id > q.quote_id);
+
+ALTER TABLE quotes
+    ADD UNIQUE KEY IF NOT EXISTS uq_quotes_symbol_date (symbol, date);
+
+ALTER TABLE calendar
+    ADD COLUMN IF NOT EXISTS is_early_close BOOLEAN AFTER is_current_month;
+
+# transaction_view materialized, one row per item
+CREATE TABLE IF NOT EXISTS transaction_facts (
+    item_id bigint PRIMARY KEY,
+    account_id INT NOT NULL,
+    date DATE NOT NULL,
+    month CHAR(3),
+    year INT,
+    transaction_id bigint NOT NULL,
+    position_id bigint,
+    trade_id bigint,
+    order_id bigint,
+    order_date DATETIME,
+    description VARCHAR(255),
+    quantity DECIMAL(10,2),
+    symbol VARCHAR(255),
+    underlying VARCHAR(255),
+    amount DECIMAL(10,2),
+    commission DECIMAL(15,6),
+    fees DECIMAL(15,6),
+    transaction VARCHAR(255),
+    asset_type VARCHAR(255),
+    expiration_date DATE,
+    strike_price DECIMAL(10,2),
+    extended_amount DECIMAL(10,2),
+    INDEX idx_facts_account_date (account_id, date),
+    INDEX idx_facts_underlying (underlying),
+    INDEX idx_facts_trade (trade_id),
+    INDEX idx_facts_transaction (transaction_id),
+    INDEX idx_facts_unassigned (trade_id, account_id, date, item_id)
+);
+
+# Trader status counters
+CREATE TABLE IF NOT EXISTS trading_days (
+    account_id INT NOT NULL,
+    date DATE NOT NULL,
+    transactions INT NOT NULL,
+    PRIMARY KEY (account_id, date),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS trading_day_stats (
+    account_id INT NOT NULL,
+    year INT NOT NULL,
+    days_with_trade INT NOT NULL,
+    transactions INT NOT NULL,
+    first_trade DATE,
+    last_trade DATE,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, year),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+# www response cache generations
+CREATE TABLE IF NOT EXISTS cache_generations (
+    tag VARCHAR(255) PRIMARY KEY,
+    generation BIGINT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+# Trade assembly links trades to their order and position and numbers bulk inserts itself
+ALTER TABLE trades
+    ADD COLUMN IF NOT EXISTS order_id bigint AFTER status,
+    ADD COLUMN IF NOT EXISTS position_id bigint AFTER order_id,
+    ADD UNIQUE KEY IF NOT EXISTS uq_trades_user_trade (user_id, user_trade_id),
+    ADD INDEX IF NOT EXISTS idx_trades_status (status);
+
+DROP TRIGGER IF EXISTS increment_based_on_other;
+
+DELIMITER //
+CREATE TRIGGER increment_based_on_other BEFORE INSERT ON trades
+FOR EACH ROW
+BEGIN
+   # Bulk inserts from assign-trades number their rows, only single trades need the lookup
+   IF NEW.user_trade_id = 0 THEN
+      SET NEW.user_trade_id = IFNULL((SELECT MAX(user_trade_id) FROM trades WHERE user_id = NEW.user_id), 0) + 1;
+   END IF;
+END;//
+DELIMITER ;
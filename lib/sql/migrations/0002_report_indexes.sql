@@ -0,0 +1,25 @@
+# Covering indexes for the report queries, transaction_view and the trade assembly.
+# optionality.sql already creates them for new databases, which record this migration as applied.
+
+# Reports filter trades on type and a date range, account and position come from the index
+CREATE INDEX IF NOT EXISTS idx_transactions_type_date ON transactions (type, date, account_id, position_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_trade ON transactions (trade_id);
+
+# Items are always reached by transaction_id and filtered on the BUY/SELL side
+CREATE INDEX IF NOT EXISTS idx_items_transaction ON transaction_items (transaction_id, `transaction`, symbol);
+
+# transaction_view joins orders on order_id alone, the primary key leads with account_id
+CREATE INDEX IF NOT EXISTS idx_orders_order ON orders (order_id, close_time);
+
+# current_positions, the payoff legs, the Greeks and the stream subscriptions join the latest snapshot
+# and filter on asset type, lifetime P/L matches its positions by underlying
+CREATE INDEX IF NOT EXISTS idx_positions_snapshot_asset_type ON positions (snapshot_id, asset_type);
+CREATE INDEX IF NOT EXISTS idx_positions_snapshot_underlying ON positions (snapshot_id, underlying);
+# positions.latest is no longer maintained, latest_positions points at the snapshot
+DROP INDEX IF EXISTS idx_positions_underlying_latest ON positions;
+
+# Market day counts per year
+CREATE INDEX IF NOT EXISTS idx_calendar_market_open ON calendar (is_market_open, year, date);
+
+# Income and P/L reports filter facts by asset type and underlying
+CREATE INDEX IF NOT EXISTS idx_facts_asset_type ON transaction_facts (asset_type, underlying, date);
@@ -0,0 +1,5 @@
+# assign-trades only extends, merges and removes the trades it assembled, trades created by hand are left alone.
+# Trades assembled before this migration are recognized by the comment assign-trades gives them.
+ALTER TABLE trades ADD COLUMN IF NOT EXISTS origin VARCHAR(16) NOT NULL DEFAULT 'USER' AFTER position_id;
+
+UPDATE trades SET origin = 'ASSEMBLED' WHERE comment = 'Assembled from position, order and expiration';
@@ -0,0 +1,4 @@
+# The unassigned transactions endpoint pages by keyset on (date, transaction_id, item_id) by default,
+# the index now covers the whole order after the trade_id and account_id filters.
+DROP INDEX IF EXISTS idx_facts_unassigned ON transaction_facts;
+CREATE INDEX idx_facts_unassigned ON transaction_facts (trade_id, account_id, date, transaction_id, item_id);
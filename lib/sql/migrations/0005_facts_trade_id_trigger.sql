@@ -0,0 +1,19 @@
+# transaction_facts.trade_id was only written by assign-trades, trades assigned any other way left it stale.
+# Bring the facts in line once, the trigger keeps them in line from here on.
+UPDATE transaction_facts f
+   JOIN transactions t ON t.account_id = f.account_id AND t.transaction_id = f.transaction_id
+SET f.trade_id = t.trade_id
+WHERE NOT (f.trade_id <=> t.trade_id);
+
+DROP TRIGGER IF EXISTS transaction_facts_trade_id;
+
+DELIMITER //
+CREATE TRIGGER transaction_facts_trade_id AFTER UPDATE ON transactions
+FOR EACH ROW
+BEGIN
+   IF NOT (NEW.trade_id <=> OLD.trade_id) THEN
+      UPDATE transaction_facts SET trade_id = NEW.trade_id
+      WHERE account_id = NEW.account_id AND transaction_id = NEW.transaction_id;
+   END IF;
+END;//
+DELIMITER ;
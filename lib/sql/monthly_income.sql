@@ -5,7 +5,7 @@ select
    format(sum(extended_amount - commission - fees),2) income,
    count(distinct position_id) trades
 from 
-   transaction_view
+   transaction_facts
    join calendar c using (date)
 where 
     asset_type in ('CURRENCY', 'CALL', 'PUT')
@@ -61,7 +61,11 @@ create table strategies (
         open_date DATE NOT NULL,
         close_date DATE NOT NULL,
         type VARCHAR(255) NOT NULL,
-        status VARCHAR(255) NOT NULL,   amount DECIMAL(10,2) NOT NULL,
+        status VARCHAR(255) NOT NULL,
+        order_id bigint,
+        position_id bigint,
+        origin VARCHAR(16) NOT NULL default 'USER',
+        amount DECIMAL(10,2) NOT NULL,
     profit_target DECIMAL(10,2) NOT NULL,
     stop_loss_target DECIMAL(10,2) NOT NULL,
     starting_margin DECIMAL(10,2) NOT NULL,
@@ -70,6 +74,8 @@ create table strategies (
     adjustments INT default 0,
     comment VARCHAR(1024), 
     description VARCHAR(255) NOT NULL,
+    UNIQUE KEY uq_trades_user_trade (user_id, user_trade_id),
+    INDEX idx_trades_status (status),
     FOREIGN KEY (strategy_id) REFERENCES strategies(strategy_id) ON DELETE CASCADE,
     FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
@@ -79,7 +85,10 @@ DELIMITER //
 CREATE TRIGGER increment_based_on_other BEFORE INSERT ON trades
 FOR EACH ROW
 BEGIN
-   SET NEW.user_trade_id = (SELECT MAX(user_trade_id) FROM trades WHERE user_id = NEW.user_id) + 1;
+   # Bulk inserts from assign-trades number their rows, only single trades need the lookup
+   IF NEW.user_trade_id = 0 THEN
+      SET NEW.user_trade_id = IFNULL((SELECT MAX(user_trade_id) FROM trades WHERE user_id = NEW.user_id), 0) + 1;
+   END IF;
 END;//
 DELIMITER ;
 
@@ -95,6 +104,8 @@ create table transactions (
     amount DECIMAL(10,2) NOT NULL,
     description VARCHAR(255),
     PRIMARY KEY (transaction_id, account_id),
+    INDEX idx_transactions_trade (trade_id),
+    INDEX idx_transactions_type_date (type, date, account_id, position_id),
     FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE);
 
 create table transaction_items (
@@ -111,6 +122,7 @@ create table transaction_items (
     underlying VARCHAR(255),
     extended_amount DECIMAL(10,2),
     position_effect VARCHAR(255),
+    INDEX idx_items_transaction (transaction_id, transaction, symbol),
     FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id) ON DELETE CASCADE);
 
 create table quotes (
@@ -122,12 +134,13 @@ create table quotes (
     last DECIMAL(10,2) NOT NULL,
     open_interest INT NOT NULL,
     volume INT NOT NULL,
-    ivol DECIMAL(10,2) NOT NULL,
-    delta DECIMAL(10,2) NOT NULL,
-    gamma DECIMAL(10,2) NOT NULL,
-    theta DECIMAL(10,2) NOT NULL,
-    vega DECIMAL(10,2) NOT NULL,
-    rho DECIMAL(10,2) NOT NULL
+    ivol DECIMAL(12,6) NOT NULL,
+    delta DECIMAL(12,6) NOT NULL,
+    gamma DECIMAL(12,6) NOT NULL,
+    theta DECIMAL(12,6) NOT NULL,
+    vega DECIMAL(12,6) NOT NULL,
+    rho DECIMAL(12,6) NOT NULL,
+    UNIQUE KEY uq_quotes_symbol_date (symbol, date)
 );
 
 create table calendar (
@@ -144,14 +157,27 @@ create table calendar (
     is_weekday BOOLEAN,
     is_holiday BOOLEAN,
     is_current_year BOOLEAN AS (YEAR(date) = YEAR(CURDATE())),
-    is_current_month BOOLEAN AS (YEAR(date) = YEAR(CURDATE()) AND MONTH(date) = MONTH(CURDATE()),
-    is_market_open BOOLEAN)
+    is_current_month BOOLEAN AS (YEAR(date) = YEAR(CURDATE()) AND MONTH(date) = MONTH(CURDATE())),
+    is_early_close BOOLEAN,
+    is_market_open BOOLEAN,
+    INDEX idx_calendar_market_open (is_market_open, year, date)
 );
 
 
+# One row per positions poll, the position rows of a poll reference it
+create table position_snapshots (
+    snapshot_id bigint AUTO_INCREMENT PRIMARY KEY,
+    account_id INT NOT NULL,
+    date datetime NOT NULL,
+    position_count INT NOT NULL default 0,
+    INDEX idx_snapshot_account_date (account_id, date),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
 create table positions (
     position_id bigint AUTO_INCREMENT PRIMARY KEY,
     account_id INT NOT NULL,
+    snapshot_id bigint,
     date datetime NOT NULL,
     asset_type VARCHAR(255),
     short_quantity DECIMAL(10, 2),
@@ -164,12 +190,24 @@ create table positions (
     maintenance_requirement DECIMAL(10, 2),
     cusip VARCHAR(255),
     symbol VARCHAR(255),
-    underlying_symbol VARCHAR(255),
+    underlying VARCHAR(255),
     description TEXT,
     maturity_date DATETIME,
     variable_rate DECIMAL(10, 2),
     latest CHAR(1) DEFAULT 'N',
-    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+    INDEX idx_positions_snapshot (snapshot_id),
+    INDEX idx_positions_snapshot_asset_type (snapshot_id, asset_type),
+    INDEX idx_positions_snapshot_underlying (snapshot_id, underlying),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
+    FOREIGN KEY (snapshot_id) REFERENCES position_snapshots(snapshot_id) ON DELETE CASCADE
+);
+
+# Pointer to the most recent snapshot of each account, swapped when a poll commits
+create table latest_positions (
+    account_id INT PRIMARY KEY,
+    snapshot_id bigint NOT NULL,
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
+    FOREIGN KEY (snapshot_id) REFERENCES position_snapshots(snapshot_id)
 );
 
 CREATE TABLE orders (
@@ -189,6 +227,7 @@ CREATE TABLE orders (
     order_duration VARCHAR(255),
     order_class VARCHAR(255),
     PRIMARY KEY (account_id, order_id),
+    INDEX idx_orders_order (order_id, close_time),
     FOREIGN KEY (account_id) REFERENCES accounts(account_id)
 );
 
@@ -203,7 +242,7 @@ CREATE TABLE order_items (
     description VARCHAR(255),
     cusip VARCHAR(255),
     put_call VARCHAR(255),
-    underlying_symbol VARCHAR(255),
+    underlying VARCHAR(255),
     maturity_date DATE,
     strike_price DECIMAL(10, 2),
     multiplier INT,
@@ -214,9 +253,22 @@ CREATE TABLE order_items (
 
 CREATE TABLE securities (
     symbol VARCHAR(255) PRIMARY KEY,
+    cusip VARCHAR(255),
     description VARCHAR(255) NOT NULL,
     exchange VARCHAR(255) NOT NULL,
-    asset_type VARCHAR(255) NOT NULL
+    asset_type VARCHAR(255) NOT NULL,
+    updated_at DATETIME,
+    INDEX idx_securities_cusip (cusip)
+);
+
+# High-water mark of the last synced window per account and API type (TRADE, DIVIDEND_OR_INTEREST, ORDERS)
+CREATE TABLE sync_checkpoints (
+    account_id INT NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    high_water_mark DATETIME NOT NULL,
+    updated_at DATETIME,
+    PRIMARY KEY (account_id, type),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
 );
 
 
@@ -261,4 +313,94 @@ where
    ti.transaction in ('BUY', 'SELL', 'INTEREST', 'DIVIDEND')   
 );
 
+# transaction_view materialized, one row per item, maintained by the ingest commands for the
+# transactions they touch. theta_burn.py rebuild-transaction-facts recreates it from scratch.
+create table transaction_facts (
+    item_id bigint PRIMARY KEY,
+    account_id INT NOT NULL,
+    date DATE NOT NULL,
+    month CHAR(3),
+    year INT,
+    transaction_id bigint NOT NULL,
+    position_id bigint,
+    trade_id bigint,
+    order_id bigint,
+    order_date DATETIME,
+    description VARCHAR(255),
+    quantity DECIMAL(10,2),
+    symbol VARCHAR(255),
+    underlying VARCHAR(255),
+    amount DECIMAL(10,2),
+    commission DECIMAL(15,6),
+    fees DECIMAL(15,6),
+    transaction VARCHAR(255),
+    asset_type VARCHAR(255),
+    expiration_date DATE,
+    strike_price DECIMAL(10,2),
+    extended_amount DECIMAL(10,2),
+    INDEX idx_facts_account_date (account_id, date),
+    INDEX idx_facts_underlying (underlying),
+    INDEX idx_facts_trade (trade_id),
+    INDEX idx_facts_transaction (transaction_id),
+    INDEX idx_facts_unassigned (trade_id, account_id, date, transaction_id, item_id),
+    INDEX idx_facts_asset_type (asset_type, underlying, date)
+);
+
+# Trades are assigned by assign-trades, the web app and by hand, the facts follow every change of transactions.trade_id
+DELIMITER //
+CREATE TRIGGER transaction_facts_trade_id AFTER UPDATE ON transactions
+FOR EACH ROW
+BEGIN
+   IF NOT (NEW.trade_id <=> OLD.trade_id) THEN
+      UPDATE transaction_facts SET trade_id = NEW.trade_id
+      WHERE account_id = NEW.account_id AND transaction_id = NEW.transaction_id;
+   END IF;
+END;//
+DELIMITER ;
+
+# Distinct BUY/SELL dates per account, maintained on ingest for the trader status counters
+create table trading_days (
+    account_id INT NOT NULL,
+    date DATE NOT NULL,
+    transactions INT NOT NULL,
+    PRIMARY KEY (account_id, date),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+create table trading_day_stats (
+    account_id INT NOT NULL,
+    year INT NOT NULL,
+    days_with_trade INT NOT NULL,
+    transactions INT NOT NULL,
+    first_trade DATE,
+    last_trade DATE,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, year),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+# Bumped by the ingest commands, the www response cache keys include these
+create table cache_generations (
+    tag VARCHAR(255) PRIMARY KEY,
+    generation BIGINT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+# Versioned changes applied by theta_burn.py migrate, one row per file in lib/sql/migrations
+create table schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE INDEX idx_account_symbol_latest ON positions (account_id, symbol, latest);
+
+# Positions of the latest snapshot of each account
+create or replace view current_positions as (
+select
+   p.*
+from
+   latest_positions lp
+   join positions p on (p.snapshot_id = lp.snapshot_id)
+);
@@ -0,0 +1,447 @@
+# SQLite port of ../optionality.sql for db_backend = sqlite, keep the two in step.
+# Differences from the MariaDB script:
+#   INTEGER PRIMARY KEY AUTOINCREMENT is SQLite's auto increment, indexes are separate statements
+#   Money and quantity columns are REAL, with DECIMAL's numeric affinity whole values are stored
+#   as integers and the view and reports would divide them as integers
+#   Triggers stand in for the user_trade_id BEFORE INSERT trigger, ON UPDATE CURRENT_TIMESTAMP
+#   and the transaction_items foreign key, which SQLite rejects since transactions.transaction_id
+#   is not unique on its own
+#   calendar.is_current_year and is_current_month are plain columns, SQLite does not allow
+#   date('now') in generated columns
+#   date_format, year, if and the other MariaDB functions are registered on every connection
+#   by orm.backends, so the views only work through the application's engine
+
+create table brokers (
+    broker_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(255) NOT NULL);
+
+create table users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name VARCHAR(255) NOT NULL,
+    last_name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    password_hash CHAR(128),
+    phone VARCHAR(255) NOT NULL,
+    address VARCHAR(255) NOT NULL,
+    city VARCHAR(255) NOT NULL,
+    state VARCHAR(255) NOT NULL,
+    zip VARCHAR(255) NOT NULL,
+    country VARCHAR(255) NOT NULL
+);
+
+create table accounts (
+    account_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL,
+    account_number bigint,
+    broker_id INT NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    balance REAL NOT NULL,
+    FOREIGN KEY (broker_id) REFERENCES brokers(broker_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+
+CREATE TABLE account_balances (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id INT,
+    balance REAL,
+    date DATE,
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+create table strategies (
+    strategy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    description VARCHAR(255) NOT NULL,
+    author VARCHAR(255) NOT NULL,
+    link VARCHAR(255),
+    UNIQUE (user_id, name),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+create table trades (
+    trade_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_trade_id INT NOT NULL default 0,
+    strategy_id INT NOT NULL,
+    user_id INT NOT NULL,
+    account_id INT NOT NULL,
+    open_date DATE NOT NULL,
+    close_date DATE NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    status VARCHAR(255) NOT NULL,
+    order_id bigint,
+    position_id bigint,
+    origin VARCHAR(16) NOT NULL default 'USER',
+    amount REAL NOT NULL,
+    profit_target REAL NOT NULL,
+    stop_loss_target REAL NOT NULL,
+    starting_margin REAL NOT NULL,
+    ending_margin REAL NOT NULL,
+    max_margin REAL NOT NULL,
+    adjustments INT default 0,
+    comment VARCHAR(1024),
+    description VARCHAR(255) NOT NULL,
+    CONSTRAINT uq_trades_user_trade UNIQUE (user_id, user_trade_id),
+    FOREIGN KEY (strategy_id) REFERENCES strategies(strategy_id) ON DELETE CASCADE,
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_trades_status ON trades (status);
+
+# SQLite triggers cannot assign NEW, the row is numbered right after it is inserted.
+# Bulk inserts from assign-trades number their rows, only single trades need the lookup.
+DELIMITER //
+CREATE TRIGGER increment_based_on_other AFTER INSERT ON trades
+FOR EACH ROW WHEN NEW.user_trade_id = 0
+BEGIN
+   UPDATE trades
+   SET user_trade_id = (SELECT MAX(user_trade_id) FROM trades WHERE user_id = NEW.user_id) + 1
+   WHERE trade_id = NEW.trade_id;
+END;//
+DELIMITER ;
+
+create table transactions (
+    transaction_id bigint,
+    account_id INT NOT NULL,
+    trade_id BIGINT,
+    date DATE NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    status VARCHAR(255) NOT NULL,
+    order_id bigint,
+    position_id bigint,
+    amount REAL NOT NULL,
+    description VARCHAR(255),
+    PRIMARY KEY (transaction_id, account_id),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE);
+
+CREATE INDEX idx_transactions_trade ON transactions (trade_id);
+CREATE INDEX idx_transactions_type_date ON transactions (type, date, account_id, position_id);
+
+create table transaction_items (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id bigint,
+    asset_type VARCHAR(255) NOT NULL,
+    `transaction` VARCHAR(255),
+    amount REAL,
+    quantity REAL,
+    symbol VARCHAR(255),
+    description VARCHAR(255),
+    strike_price REAL,
+    expiration_date DATE,
+    underlying VARCHAR(255),
+    extended_amount REAL,
+    position_effect VARCHAR(255));
+
+CREATE INDEX idx_items_transaction ON transaction_items (transaction_id, `transaction`, symbol);
+
+# The ON DELETE CASCADE of the MariaDB transaction_items foreign key
+DELIMITER //
+CREATE TRIGGER transaction_items_cascade AFTER DELETE ON transactions
+FOR EACH ROW
+BEGIN
+   DELETE FROM transaction_items WHERE transaction_id = OLD.transaction_id;
+END;//
+DELIMITER ;
+
+create table quotes (
+    quote_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol VARCHAR(255) NOT NULL,
+    date DATE NOT NULL,
+    bid REAL NOT NULL,
+    ask REAL NOT NULL,
+    last REAL NOT NULL,
+    open_interest INT NOT NULL,
+    volume INT NOT NULL,
+    ivol REAL NOT NULL,
+    delta REAL NOT NULL,
+    gamma REAL NOT NULL,
+    theta REAL NOT NULL,
+    vega REAL NOT NULL,
+    rho REAL NOT NULL,
+    CONSTRAINT uq_quotes_symbol_date UNIQUE (symbol, date)
+);
+
+create table calendar (
+    date DATE PRIMARY KEY,
+    year INT,
+    quarter INT,
+    month INT,
+    month_name VARCHAR(255),
+    short_month_name VARCHAR(255),
+    day INT,
+    week INT,
+    weekday INT,
+    day_name VARCHAR(255),
+    is_weekday BOOLEAN,
+    is_holiday BOOLEAN,
+    is_current_year BOOLEAN,
+    is_current_month BOOLEAN,
+    is_early_close BOOLEAN,
+    is_market_open BOOLEAN
+);
+
+CREATE INDEX idx_calendar_market_open ON calendar (is_market_open, year, date);
+
+# One row per positions poll, the position rows of a poll reference it
+create table position_snapshots (
+    snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id INT NOT NULL,
+    date datetime NOT NULL,
+    position_count INT NOT NULL default 0,
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_snapshot_account_date ON position_snapshots (account_id, date);
+
+create table positions (
+    position_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id INT NOT NULL,
+    snapshot_id bigint,
+    date datetime NOT NULL,
+    asset_type VARCHAR(255),
+    short_quantity REAL,
+    long_quantity REAL,
+    average_price REAL,
+    current_day_profit_loss REAL,
+    current_day_profit_loss_percentage REAL,
+    market_value REAL,
+    net_change REAL,
+    maintenance_requirement REAL,
+    cusip VARCHAR(255),
+    symbol VARCHAR(255),
+    underlying VARCHAR(255),
+    description TEXT,
+    maturity_date DATETIME,
+    variable_rate REAL,
+    latest CHAR(1) DEFAULT 'N',
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
+    FOREIGN KEY (snapshot_id) REFERENCES position_snapshots(snapshot_id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_positions_snapshot ON positions (snapshot_id);
+CREATE INDEX idx_positions_snapshot_asset_type ON positions (snapshot_id, asset_type);
+CREATE INDEX idx_positions_snapshot_underlying ON positions (snapshot_id, underlying);
+
+# Pointer to the most recent snapshot of each account, swapped when a poll commits
+create table latest_positions (
+    account_id INT PRIMARY KEY,
+    snapshot_id bigint NOT NULL,
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE,
+    FOREIGN KEY (snapshot_id) REFERENCES position_snapshots(snapshot_id)
+);
+
+CREATE TABLE orders (
+    account_id INT,
+    entered_time DATETIME,
+    close_time DATETIME,
+    order_id BIGINT,
+    order_type VARCHAR(255),
+    cancel_time DATETIME,
+    quantity REAL,
+    filled_quantity REAL,
+    remaining_quantity REAL,
+    requested_destination VARCHAR(255),
+    order_strategy_type VARCHAR(255),
+    status VARCHAR(255),
+    price REAL,
+    order_duration VARCHAR(255),
+    order_class VARCHAR(255),
+    PRIMARY KEY (account_id, order_id),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id)
+);
+
+CREATE INDEX idx_orders_order ON orders (order_id, close_time);
+
+CREATE TABLE order_items (
+    account_id INT,
+    order_id BIGINT,
+    order_leg_type VARCHAR(255),
+    instruction VARCHAR(255),
+    quantity REAL,
+    asset_type VARCHAR(255),
+    symbol VARCHAR(255),
+    description VARCHAR(255),
+    cusip VARCHAR(255),
+    put_call VARCHAR(255),
+    underlying VARCHAR(255),
+    maturity_date DATE,
+    strike_price REAL,
+    multiplier INT,
+    order_item_id INT,
+    PRIMARY KEY (account_id, order_id, order_item_id),
+    FOREIGN KEY (account_id, order_id) REFERENCES orders(account_id, order_id) ON DELETE CASCADE
+);
+
+CREATE TABLE securities (
+    symbol VARCHAR(255) PRIMARY KEY,
+    cusip VARCHAR(255),
+    description VARCHAR(255) NOT NULL,
+    exchange VARCHAR(255) NOT NULL,
+    asset_type VARCHAR(255) NOT NULL,
+    updated_at DATETIME
+);
+
+CREATE INDEX idx_securities_cusip ON securities (cusip);
+
+# High-water mark of the last synced window per account and API type (TRADE, DIVIDEND_OR_INTEREST, ORDERS)
+CREATE TABLE sync_checkpoints (
+    account_id INT NOT NULL,
+    type VARCHAR(255) NOT NULL,
+    high_water_mark DATETIME NOT NULL,
+    updated_at DATETIME,
+    PRIMARY KEY (account_id, type),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+
+drop view if exists transaction_view;
+create view transaction_view as
+select
+   a.account_id,
+   t.date,
+   date_format(t.date, '%b') month,
+   year(t.date) year,
+   t.transaction_id,
+   t.position_id,
+   t.trade_id,
+   t.order_id,
+   o.close_time order_date,
+   ifnull(ti.description,t.description) description,
+   ti.quantity,
+   ifnull(ti.symbol,'') symbol,
+   ifnull(ti.underlying, '') underlying,
+   ti.amount,
+   ifnull((fees.commission / fees.quantity * ti.quantity * -1),0) commission,
+   ifnull((fees.other / fees.quantity * ti.quantity * -1),0) fees,
+   ti.`transaction`,
+   ti.asset_type,
+   ti.expiration_date,
+   ti.strike_price,
+   round(ti.extended_amount,2) extended_amount
+from
+   accounts a
+   join transactions t using (account_id)
+   join transaction_items ti using (transaction_id)
+   left join orders o using (order_id)
+   join (select
+            transaction_id,
+            sum(quantity) quantity,
+            sum(if(ti.description = 'COMMISSION', ti.amount,0)) commission,
+            sum(if(`transaction` = 'FEE' and ti.description != 'COMMISSION',ti.amount,0)) other
+         from
+            transactions t
+            join transaction_items ti using (transaction_id)
+         group by 1) fees using (transaction_id)
+where
+   ti.`transaction` in ('BUY', 'SELL', 'INTEREST', 'DIVIDEND');
+
+# transaction_view materialized, one row per item, maintained by the ingest commands for the
+# transactions they touch. theta_burn.py rebuild-transaction-facts recreates it from scratch.
+create table transaction_facts (
+    item_id INTEGER PRIMARY KEY,
+    account_id INT NOT NULL,
+    date DATE NOT NULL,
+    month CHAR(3),
+    year INT,
+    transaction_id bigint NOT NULL,
+    position_id bigint,
+    trade_id bigint,
+    order_id bigint,
+    order_date DATETIME,
+    description VARCHAR(255),
+    quantity REAL,
+    symbol VARCHAR(255),
+    underlying VARCHAR(255),
+    amount REAL,
+    commission REAL,
+    fees REAL,
+    `transaction` VARCHAR(255),
+    asset_type VARCHAR(255),
+    expiration_date DATE,
+    strike_price REAL,
+    extended_amount REAL
+);
+
+CREATE INDEX idx_facts_account_date ON transaction_facts (account_id, date);
+CREATE INDEX idx_facts_underlying ON transaction_facts (underlying);
+CREATE INDEX idx_facts_trade ON transaction_facts (trade_id);
+CREATE INDEX idx_facts_transaction ON transaction_facts (transaction_id);
+CREATE INDEX idx_facts_unassigned ON transaction_facts (trade_id, account_id, date, transaction_id, item_id);
+CREATE INDEX idx_facts_asset_type ON transaction_facts (asset_type, underlying, date);
+
+# Trades are assigned by assign-trades, the web app and by hand, the facts follow every change of transactions.trade_id
+DELIMITER //
+CREATE TRIGGER transaction_facts_trade_id AFTER UPDATE OF trade_id ON transactions
+FOR EACH ROW WHEN NEW.trade_id IS NOT OLD.trade_id
+BEGIN
+   UPDATE transaction_facts SET trade_id = NEW.trade_id
+   WHERE account_id = NEW.account_id AND transaction_id = NEW.transaction_id;
+END;//
+DELIMITER ;
+
+# Distinct BUY/SELL dates per account, maintained on ingest for the trader status counters
+create table trading_days (
+    account_id INT NOT NULL,
+    date DATE NOT NULL,
+    transactions INT NOT NULL,
+    PRIMARY KEY (account_id, date),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+create table trading_day_stats (
+    account_id INT NOT NULL,
+    year INT NOT NULL,
+    days_with_trade INT NOT NULL,
+    transactions INT NOT NULL,
+    first_trade DATE,
+    last_trade DATE,
+    updated_at DATETIME DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (account_id, year),
+    FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+);
+
+# ON UPDATE CURRENT_TIMESTAMP, recursive triggers are off so the update does not fire it again
+DELIMITER //
+CREATE TRIGGER trading_day_stats_updated_at AFTER UPDATE ON trading_day_stats
+FOR EACH ROW
+BEGIN
+   UPDATE trading_day_stats SET updated_at = datetime('now', 'localtime')
+   WHERE account_id = NEW.account_id AND year = NEW.year;
+END;//
+DELIMITER ;
+
+# Bumped by the ingest commands, the www response cache keys include these
+create table cache_generations (
+    tag VARCHAR(255) PRIMARY KEY,
+    generation BIGINT NOT NULL,
+    updated_at DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+
+DELIMITER //
+CREATE TRIGGER cache_generations_updated_at AFTER UPDATE ON cache_generations
+FOR EACH ROW
+BEGIN
+   UPDATE cache_generations SET updated_at = datetime('now', 'localtime') WHERE tag = NEW.tag;
+END;//
+DELIMITER ;
+
+# Versioned changes applied by theta_burn.py migrate, one row per file in lib/sql/migrations
+create table schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    applied_at DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX idx_account_symbol_latest ON positions (account_id, symbol, latest);
+
+# Positions of the latest snapshot of each account
+drop view if exists current_positions;
+create view current_positions as
+select
+   p.*
+from
+   latest_positions lp
+   join positions p on (p.snapshot_id = lp.snapshot_id);
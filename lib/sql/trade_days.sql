@@ -10,10 +10,10 @@ select
     market.days_completed market_days_completed,
     (market.days_total - market.days_completed) market_days_left,
     count(distinct a.date) as days_with_trade,
-    concat(round((count(distinct a.date) / market.days_completed) * 100 , 1),'%') as trading_ratio_ytd,
-    concat(round((count(distinct a.date) / market.days_total) * 100, 1),'%') as trading_ratio,
+    concat(round(count(distinct a.date) * 100.0 / market.days_completed, 1),'%') as trading_ratio_ytd,
+    concat(round(count(distinct a.date) * 100.0 / market.days_total, 1),'%') as trading_ratio,
     sum(a.transactions) transactions,
-    round(sum(a.transactions) / market.days_completed,2) avg_daily_transactions,
+    round(sum(a.transactions) * 1.0 / market.days_completed,2) avg_daily_transactions,
     max(date) last_trade,
     concat(75, '%') target_trading_ratio,
     ceil((market.days_total * .75)) target_trading_days,
@@ -23,7 +23,7 @@ from (
         year(date) as year,
         date, 
         symbol, 
-        transaction,
+        `transaction`,
         1 transactions,
         a.name as account
     from
@@ -31,24 +31,25 @@ from (
         join transaction_items ti using (transaction_id)
         join accounts a using (account_id)
     where
-        year(date) = year(now())
-        and t.type = 'TRADE'
-        and transaction in ('SELL', 'BUY')
+        t.type = 'TRADE'
+        and t.date >= makedate(year(now()), 1) and t.date < makedate(year(now()) + 1, 1)
+        and `transaction` in ('SELL', 'BUY')
         and a.type = 'TAXABLE'
     group by
         1,2,3,4,5
 ) a
 join (
     select
-        year(date) as year,
+        year,
         count(*) as days_total,
         sum(if(date <= now(), 1, 0)) as days_completed
     from
         calendar
     where
         is_market_open = true
+        and year = year(now())
     group by
-        year(date)
+        year
 ) market on (market.year = a.year)
 group by
     a.year, a.account, market_days_left,market_days_completed    
@@ -10,8 +10,8 @@ from
    join transaction_items ti using (transaction_id)
    join accounts a using (account_id)
 where 
-   year(date) in (2023, 2024) and t.type = 'TRADE'
-   and transaction in ('SELL', 'BUY')
+   t.type = 'TRADE' and t.date >= '2023-01-01' and t.date < '2025-01-01'
+   and `transaction` in ('SELL', 'BUY')
    and a.account_id in (1,2,3)
 group by 1, 2, 3
 ) a
@@ -0,0 +1,97 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# The lib packages import each other absolutely, like bin/theta_burn.py sets up, and www is a package of the root
+sys.path.append(os.path.join(ROOT, 'lib'))
+sys.path.append(ROOT)
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """
+    Session on a scratch SQLite database created from the sqlite schema script
+    """
+    from orm.database import Database
+    from orm.migrations import create_schema
+
+    monkeypatch.setenv('db_backend', 'sqlite')
+    monkeypatch.setenv('db_path', str(tmp_path / 'optionality.db'))
+    database = Database()
+    session = database.get_session()
+    create_schema(session)
+    yield session
+    database.close()
+
+
+def add_accounts(session) -> list:
+    """
+    A user with the accounts 1 and 2 and the strategy 1, for tests that store transactions and trades
+    """
+    from sqlalchemy import text
+
+    for statement in ("insert into brokers (broker_id, name) values (1, 'Schwab')",
+                      "insert into users (user_id, first_name, last_name, email, phone, address, city, state, zip, country) "
+                      "values (1, '', '', '', '', '', '', '', '', '')",
+                      "insert into accounts (account_id, user_id, broker_id, name, type, balance) "
+                      "values (1, 1, 1, 'Main', 'TAXABLE', 0), (2, 1, 1, 'IRA', 'IRA', 0)",
+                      "insert into strategies (strategy_id, user_id, name, description, author) values (1, 1, 'Wheel', '', '')"):
+        session.execute(text(statement))
+    session.commit()
+    return [1, 2]
+
+
+@pytest.fixture
+def accounts(session):
+    return add_accounts(session)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """
+    The Flask app on a scratch SQLite database of its own. www.routes registers its views
+    on the first app created, so every web test shares this one.
+    """
+    from orm.database import Database
+    from orm.migrations import create_schema
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('db_backend', 'sqlite')
+        monkeypatch.setenv('db_path', str(tmp_path_factory.mktemp('www') / 'optionality.db'))
+        database = Database()
+        create_schema(database.get_session())
+        database.close()
+        from www import create_app
+        app = create_app()
+    yield app
+    app.extensions['database'].close()
+
+
+@pytest.fixture
+def web(app):
+    """
+    Test client and session of the app, the tables and the response cache are emptied after each test
+    """
+    from sqlalchemy import text, inspect
+    from orm.models import Base
+    from www import routes
+
+    session = app.extensions['database'].get_session()
+    yield app.test_client(), session
+    session.rollback()
+    # Some models map views
+    tables = set(inspect(session.get_bind()).get_table_names())
+    for table in reversed(Base.metadata.sorted_tables):
+        if table.name in tables:
+            session.execute(text(f'delete from {table.name}'))
+    session.commit()
+    routes.response_cache.memory.clear()
+
+
+@pytest.fixture
+def web_accounts(web):
+    return add_accounts(web[1])
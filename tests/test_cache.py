@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from sqlalchemy import text
+
+from ingest.bulk import ColumnBatch, insert_batch
+from ingest.generations import bump_generation, get_generations, account_tag, ALL, POSITIONS
+from ingest.snapshots import point_latest, snapshot_changed
+from orm.models import Position, PositionSnapshot
+
+POSITION = {'symbol': 'SPY', 'underlying': 'SPY', 'asset_type': 'EQUITY', 'short_quantity': 0, 'long_quantity': 100,
+            'average_price': 450.125, 'market_value': 45012.5, 'current_day_profit_loss': 12.344,
+            'maintenance_requirement': 13503.75, 'net_change': 0.12}
+
+
+def poll(session, account_id: int, **changes) -> ColumnBatch:
+    snapshot = PositionSnapshot(account_id=account_id, date=datetime.now(), position_count=1)
+    session.add(snapshot)
+    session.flush()
+    batch = ColumnBatch(Position.__table__)
+    batch.append(dict(POSITION, account_id=account_id, snapshot_id=snapshot.snapshot_id, date=snapshot.date, **changes))
+    return batch
+
+
+def test_only_a_changed_poll_counts_and_it_leaves_all_alone(session, accounts):
+    first = poll(session, 1)
+    assert snapshot_changed(session, 1, first)
+    insert_batch(session, first)
+    point_latest(session, 1, first.columns['snapshot_id'][0])
+
+    # Stored at two decimals, the same poll again is unchanged
+    assert not snapshot_changed(session, 1, poll(session, 1))
+    assert snapshot_changed(session, 1, poll(session, 1, long_quantity=200))
+    assert snapshot_changed(session, 2, poll(session, 2))
+
+    bump_generation(session, 1, scope=POSITIONS)
+    assert get_generations(session, [ALL, POSITIONS, account_tag(1)]) == {ALL: 0, POSITIONS: 1, account_tag(1): 1}
+
+
+def test_position_changes_invalidate_only_position_responses(web, web_accounts):
+    client, session = web
+    payoff, accounts = client.get('/api/payoff').headers['ETag'], client.get('/api/accounts').headers['ETag']
+    bump_generation(session, 1, scope=POSITIONS)
+    session.commit()
+    assert client.get('/api/payoff').headers['ETag'] != payoff
+    assert client.get('/api/accounts').headers['ETag'] == accounts
+
+
+def test_assigning_by_hand_invalidates_the_unassigned_transactions(web, web_accounts):
+    client, session = web
+    session.execute(text("insert into trades (trade_id, user_trade_id, strategy_id, user_id, account_id, open_date, close_date, type, "
+                         "status, amount, profit_target, stop_loss_target, starting_margin, ending_margin, max_margin, description) "
+                         "values (1, 1, 1, 1, 1, '2024-01-02', '2024-01-02', 'PUT', 'OPEN', 300, 0, 0, 0, 0, 0, 'By hand')"))
+    session.execute(text("insert into transactions (transaction_id, account_id, date, type, status, amount) "
+                         "values (5, 1, '2024-01-02', 'TRADE', 'VALID', 300), (5, 2, '2024-01-02', 'TRADE', 'VALID', 300)"))
+    session.execute(text("insert into transaction_facts (item_id, account_id, date, transaction_id, symbol) "
+                         "values (1, 1, '2024-01-02', 5, 'SPY'), (2, 2, '2024-01-02', 5, 'SPY')"))
+    session.commit()
+    assert client.get('/api/unassigned_transactions').json['recordsTotal'] == 2
+
+    assert client.post('/api/assign_transactions/1', json={'transaction_ids': [5]}).json == {'trade_id': 1, 'assigned': 1}
+    rows = client.get('/api/unassigned_transactions').json['data']
+    assert [(row['account_id'], row['transaction_id']) for row in rows] == [(2, 5)]
+    assert client.post('/api/assign_transactions/2', json={'transaction_ids': [5]}).status_code == 404
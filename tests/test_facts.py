@@ -0,0 +1,16 @@
+from sqlalchemy import text
+
+
+def test_facts_follow_the_trade_of_their_transaction(session, accounts):
+    session.execute(text("insert into transactions (transaction_id, account_id, date, type, status, amount) "
+                         "values (1, 1, '2024-01-02', 'TRADE', 'VALID', 0), (1, 2, '2024-01-02', 'TRADE', 'VALID', 0)"))
+    session.execute(text("insert into transaction_facts (item_id, account_id, date, transaction_id) "
+                         "values (1, 1, '2024-01-02', 1), (2, 1, '2024-01-02', 1), (3, 2, '2024-01-02', 1)"))
+    # Assigned outside assign-trades, like the web app's assign flow
+    session.execute(text('update transactions set trade_id = 7 where account_id = 1 and transaction_id = 1'))
+    session.commit()
+    facts = session.execute(text('select item_id, trade_id from transaction_facts order by item_id')).all()
+    assert facts == [(1, 7), (2, 7), (3, None)]
+
+    session.execute(text('update transactions set trade_id = null where account_id = 1'))
+    assert session.execute(text('select count(*) from transaction_facts where trade_id is not null')).scalar() == 0
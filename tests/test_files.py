@@ -0,0 +1,50 @@
+import json
+from functools import partial
+
+from ingest.fetch import fetch_concurrently, IN_FLIGHT_PER_WORKER
+from ingest.files import parse_transaction_file, transaction_file_jobs, next_batch
+
+
+def write_export(path, activities):
+    # Windows line endings and multi-byte characters, offsets are bytes
+    path.write_text(' [\r\n' + ',\r\n'.join(json.dumps(a, ensure_ascii=False) for a in activities) + '\r\n]\r\n', encoding='utf-8')
+
+
+def test_batches_continue_from_the_byte_offset(tmp_path):
+    activities = [{'activityId': i, 'accountNumber': '1234', 'description': 'Dividende é 🚀' * (i % 3)} for i in range(250)]
+    path = tmp_path / 'export.json'
+    write_export(path, activities)
+
+    parsed, job, sizes = [], transaction_file_jobs([str(path)])[0], []
+    while job is not None:
+        result = parse_transaction_file(job, batch_size=40)
+        parsed.extend(result['batch'])
+        sizes.append(len(result['batch']))
+        job = next_batch(job, result)
+    assert parsed == activities
+    assert sizes == [40] * 6 + [10]
+
+
+def test_jobs_are_submitted_as_results_drain(tmp_path):
+    paths = []
+    for n in range(3):
+        path = tmp_path / f'export_{n}.json'
+        write_export(path, [{'activityId': n * 100 + i} for i in range(25)])
+        paths.append(str(path))
+
+    submitted = []
+    def jobs():
+        for job in transaction_file_jobs(paths):
+            submitted.append(job)
+            yield job
+
+    written, most_ahead = [], 0
+    def write(job, result):
+        nonlocal most_ahead
+        most_ahead = max(most_ahead, len(submitted) - len(written))
+        written.append(result['batch'])
+
+    count = fetch_concurrently(jobs(), partial(parse_transaction_file, batch_size=10), write, max_workers=1, next_job=next_batch)
+    assert count == 9
+    assert sorted(a['activityId'] for batch in written for a in batch) == [n * 100 + i for n in range(3) for i in range(25)]
+    assert most_ahead <= IN_FLIGHT_PER_WORKER
@@ -0,0 +1,35 @@
+from sqlalchemy import text
+
+
+def test_unassigned_transactions_page_by_keyset(web):
+    client, session = web
+    # Few dates and several items per transaction, so the order rests on the tie breakers
+    for item_id in range(1, 41):
+        session.execute(text("insert into transaction_facts (item_id, account_id, date, transaction_id, symbol, extended_amount) "
+                             "values (:item_id, 1, :day, :transaction_id, 'SPY', 1)"),
+                        {'item_id': item_id, 'day': f'2024-01-0{item_id % 3 + 1}', 'transaction_id': 100 - item_id // 3})
+    session.commit()
+
+    def walk(**args) -> list:
+        pages, after = [], None
+        while True:
+            page = client.get('/api/unassigned_transactions', query_string=dict(args, length=7, **({'after': after} if after else {}))).json
+            pages.append([(row['date'], row['transaction_id'], row['item_id']) for row in page['data']])
+            after = page['next']
+            if after is None:
+                return pages
+
+    for sort, direction in (('date', 'desc'), ('date', 'asc'), ('transaction_id', 'asc')):
+        pages = walk(sort=sort, dir=direction)
+        rows = [row for page in pages for row in page]
+        key = (lambda row: row) if sort == 'date' else (lambda row: row[1:])
+        assert rows == sorted(rows, key=key, reverse=direction == 'desc')
+        assert len(set(rows)) == len(rows) == 40
+        offset = [client.get('/api/unassigned_transactions',
+                             query_string={'sort': sort, 'dir': direction, 'length': 7, 'start': start, 'paging': 'offset'}).json
+                  for start in range(0, 42, 7)]
+        assert pages == [[(row['date'], row['transaction_id'], row['item_id']) for row in page['data']] for page in offset]
+
+    # Skipping rows without a cursor has to be asked for
+    assert client.get('/api/unassigned_transactions', query_string={'start': 7}).status_code == 400
+    assert client.get('/api/unassigned_transactions', query_string={'sort': 'symbol', 'start': 7, 'paging': 'offset'}).status_code == 200
@@ -0,0 +1,26 @@
+from datetime import date
+
+from analytics.reports import ReportEngine, ReportData
+from analytics.market_calendar import market_days_between
+from ingest.generations import bump_generation
+
+
+def test_facts_reload_when_the_generation_moves(session, tmp_path):
+    engine = ReportEngine(lambda: session, str(tmp_path))
+    first = engine.load()
+    assert first.key == '0'
+    assert engine.load() is first
+
+    # A backfill of older activity leaves max(transaction_id) alone but bumps the generation
+    bump_generation(session, 1)
+    session.commit()
+    second = engine.load()
+    assert second is not first
+    assert second.key != first.key
+    assert list(tmp_path.glob('report_facts_*.pkl')) == [tmp_path / f'report_facts_{second.key}.pkl']
+
+
+def test_market_days_come_from_the_shared_calendar():
+    data = ReportData(None, '0', as_of=date(2025, 6, 30))
+    days = data.market_days[data.market_days.dt.year == 2024]
+    assert len(days) == market_days_between(date(2024, 1, 1), date(2024, 12, 31)) == 252
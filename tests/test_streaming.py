@@ -0,0 +1,85 @@
+import os
+import json
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from conftest import FIXTURES
+from orm.models import Quote
+from ingest.streaming import (QuoteCoalescer, TickPipeline, MarkCache, ReplayStream, flush_quotes, parse_message,
+                              quote_mark, QUOTE_COLUMNS)
+
+TICKS = os.path.join(FIXTURES, 'stream_ticks.jsonl')
+DAY = date(2025, 10, 17)
+
+
+def recorded_quotes() -> tuple:
+    """
+    The fixture's updates merged in file order, and how many there are
+    """
+    quotes, updates = {}, 0
+    with open(TICKS) as f:
+        for line in f:
+            for service, symbol, fields in parse_message(json.loads(line)['message']):
+                quotes.setdefault(symbol, {}).update(fields)
+                updates += 1
+    return quotes, updates
+
+
+def stored_quotes(session) -> dict:
+    return {quote.symbol: quote for quote in session.scalars(select(Quote).where(Quote.date == DAY))}
+
+
+def test_replay_coalesces_into_quotes_and_marks(session, tmp_path):
+    expected, updates = recorded_quotes()
+    coalescer = QuoteCoalescer()
+    pipeline = TickPipeline(coalescer, maxsize=4)
+    stream = ReplayStream(TICKS, speed=0)
+
+    # The consumer starts after the replay, so all but the first messages overflow the queue
+    stream.start(pipeline.receive)
+    stream._thread.join()
+    pipeline.start()
+    pipeline.stop()
+
+    stats = pipeline.stats()
+    with open(TICKS) as f:
+        assert stats['received'] == sum(1 for line in f)
+    assert stats['inline'] > 0
+    assert stats['errors'] == 0
+    assert stats['queued'] == 0
+    assert stats['ticks'] == updates
+
+    quotes = coalescer.drain()
+    assert quotes == expected
+    assert coalescer.drain() == {}
+
+    assert flush_quotes(session, quotes, DAY) == len(expected)
+    session.commit()
+    stored = stored_quotes(session)
+    assert set(stored) == set(expected)
+    for symbol, quote in expected.items():
+        for name in QUOTE_COLUMNS:
+            assert float(getattr(stored[symbol], name)) == quote.get(name, 0), (symbol, name)
+
+    marks = MarkCache(str(tmp_path / 'marks.json'))
+    marks.publish({symbol: quote_mark(quote) for symbol, quote in quotes.items()}, datetime(2025, 10, 17, 10, 30))
+    reader = MarkCache(marks.path)
+    published = reader.snapshot()
+    assert published['as_of'] == '2025-10-17T10:30:00'
+    assert published['marks'] == {symbol: quote_mark(quote) for symbol, quote in expected.items()}
+
+
+def test_flush_keeps_columns_a_quote_did_not_receive(session):
+    flush_quotes(session, {'SPY': {'bid': 660.1, 'ask': 660.2, 'volume': 1200}}, DAY)
+    session.commit()
+    flush_quotes(session, {'SPY': {'bid': 661.0, 'ask': 661.1}, 'QQQ': {'last': 600.5, 'volume': 300}, 'IWM': {'mark': 240.0}}, DAY)
+    flush_quotes(session, {'QQQ': {'mark': 601.0}}, DAY)
+    session.commit()
+
+    stored = stored_quotes(session)
+    assert float(stored['SPY'].bid) == 661.0
+    assert stored['SPY'].volume == 1200
+    assert float(stored['QQQ'].last) == 600.5
+    assert stored['QQQ'].volume == 300
+    assert float(stored['IWM'].last) == 0
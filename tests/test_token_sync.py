@@ -0,0 +1,110 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from hvac.exceptions import InvalidRequest
+
+from ingest.token_sync import TokenSync, CACHED, PULLED, REFRESHED
+
+
+class FakeVault:
+    """
+    The part of a kv v2 hvac client TokenSync uses, one secret with check-and-set writes
+    """
+    def __init__(self, tokens: dict = None):
+        self.versions = [tokens] if tokens else []
+        self.calls = 0
+        self.secrets = SimpleNamespace(kv=SimpleNamespace(v2=self))
+        self.sys = self
+
+    @property
+    def tokens(self) -> dict:
+        return self.versions[-1] if self.versions else None
+
+    def read_secret_version(self, path, mount_point, raise_on_deleted_version):
+        self.calls += 1
+        if not self.versions:
+            return None
+        return {'data': {'data': self.tokens, 'metadata': {'version': len(self.versions)}}}
+
+    def create_or_update_secret(self, path, secret, mount_point, cas):
+        self.calls += 1
+        if cas != len(self.versions):
+            raise InvalidRequest('check-and-set parameter did not match the current version')
+        self.versions.append(secret)
+        return {'data': {'version': len(self.versions)}}
+
+
+def tokens(minutes_ago: float) -> dict:
+    at = datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)
+    return {'access_token_issued': at.isoformat(), 'token_dictionary': {'access_token': f'token-{minutes_ago}'}}
+
+
+def sync(tmp_path, vault: FakeVault, local: dict = None, version: int = None) -> TokenSync:
+    token_sync = TokenSync(vault, tokens_file=str(tmp_path / 'tokens.json'), lock_timeout=1)
+    if local is not None:
+        (tmp_path / 'tokens.json').write_text(json.dumps(local))
+    if version is not None:
+        (tmp_path / 'tokens.json.vault').write_text(json.dumps({'version': version, 'access_token_issued': local['access_token_issued']}))
+    return token_sync
+
+
+def no_refresh(client):
+    raise AssertionError('fresh tokens were refreshed')
+
+
+def test_synced_fresh_tokens_need_no_vault_call(tmp_path):
+    current = tokens(1)
+    vault = FakeVault(current)
+    token_sync = sync(tmp_path, vault, current, version=1)
+    client, outcome = token_sync.client(object, no_refresh)
+    assert outcome == CACHED
+    assert token_sync.vault_calls == vault.calls == 0
+
+
+def test_newer_tokens_in_vault_are_pulled(tmp_path):
+    stale, newer = tokens(40), tokens(2)
+    vault = FakeVault(stale)
+    vault.versions.append(newer)
+    token_sync = sync(tmp_path, vault, stale, version=1)
+    client, outcome = token_sync.client(object, no_refresh)
+    assert outcome == PULLED
+    assert token_sync.local() == newer
+    assert token_sync.synced(newer)
+    assert len(vault.versions) == 2
+
+
+def test_expiring_tokens_are_refreshed_and_published(tmp_path):
+    stale, refreshed = tokens(40), tokens(0)
+    vault = FakeVault(stale)
+    token_sync = sync(tmp_path, vault, stale, version=1)
+
+    def refresh(client):
+        # schwabdev writes the renewed tokens to the tokens file
+        (tmp_path / 'tokens.json').write_text(json.dumps(refreshed))
+
+    client, outcome = token_sync.client(object, refresh)
+    assert outcome == REFRESHED
+    assert vault.versions == [stale, refreshed]
+    assert token_sync.synced(refreshed)
+    # The next start reads only the local files
+    calls = vault.calls
+    assert token_sync.client(object, no_refresh)[1] == CACHED
+    assert vault.calls == calls
+
+
+def test_a_conflicting_write_adopts_the_newer_tokens_in_vault(tmp_path):
+    stale, refreshed, other = tokens(40), tokens(1), tokens(0)
+    vault = FakeVault(stale)
+    token_sync = sync(tmp_path, vault, stale, version=1)
+
+    def refresh(client):
+        (tmp_path / 'tokens.json').write_text(json.dumps(refreshed))
+        # An instance on another host refreshed and published in the meantime
+        vault.versions.append(other)
+
+    client, outcome = token_sync.client(object, refresh)
+    assert outcome == REFRESHED
+    assert vault.versions == [stale, other]
+    assert token_sync.local() == other
+    assert token_sync.synced(other)
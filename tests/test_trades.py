@@ -0,0 +1,75 @@
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import text
+
+from ingest.trades import assemble_trades, assign_trades, OPEN, CLOSED, USER, ASSEMBLED
+
+COLUMNS = ('account_id', 'user_id', 'transaction_id', 'trade_id', 'date', 'order_id', 'position_id', 'symbol',
+           'underlying', 'asset_type', 'transaction', 'quantity', 'expiration_date', 'net_amount')
+
+
+def legs(*rows) -> pd.DataFrame:
+    frame = pd.DataFrame([dict(zip(COLUMNS, (1, 1) + row)) for row in rows], columns=COLUMNS)
+    for name in ('order_id', 'position_id', 'trade_id'):
+        frame[name] = frame[name].astype('Int64')
+    return frame
+
+
+def test_open_stock_keeps_the_trade_open_after_its_calls_expire():
+    trades, _ = assemble_trades(legs(
+        (1, None, '2024-01-02', 100, 10, 'AAPL', '', 'EQUITY', 'BUY', 100, None, -18500.0),
+        (1, None, '2024-01-02', 100, 11, 'AAPL  240119C00190000', 'AAPL', 'CALL', 'SELL', 1, '2024-01-19', 250.0)),
+        as_of=date(2024, 3, 1))
+    assert len(trades) == 1
+    assert trades.loc[0, 'status'] == OPEN
+
+
+def test_a_position_across_expirations_does_not_chain_the_cycles():
+    trades, members = assemble_trades(legs(
+        (1, None, '2024-01-02', 100, 10, 'SPY   240119P00450000', 'SPY', 'PUT', 'SELL', 1, '2024-01-19', 300.0),
+        (2, None, '2024-01-22', 101, 10, 'SPY   240216P00450000', 'SPY', 'PUT', 'SELL', 1, '2024-02-16', 320.0),
+        (3, None, '2024-02-20', 102, 10, 'SPY   240315P00450000', 'SPY', 'PUT', 'SELL', 1, '2024-03-15', 310.0)),
+        as_of=date(2024, 3, 1))
+    assert members.groupby('trade')['transaction_id'].apply(list).tolist() == [[1], [2], [3]]
+    assert trades['status'].tolist() == [CLOSED, CLOSED, OPEN]
+    assert trades['close_date'].tolist()[:2] == [date(2024, 1, 19), date(2024, 2, 16)]
+
+
+def test_trades_created_by_hand_are_left_alone(session, accounts):
+    session.execute(text("insert into trades (trade_id, user_trade_id, strategy_id, user_id, account_id, open_date, close_date, type, "
+                         "status, origin, amount, profit_target, stop_loss_target, starting_margin, ending_margin, max_margin, description) "
+                         "values (1, 1, 1, 1, 1, '2024-01-02', '2024-01-02', 'PUT', 'OPEN', 'USER', 300, 0, 0, 0, 0, 0, 'By hand')"))
+    for transaction_id, trade_id, day, side in ((1, 1, '2024-01-02', 'SELL'), (2, None, '2024-01-10', 'BUY')):
+        session.execute(text("insert into transactions (transaction_id, account_id, trade_id, date, type, status, order_id, position_id, amount) "
+                             "values (:id, 1, :trade_id, :day, 'TRADE', 'VALID', :id, 10, 0)"),
+                        {'id': transaction_id, 'trade_id': trade_id, 'day': day})
+        session.execute(text("insert into transaction_facts (account_id, date, transaction_id, position_id, trade_id, order_id, quantity, "
+                             "symbol, underlying, `transaction`, asset_type, expiration_date) values (1, :day, :id, 10, :trade_id, :id, 1, "
+                             "'SPY   240119P00450000', 'SPY', :side, 'PUT', '2024-01-19')"),
+                        {'id': transaction_id, 'trade_id': trade_id, 'day': day, 'side': side})
+    session.commit()
+
+    counts = assign_trades(session, 1, as_of=date(2024, 3, 1))
+    assert counts == {'transactions': 1, 'created': 1, 'updated': 0, 'removed': 0}
+    trades = session.execute(text('select trade_id, origin, status from trades order by trade_id')).all()
+    assert trades == [(1, USER, OPEN), (2, ASSEMBLED, CLOSED)]
+    assigned = session.execute(text('select transaction_id, trade_id from transactions order by transaction_id')).all()
+    assert assigned == [(1, 1), (2, 2)]
+
+
+def test_transactions_of_a_user_trade_are_kept_when_their_facts_lag(session, accounts):
+    session.execute(text("insert into trades (trade_id, user_trade_id, strategy_id, user_id, account_id, open_date, close_date, type, "
+                         "status, origin, amount, profit_target, stop_loss_target, starting_margin, ending_margin, max_margin, description) "
+                         "values (1, 1, 1, 1, 1, '2024-01-02', '2024-01-02', 'PUT', 'OPEN', 'USER', 300, 0, 0, 0, 0, 0, 'By hand')"))
+    # Tied to the trade by hand after its facts were written, the facts row still has no trade
+    session.execute(text("insert into transactions (transaction_id, account_id, trade_id, date, type, status, order_id, position_id, amount) "
+                         "values (1, 1, 1, '2024-01-02', 'TRADE', 'VALID', 1, 10, 300)"))
+    session.execute(text("insert into transaction_facts (account_id, date, transaction_id, position_id, order_id, quantity, symbol, "
+                         "underlying, `transaction`, asset_type, expiration_date) values (1, '2024-01-02', 1, 10, 1, 1, "
+                         "'SPY   240119P00450000', 'SPY', 'SELL', 'PUT', '2024-01-19')"))
+    session.commit()
+
+    assert assign_trades(session, 1, as_of=date(2024, 3, 1)) == {'transactions': 0, 'created': 0, 'updated': 0, 'removed': 0}
+    assert session.execute(text('select trade_id from transactions')).scalar() == 1
+    assert session.execute(text('select count(*) from trades')).scalar() == 1
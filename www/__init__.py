@@ -6,17 +6,27 @@ from flask_sqlalchemy import SQLAlchemy
 # Add the lib directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'lib')))
 
-from lib.orm.database import Database  # Import after adding lib to path
+from orm.database import Database  # Import after adding lib to path
 
-db = SQLAlchemy()
+class DatabaseSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy bound to the engine of the app's Database instead of a second engine and pool
+    """
+    def _make_engine(self, bind_key, options, app):
+        if bind_key is None and 'database' in app.extensions:
+            return app.extensions['database'].engine
+        return super()._make_engine(bind_key, options, app)
+
+db = DatabaseSQLAlchemy()
 
 def create_app():
     app = Flask(__name__)
     
     # Initialize the Database
     db_instance = Database()
+    app.extensions['database'] = db_instance
     
-    # Configure SQLAlchemy to use the engine from db_instance
+    # Configure SQLAlchemy to use the engine from db_instance, see DatabaseSQLAlchemy
     app.config['SQLALCHEMY_DATABASE_URI'] = str(db_instance.engine.url)
     db.init_app(app)
     
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import tempfile
+from datetime import timedelta
+from functools import wraps
+
+from flask import request, jsonify, make_response
+
+from ingest.security_cache import TTLCache
+from ingest.generations import ALL, GLOBAL, account_tag, get_generations
+
+DEFAULT_MAXSIZE = 256
+DEFAULT_TTL = timedelta(hours=1)
+# Remove expired disk entries every this many writes
+PRUNE_INTERVAL = 100
+
+
+class DiskCache:
+    """
+    Pickled entries in a directory, shared by every worker process on the host.
+    Writes go through a temporary file and an atomic rename.
+    """
+    def __init__(self, directory: str, ttl: timedelta = DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl.total_seconds():
+                return None
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, key: str, value):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path(key))
+        self._writes += 1
+        if self._writes % PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def prune(self):
+        cutoff = time.time() - self.ttl.total_seconds()
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+
+class ResponseCache:
+    """
+    Cache of JSON endpoint payloads keyed by endpoint, parameters and the cache
+    generations of the accounts they cover, so an ingest commit invalidates them
+    without any explicit purge. The key doubles as the ETag and a matching
+    If-None-Match is answered with 304 before the view runs.
+    Entries live in an in-process LRU and, when directory is set, on disk for other workers.
+    Nothing but the generations invalidates an entry before its ttl: every route or command that
+    writes data a cached response reads must call bump_generation for the account it changed,
+    in the same transaction, or the old payload is served until the ttl runs out.
+    """
+    def __init__(self, get_session, maxsize: int = DEFAULT_MAXSIZE, ttl: timedelta = DEFAULT_TTL, directory: str = None):
+        self.get_session = get_session
+        self.memory = TTLCache(maxsize, ttl)
+        self.disk = DiskCache(directory, ttl) if directory else None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: str):
+        payload = self.memory.get(key)
+        if payload is None and self.disk is not None:
+            payload = self.disk.get(key)
+            if payload is not None:
+                self.memory.set(key, payload)
+        return payload
+
+    def set(self, key: str, payload):
+        self.memory.set(key, payload)
+        if self.disk is not None:
+            self.disk.set(key, payload)
+
+    def key(self, account_arg: str = None, ignore_args: tuple = (), tags: tuple = ()) -> str:
+        account_ids = sorted(set(request.args.getlist(account_arg, type=int))) if account_arg else []
+        tags = [account_tag(account_id) for account_id in account_ids] + [GLOBAL] if account_ids else [ALL, *tags]
+        generations = get_generations(self.get_session(), tags)
+        args = sorted((name, value) for name, value in request.args.items(multi=True) if name not in ignore_args)
+        raw = json.dumps([request.endpoint, request.view_args, args, generations], default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()[:40]
+
+    def cached(self, account_arg: str = 'account_id', echo_args: tuple = (), ignore_args: tuple = ('_',), tags: tuple = ()):
+        """
+        Decorate a view returning a JSON payload (dict or list).
+        account_arg names the query parameter holding the account ids the response
+        is limited to, responses without it depend on every account.
+        echo_args are left out of the key and copied into the payload on the way out,
+        like the DataTables draw counter, such responses are never answered with 304.
+        ignore_args are left out of the key, by default jQuery's cache buster.
+        tags are cross-account generations the response also depends on, like POSITIONS.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = self.key(account_arg, echo_args + ignore_args, tags)
+                echoed = {name: request.args.get(name, type=int) for name in echo_args if name in request.args}
+                if not echoed and key in request.if_none_match:
+                    self.not_modified += 1
+                    response = make_response('', 304)
+                    response.set_etag(key)
+                    return response
+
+                payload = self.get(key)
+                if payload is None:
+                    self.misses += 1
+                    payload = view(*args, **kwargs)
+                    self.set(key, payload)
+                else:
+                    self.hits += 1
+
+                response = jsonify(dict(payload, **echoed) if echoed else payload)
+                if not echoed:
+                    response.set_etag(key)
+                    # Revalidate every time, the ETag makes that a cheap 304
+                    response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified, 'entries': len(self.memory)}
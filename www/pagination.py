@@ -0,0 +1,109 @@
+import re
+import json
+import base64
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_, Date, DateTime, String, Text
+
+DEFAULT_PAGE_LENGTH = 25
+MAX_PAGE_LENGTH = 1000
+# Pages follow the cursor of the page before, skipping rows by start has to be asked for with paging=offset
+KEYSET = 'keyset'
+OFFSET = 'offset'
+
+COLUMN_DATA = re.compile(r'columns\[(\d+)\]\[data\]')
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and values else None
+
+
+def parse_request(args, columns: dict) -> dict:
+    """
+    Read DataTables server-side parameters, plus the plain sort, dir, after, paging and
+    <column>=value parameters for other clients, restricted to the whitelisted columns.
+    """
+    length = args.get('length', DEFAULT_PAGE_LENGTH, type=int)
+    if length < 0:  # DataTables sends -1 for "All"
+        length = MAX_PAGE_LENGTH
+
+    sort = args.get('sort')
+    direction = args.get('dir', 'desc')
+    order_column = args.get('order[0][column]', type=int)
+    if order_column is not None:
+        sort = args.get(f'columns[{order_column}][data]')
+        direction = args.get('order[0][dir]', 'desc')
+
+    filters = {}
+    for key in args:
+        match = COLUMN_DATA.fullmatch(key)
+        if match is None:
+            continue
+        name = args[key]
+        value = args.get(f'columns[{match.group(1)}][search][value]', '').strip()
+        if name in columns and value:
+            filters[name] = value
+    filters.update({name: args[name] for name in columns if args.get(name)})
+
+    return {'draw': args.get('draw', 0, type=int),
+            'start': max(args.get('start', 0, type=int), 0),
+            'length': min(max(length, 1), MAX_PAGE_LENGTH),
+            'sort': sort if sort in columns else None,
+            'descending': direction != 'asc',
+            'search': args.get('search[value]', args.get('search', '')).strip(),
+            'filters': filters,
+            'after': decode_cursor(args['after']) if args.get('after') else None,
+            'paging': OFFSET if args.get('paging') == OFFSET else KEYSET}
+
+
+def _value(column, value: str):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Date):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def filter_clause(columns: dict, filters: dict, search: str = '', search_columns: tuple = ()):
+    """
+    AND of the column filters, text columns match on prefix so their indexes can be used,
+    and the global search as a prefix match over search_columns
+    """
+    clauses = []
+    for name, value in filters.items():
+        column = columns[name]
+        if isinstance(column.type, (String, Text)):
+            clauses.append(column.like(value.replace('%', r'\%').replace('_', r'\_') + '%'))
+        else:
+            try:
+                clauses.append(column == _value(column, value))
+            except ValueError:
+                continue
+    if search:
+        prefix = search.replace('%', r'\%').replace('_', r'\_') + '%'
+        clauses.append(or_(*(columns[name].like(prefix) for name in search_columns)))
+    return and_(*clauses) if clauses else None
+
+
+def keyset_clause(columns: list, after: list, descending: bool):
+    """
+    Rows after the cursor in the order of columns, the cursor holding the values of the last row
+    in the same order. Raises ValueError when the cursor does not match the columns.
+    """
+    if len(after) != len(columns):
+        raise ValueError(f'Cursor has {len(after)} values for {len(columns)} columns')
+    values = [_value(column, value) if isinstance(value, str) else value for column, value in zip(columns, after)]
+    # (a, b, c) > (x, y, z) expanded into nested or/and from the last column
+    clause = None
+    for column, value in reversed(list(zip(columns, values))):
+        beyond = column < value if descending else column > value
+        clause = beyond if clause is None else or_(beyond, and_(column == value, clause))
+    return clause
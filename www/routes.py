@@ -0,0 +1,244 @@
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+from flask import current_app as app, request, abort
+from sqlalchemy import select, update, func, case, true
+
+from . import db
+from .cache import ResponseCache, DEFAULT_MAXSIZE
+from .pagination import parse_request, filter_clause, keyset_clause, encode_cursor, OFFSET
+from orm.models import Account, Trade, Transaction, TransactionFact, Position, LatestPosition
+from analytics.payoff import OPTION_MULTIPLIER, legs_from_positions, payoff_at_expiry, payoff_curves, price_grid, DEFAULT_VOL
+from ingest.trading_days import trader_status
+from ingest.trades import assign_trades
+from ingest.generations import bump_generation, POSITIONS
+from ingest.streaming import MarkCache, OPTION_ASSET_TYPES, DEFAULT_MARK_CACHE_PATH
+from analytics.reports import ReportEngine, REPORTS, DEFAULT_CACHE_DIR, to_records
+from orm.backends import duckdb_source
+
+report_engine = ReportEngine(lambda: db.session, os.getenv('report_cache_dir', DEFAULT_CACHE_DIR), duckdb_source())
+
+# JSON responses are cached until an ingest bumps the generation of an account they cover
+response_cache = ResponseCache(lambda: db.session,
+                               maxsize=int(os.getenv('response_cache_size', DEFAULT_MAXSIZE)),
+                               ttl=timedelta(minutes=float(os.getenv('response_cache_ttl_minutes', 60))),
+                               directory=os.getenv('response_cache_dir') or None)
+
+# Marks published by theta_burn.py stream-quotes, reloaded when the file changes
+mark_cache = MarkCache(os.getenv('mark_cache_path', DEFAULT_MARK_CACHE_PATH))
+
+# Columns of the unassigned transactions table that can be sorted and filtered
+UNASSIGNED_COLUMNS = {name: getattr(TransactionFact, name)
+                      for name in ('transaction_id', 'date', 'order_id', 'description', 'quantity', 'symbol', 'underlying',
+                                   'commission', 'fees', 'transaction', 'asset_type', 'expiration_date', 'strike_price',
+                                   'extended_amount')}
+# Sorts on NOT NULL columns page by keyset, pages of the others past the first need paging=offset.
+# transaction_id and item_id break ties so rows of the same date keep one order across pages.
+KEYSET_SORTS = ('date', 'transaction_id')
+TIE_BREAKERS = ('transaction_id', 'item_id')
+SEARCH_COLUMNS = ('symbol', 'underlying', 'description')
+
+
+def to_json(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+@app.route('/api/payoff', methods=['GET'])
+@response_cache.cached(tags=(POSITIONS,))
+def payoff():
+    """
+    Payoff curves of the open option structures in the latest positions.
+    Query parameters: underlying (repeatable, default SPX and SPXW), account_id,
+    points, days (comma separated days from today) and vol.
+    """
+    underlyings = request.args.getlist('underlying') or ['SPX', 'SPXW']
+    account_ids = request.args.getlist('account_id', type=int) or None
+    points = request.args.get('points', 200, type=int)
+    days = [int(day) for day in request.args.get('days', '0').split(',')]
+    vol = request.args.get('vol', DEFAULT_VOL, type=float)
+
+    legs = legs_from_positions(db.session, underlyings, account_ids)
+    if len(legs) == 0:
+        return {'prices': [], 'days': days, 'structures': []}
+
+    prices = price_grid(legs, points)
+    expiry = payoff_at_expiry(legs, prices)
+    curves = payoff_curves(legs, prices, days, vol=vol)
+    structures = [{'account_id': account_id,
+                   'underlying': underlying,
+                   'expiration_date': expiration_date.isoformat(),
+                   'expiry': expiry[i].round(2).tolist(),
+                   'curves': curves[i].round(2).tolist()}
+                  for i, (account_id, underlying, expiration_date) in enumerate(legs.keys)]
+    return {'prices': prices.round(2).tolist(), 'days': days, 'structures': structures}
+
+
+@app.route('/api/reports', methods=['GET'])
+@app.route('/api/reports/<name>', methods=['GET'])
+@response_cache.cached(account_arg=None)
+def reports(name=None):
+    """
+    Registered reports computed from the cached fact frame.
+    Query parameters: year (repeatable) and refresh.
+    """
+    if name is not None and name not in REPORTS:
+        abort(404)
+    years = request.args.getlist('year', type=int) or None
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+    results = report_engine.run([name] if name else None, refresh=refresh, years=years)
+    return {report_name: to_records(frame) for report_name, frame in results.items()}
+
+
+@app.route('/api/trader_status', methods=['GET'])
+@response_cache.cached(account_arg=None)
+def get_trader_status():
+    """
+    Trading ratios per account from the trading_day_stats counters.
+    Query parameters: year and all_accounts.
+    """
+    year = request.args.get('year', type=int)
+    all_accounts = request.args.get('all_accounts', 'false').lower() == 'true'
+    return trader_status(db.session, year, account_types=None if all_accounts else ('TAXABLE',))
+
+
+@app.route('/api/accounts', methods=['GET'])
+@response_cache.cached(account_arg=None)
+def accounts():
+    return [{'account_id': account.account_id, 'name': account.name}
+            for account in db.session.query(Account).order_by(Account.name)]
+
+
+@app.route('/api/unassigned_transactions', methods=['GET'])
+@response_cache.cached(echo_args=('draw',))
+def unassigned_transactions():
+    """
+    Server-side processing for the unassigned transactions DataTable, read from transaction_facts.
+    Accepts the DataTables parameters (draw, start, length, order, search and column searches)
+    plus account_id, sort, dir, after, paging and <column>=value. Pages are read by keyset on
+    (date, transaction_id) by default: when sorted by date or transaction_id the response carries
+    a next cursor to pass back as after. start only skips rows with paging=offset.
+    """
+    params = parse_request(request.args, UNASSIGNED_COLUMNS)
+    base = [TransactionFact.trade_id.is_(None)]
+    account_id = request.args.get('account_id', type=int)
+    if account_id:
+        base.append(TransactionFact.account_id == account_id)
+    filters = filter_clause(UNASSIGNED_COLUMNS, params['filters'], params['search'], SEARCH_COLUMNS)
+
+    # Unfiltered count, filtered count and filtered total in one aggregate query
+    matched = filters if filters is not None else true()
+    records_total, records_filtered, total_extended_amount = db.session.execute(
+        select(func.count(),
+               func.sum(case((matched, 1), else_=0)),
+               func.sum(case((matched, TransactionFact.extended_amount), else_=0)))
+        .where(*base)).one()
+
+    sort = params['sort'] or 'date'
+    keys = [sort] + [name for name in TIE_BREAKERS if name != sort]
+    key_columns = [getattr(TransactionFact, name) for name in keys]
+    order = [column.desc() if params['descending'] else column.asc() for column in key_columns]
+
+    query = select(TransactionFact).where(*base)
+    if filters is not None:
+        query = query.where(filters)
+    keyset = sort in KEYSET_SORTS and params['paging'] != OFFSET
+    if params['paging'] == OFFSET:
+        query = query.offset(params['start'])
+    elif params['after']:
+        if not keyset:
+            abort(400, f'after pages only a sort on {" or ".join(KEYSET_SORTS)}, use paging=offset')
+        try:
+            query = query.where(keyset_clause(key_columns, params['after'], params['descending']))
+        except ValueError:
+            abort(400, 'after is not a cursor of this sort')
+    elif params['start']:
+        abort(400, 'Pass the next cursor of the previous page as after, or paging=offset to skip rows by start')
+    rows = db.session.execute(query.order_by(*order).limit(params['length'])).scalars().all()
+
+    data = [dict({name: to_json(value) for name, value in row.to_dict().items()}, select='<input type="checkbox">')
+            for row in rows]
+    next_cursor = None
+    if keyset and len(rows) == params['length']:
+        next_cursor = encode_cursor([to_json(getattr(rows[-1], name)) for name in keys])
+    return {'draw': params['draw'],
+            'recordsTotal': records_total,
+            'recordsFiltered': int(records_filtered or 0),
+            'totalExtendedAmount': round(float(total_extended_amount or 0), 2),
+            'data': data,
+            'next': next_cursor}
+
+
+@app.route('/api/assign_trades', methods=['POST'])
+def auto_assign_trades():
+    """
+    Assemble the unassigned transactions into trades.
+    JSON body: strategy_id and optionally account_ids.
+    """
+    body = request.get_json(silent=True) or {}
+    strategy_id = body.get('strategy_id')
+    if strategy_id is None:
+        abort(400, 'strategy_id is required')
+    return assign_trades(db.session, int(strategy_id), body.get('account_ids'))
+
+
+@app.route('/api/assign_transactions/<int:trade_id>', methods=['POST'])
+def assign_transactions(trade_id):
+    """
+    Assign transactions of the trade's account to a trade by hand.
+    JSON body: transaction_ids.
+    """
+    trade = db.session.get(Trade, trade_id)
+    if trade is None:
+        abort(404)
+    transaction_ids = (request.get_json(silent=True) or {}).get('transaction_ids')
+    if not transaction_ids:
+        abort(400, 'transaction_ids is required')
+    assigned = db.session.execute(update(Transaction)
+                                  .where(Transaction.account_id == trade.account_id,
+                                         Transaction.transaction_id.in_([int(transaction_id) for transaction_id in transaction_ids]))
+                                  .values(trade_id=trade_id)).rowcount
+    # Cached transaction responses are only invalidated by the generation
+    bump_generation(db.session, trade.account_id)
+    db.session.commit()
+    return {'trade_id': trade_id, 'assigned': assigned}
+
+
+@app.route('/api/marks', methods=['GET'])
+def live_marks():
+    """
+    Latest positions valued at the streamed marks, not cached since marks change by the second.
+    Query parameters: account_id (repeatable).
+    """
+    snapshot = mark_cache.snapshot()
+    query = (db.session.query(Position)
+             .join(LatestPosition, LatestPosition.snapshot_id == Position.snapshot_id))
+    account_ids = request.args.getlist('account_id', type=int)
+    if account_ids:
+        query = query.filter(Position.account_id.in_(account_ids))
+
+    positions = []
+    for position in query.order_by(Position.account_id, Position.symbol):
+        quantity = float((position.long_quantity or 0) - (position.short_quantity or 0))
+        mark = snapshot['marks'].get(position.symbol)
+        multiplier = OPTION_MULTIPLIER if position.asset_type in OPTION_ASSET_TYPES else 1
+        positions.append({'account_id': position.account_id,
+                          'symbol': position.symbol,
+                          'asset_type': position.asset_type,
+                          'quantity': quantity,
+                          'mark': mark,
+                          'market_value': to_json(position.market_value),
+                          'live_market_value': round(quantity * mark * multiplier, 2) if mark is not None else None})
+    return {'as_of': snapshot['as_of'], 'positions': positions}
+
+
+@app.route('/api/metrics/pool', methods=['GET'])
+def pool_metrics():
+    """
+    Connection pool checkout wait times and saturation, not cached
+    """
+    return app.extensions['database'].pool_stats()